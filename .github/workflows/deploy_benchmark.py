@@ -0,0 +1,187 @@
+"""
+部署脚本基准测试：在本地模拟主机上运行 deploy 命令（镜像取自发布清单或 --image，或以 --fanout 点对点分发），
+报告端到端耗时、每个容器的停机时间和 SSH 往返次数，并可设置阈值防止性能回退。
+
+Deploy benchmark: runs the deploy command (image from the release manifest, from --image, or fanned
+out peer to peer with --fanout) against local fake hosts and reports end-to-end time, per-container
+downtime and SSH round trips, with optional thresholds that fail the run on a regression.
+
+用法 / Usage:
+    python deploy_benchmark.py --hosts 3 --containers 2 --rtt 0.05
+    python deploy_benchmark.py --json --max-seconds 10 --max-round-trips 60
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fake_host import FakeDockerHost, Latency, fake_connect
+
+BENCH_IMAGE = "happyclo/librechat:bench"
+
+
+class _ManifestHandler(BaseHTTPRequestHandler):
+    """
+    模拟发布清单 API。
+    Stand-in for the release manifest API.
+    """
+
+    def do_GET(self):
+        body = json.dumps({"image_name": BENCH_IMAGE}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def configure_environment(host_names, container_names, manifest_url, cache_dir):
+    """
+    在导入部署模块之前设置它们读取的环境变量。
+    Set the environment the deploy modules read, before they are imported.
+    """
+    os.environ.update(
+        {
+            "SERVER_ADDRESS": "&".join(host_names),
+            "USERNAME": "bench",
+            "PRIVATE_KEY": "unused",
+            "CONTAINER_NAMES": "&".join(container_names),
+            "RELEASE_API_URL": manifest_url,
+            "RELEASE_CACHE_DIR": cache_dir,
+            "RESOLVE_IMAGE_DIGEST": "false",
+            "DEPLOY_METRICS_DIR": "",
+        }
+    )
+
+
+def run_once(argv, host_count, container_names, latency):
+    """
+    在新建的模拟主机上运行一次部署命令。
+    Run the deploy command once against freshly created fake hosts.
+
+    :param argv: 命令行参数 / Command line arguments
+    :param host_count: 主机数量 / Number of hosts
+    :param container_names: 容器名称列表 / List of container names
+    :param latency: Latency 对象 / Latency object
+    :return: 结果字典 / Result dictionary
+    """
+    from librechat_deploy import cli, timing
+
+    timing.RECORDER.reset()
+    hosts = {
+        f"bench-{index}": FakeDockerHost(f"bench-{index}", container_names, latency=latency)
+        for index in range(host_count)
+    }
+    started = time.monotonic()
+    results = cli.run(argv, connect=fake_connect(hosts))
+    elapsed = time.monotonic() - started
+
+    downtime = {
+        f"{name}/{service}": round(seconds, 3)
+        for name, host in hosts.items()
+        for service, seconds in host.downtime.items()
+        if service in container_names
+    }
+    return {
+        "seconds": round(elapsed, 3),
+        "ok": bool(results) and all(result.ok for result in results),
+        "round_trips": sum(host.round_trips for host in hosts.values()),
+        "round_trips_per_host": max(host.round_trips for host in hosts.values()),
+        "pulls": sum(host.pulls for host in hosts.values()),
+        "downtime": downtime,
+        "max_downtime": max(downtime.values(), default=0.0),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the deploy scripts against fake hosts.")
+    parser.add_argument("--hosts", type=int, default=3, help="number of fake hosts")
+    parser.add_argument("--containers", type=int, default=2, help="containers per host")
+    parser.add_argument("--rtt", type=float, default=0.02, help="seconds per SSH round trip")
+    parser.add_argument("--pull", type=float, default=0.5, help="seconds per docker pull")
+    parser.add_argument("--run", type=float, default=0.2, help="seconds per docker run")
+    parser.add_argument("--remove", type=float, default=0.1, help="seconds per docker rm")
+    parser.add_argument("--ready", type=float, default=0.3, help="seconds until a container runs")
+    parser.add_argument("--health", type=float, default=0.0, help="seconds from running to healthy")
+    parser.add_argument(
+        "--script",
+        choices=("manifest", "image", "fanout", "all"),
+        default="all",
+        help="take the image from the release manifest, from --image, fan it out with --fanout, or run all",
+    )
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--max-seconds", type=float, help="fail if a run takes longer")
+    parser.add_argument("--max-round-trips", type=int, help="fail if a host needs more round trips")
+    parser.add_argument("--max-downtime", type=float, help="fail if any container is down longer")
+    args = parser.parse_args(argv)
+
+    container_names = [f"app{index}" for index in range(args.containers)]
+    host_names = [f"bench-{index}" for index in range(args.hosts)]
+    latency = Latency(args.rtt, args.pull, args.run, args.remove, args.ready, args.health)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ManifestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            configure_environment(
+                host_names,
+                container_names,
+                f"http://127.0.0.1:{server.server_port}/lc",
+                cache_dir,
+            )
+            if not args.json:
+                logging.basicConfig(level=logging.WARNING)
+            entry_points = {
+                "manifest": ["deploy"],
+                "image": ["deploy", "--image", BENCH_IMAGE],
+                "fanout": ["deploy", "--image", BENCH_IMAGE, "--fanout"],
+            }
+            names = list(entry_points) if args.script == "all" else [args.script]
+            report = {
+                "hosts": args.hosts,
+                "containers": args.containers,
+                "latency": vars(latency),
+                "runs": {name: run_once(entry_points[name], args.hosts, container_names, latency) for name in names},
+            }
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    failures = []
+    for name, run in report["runs"].items():
+        if not run["ok"]:
+            failures.append(f"{name}: deploy reported a failure")
+        if args.max_seconds is not None and run["seconds"] > args.max_seconds:
+            failures.append(f"{name}: {run['seconds']}s > {args.max_seconds}s")
+        if args.max_round_trips is not None and run["round_trips_per_host"] > args.max_round_trips:
+            failures.append(f"{name}: {run['round_trips_per_host']} round trips > {args.max_round_trips}")
+        if args.max_downtime is not None and run["max_downtime"] > args.max_downtime:
+            failures.append(f"{name}: {run['max_downtime']}s downtime > {args.max_downtime}s")
+    report["failures"] = failures
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.hosts} hosts x {args.containers} containers, rtt {args.rtt}s")
+        print(f"{'script':<10}{'seconds':>10}{'trips/host':>12}{'pulls':>8}{'max down':>10}")
+        for name, run in report["runs"].items():
+            print(
+                f"{name:<10}{run['seconds']:>10.3f}{run['round_trips_per_host']:>12}"
+                f"{run['pulls']:>8}{run['max_downtime']:>10.3f}"
+            )
+        for failure in failures:
+            print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,742 @@
+import io
+import json
+import base64
+import time
+import shlex
+import hashlib
+import tarfile
+import threading
+from types import SimpleNamespace
+from dataclasses import dataclass
+
+
+LAYER_SIZE = 1 << 20  # docker save 输出中每层的大小 / Size of each layer in the docker save output
+
+
+@dataclass
+class Latency:
+    """
+    模拟主机的延迟配置（秒）。
+    Latency settings (seconds) of the fake host.
+    """
+
+    rtt: float = 0.02  # 每次 exec_command / SFTP 操作的往返时间 / Round trip per exec_command / SFTP operation
+    pull: float = 0.5  # docker pull
+    run: float = 0.2  # docker run
+    remove: float = 0.1  # docker rm
+    ready: float = 0.3  # 容器从启动到 running / From start until the container is running
+    health: float = 0.0  # running 之后到 healthy，0 表示无健康检查 / From running to healthy, 0 means no health check
+    load: float = 0.1  # docker load
+
+
+class FakeChannel:
+    """
+    模拟 paramiko Channel：输出在命令完成时一次性可读。
+    Mimics a paramiko Channel: the output is readable at once when the command completes.
+    """
+
+    def __init__(self, stdout, stderr, status):
+        self._stdout = stdout
+        self._stderr = stderr
+        self._status = status
+        self.closed = False
+
+    def recv_ready(self):
+        return bool(self._stdout)
+
+    def recv_stderr_ready(self):
+        return bool(self._stderr)
+
+    def recv(self, size):
+        data, self._stdout = self._stdout[:size], self._stdout[size:]
+        return data
+
+    def recv_stderr(self, size):
+        data, self._stderr = self._stderr[:size], self._stderr[size:]
+        return data
+
+    def exit_status_ready(self):
+        return True
+
+    def recv_exit_status(self):
+        return self._status
+
+    def settimeout(self, timeout):
+        pass
+
+    def shutdown_write(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class _StdinChannel(FakeChannel):
+    """
+    读取标准输入的命令（docker load）：数据在 shutdown_write() 时交给命令处理。
+    Command that reads its standard input (docker load): the data is handed over on shutdown_write().
+    """
+
+    def __init__(self, run):
+        super().__init__(b"", b"", None)
+        self._run = run
+        self._stdin = io.BytesIO()
+
+    def sendall(self, data):
+        self._stdin.write(data)
+
+    def shutdown_write(self):
+        status, out, err = self._run(self._stdin.getvalue())
+        self._stdout, self._stderr, self._status = out.encode(), err.encode(), status
+
+    def exit_status_ready(self):
+        return self._status is not None
+
+
+class FakeFile:
+    """
+    模拟 exec_command 返回的 stdout / stderr 文件对象。
+    Mimics the stdout / stderr file objects returned by exec_command.
+    """
+
+    def __init__(self, channel, stderr=False):
+        self.channel = channel
+        self._stderr = stderr
+
+    def read(self, size=-1):
+        receive = self.channel.recv_stderr if self._stderr else self.channel.recv
+        return receive(1 << 62 if size is None or size < 0 else size)
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+class _FakeSFTP:
+    def __init__(self, host):
+        self._host = host
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def file(self, path, mode="r"):
+        host = self._host
+        host._round_trip()
+        if "r" in mode:
+            if path not in host.files:
+                raise FileNotFoundError(path)
+            return io.BytesIO(host.files[path])
+
+        class _Writer(io.BytesIO):
+            def close(inner):
+                host.files[path] = inner.getvalue()
+                super().close()
+
+            def write(inner, data):
+                return super().write(data.encode() if isinstance(data, str) else data)
+
+            def set_pipelined(inner, pipelined=True):
+                pass
+
+        return _Writer()
+
+    open = file
+
+    def stat(self, path):
+        self._host._round_trip()
+        if path not in self._host.files:
+            raise FileNotFoundError(path)
+        return SimpleNamespace(
+            st_size=len(self._host.files[path]), st_mode=self._host.modes.get(path, 0o100644)
+        )
+
+    def chmod(self, path, mode):
+        self._host._round_trip()
+        self._host.modes[path] = 0o100000 | mode
+
+    def posix_rename(self, old_path, new_path):
+        self._host._round_trip()
+        self._host.files[new_path] = self._host.files.pop(old_path)
+        self._host.modes[new_path] = self._host.modes.pop(old_path, 0o100644)
+
+    def remove(self, path):
+        self._host._round_trip()
+        self._host.files.pop(path, None)
+
+    def close(self):
+        pass
+
+
+class FakeDockerHost:
+    """
+    模拟一台可以通过 SSH 执行 docker 命令的主机，可替代 remote_login() 返回的 SSHClient。
+    支持 docker ps / inspect / image inspect / pull / tag / run / rm / rename / network / image prune / save / load，
+    以及 run_batch() 生成的批处理脚本，并统计往返次数与每个服务的停机时间。
+
+    Fake host that runs docker commands over "SSH", a drop-in for the SSHClient returned by
+    remote_login(). Supports docker ps / inspect / image inspect / pull / tag / run / rm / rename /
+    network / image prune / save / load and the batch scripts produced by run_batch(), and counts round trips
+    and per-service downtime.
+    """
+
+    def __init__(self, name="fake", container_names=(), image="happyclo/librechat:old", latency=None):
+        """
+        :param name: 主机名 / Host name
+        :param container_names: 初始运行的容器 / Containers running initially
+        :param image: 初始容器使用的镜像 / Image of the initial containers
+        :param latency: Latency 对象 / Latency object
+        """
+        self.name = name
+        self.latency = latency or Latency()
+        self.round_trips = 0
+        self.commands = []
+        self.files = {}
+        self.modes = {}  # SFTP 文件权限 / SFTP file modes
+        self.images = {}
+        self.containers = {}
+        self.downtime = {}
+        self.pulls = 0
+        self.disk_size = 100_000_000  # df 报告的磁盘大小（KiB）/ Disk size reported by df, in KiB
+        self.healthy = True  # curl / wget 健康检查探测是否成功 / Whether curl / wget health probes succeed
+        # 在本机执行模拟主机无法模拟的脚本（金丝雀探测）的函数，如 canary.local_run；为 None 时这些脚本失败
+        # Function running the scripts the fake host cannot emulate (the canary probe) locally, e.g.
+        # canary.local_run; when None those scripts fail
+        self.run_local = None
+        self._created = 0
+        self._down_since = {}
+        self._lock = threading.RLock()
+        self._add_image(image)
+        for container_name in container_names:
+            self._create(container_name, image, [f"SERVICE={container_name}"], started=-1e9)
+
+    # --- SSHClient 接口 / SSHClient interface ---
+
+    def exec_command(self, command, **kwargs):
+        self._round_trip()
+        if command == "docker load":
+            channel = _StdinChannel(self._docker_load)
+            return FakeFile(channel), FakeFile(channel), FakeFile(channel, stderr=True)
+        if "__run()" in command:
+            status, out, err = self._exec_batch(command)
+        else:
+            status, out, err = self._exec_chain(command)
+        # docker save 输出二进制 / docker save outputs binary data
+        channel = FakeChannel(out if isinstance(out, bytes) else out.encode(), err.encode(), status)
+        return FakeFile(channel), FakeFile(channel), FakeFile(channel, stderr=True)
+
+    def open_sftp(self):
+        self._round_trip()
+        return _FakeSFTP(self)
+
+    def close(self):
+        pass
+
+    # --- 内部实现 / Internals ---
+
+    def _exec_chain(self, command):
+        """
+        依次执行以 && 连接的命令，遇到失败即停止。
+        Run commands joined with && in order, stopping at the first failure.
+        """
+        if " && " not in command:
+            return self._exec(command)
+        status, outputs, errors = 0, [], []
+        for part in command.split(" && "):
+            status, out, err = self._exec(part)
+            outputs.append(out)
+            errors.append(err)
+            if status != 0:
+                break
+        return status, "".join(outputs), "".join(errors)
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        time.sleep(self.latency.rtt)
+
+    def _add_image(self, reference, digest=None):
+        digest = digest or "sha256:" + hashlib.sha256(reference.encode()).hexdigest()
+        image_id = "sha256:" + hashlib.sha256(digest.encode()).hexdigest()
+        repository = reference.partition("@")[0]
+        if ":" in repository.rpartition("/")[2]:
+            repository = repository.rpartition(":")[0]
+        self._created += 1
+        self.images[reference] = {
+            "Id": image_id,
+            "RepoTags": [reference] if "@" not in reference else [],
+            "RepoDigests": [f"{repository}@{digest}"],
+            "Created": f"2024-01-01T00:00:{self._created:02d}Z",
+            "Size": 500_000_000,
+            # 共享的基础层加上镜像自己的层 / Shared base layers plus one of its own
+            "RootFS": {"Layers": ["sha256:base-os", "sha256:base-node", "sha256:" + digest[-12:]]},
+        }
+        return self.images[reference]
+
+    def _create(self, container_name, image, env, started=None, ports=None, networks=None, labels=None):
+        started = time.monotonic() if started is None else started
+        image_info = self._image(image)
+        self.containers[container_name] = {
+            "Id": hashlib.sha256(f"{container_name}{started}".encode()).hexdigest(),
+            "Name": f"/{container_name}",
+            "Image": image_info["Id"],
+            "Config": {"Image": image, "Env": env, "Labels": labels or {}, "ExposedPorts": {}},
+            "HostConfig": {
+                "PortBindings": ports or {},
+                "RestartPolicy": {"Name": "always", "MaximumRetryCount": 0},
+            },
+            "NetworkSettings": {
+                "Networks": {network: {"Aliases": []} for network in networks or ["bridge"]},
+                "Ports": ports or {},
+            },
+            "_started": started,
+        }
+        self._mark_up(container_name, started + self.latency.ready)
+
+    def _state(self, info):
+        elapsed = time.monotonic() - info["_started"]
+        if elapsed < self.latency.ready:
+            return "created", ""
+        if not self.latency.health:
+            return "running", ""
+        return "running", "healthy" if elapsed >= self.latency.ready + self.latency.health else "starting"
+
+    def _public(self, info):
+        status, health = self._state(info)
+        info = {key: value for key, value in info.items() if not key.startswith("_")}
+        info["State"] = {"Status": status}
+        if health:
+            info["State"]["Health"] = {"Status": health}
+        return info
+
+    def _mark_down(self, service):
+        self._down_since.setdefault(service, time.monotonic())
+
+    def _mark_up(self, service, at):
+        since = self._down_since.pop(service, None)
+        if since is not None:
+            self.downtime[service] = self.downtime.get(service, 0.0) + max(0.0, at - since)
+
+    def _exec_batch(self, script):
+        token = script.split("\n", 1)[0].partition("=")[2]
+        output = []
+        for line in script.splitlines():
+            if not line.startswith("__run "):
+                continue
+            parts = shlex.split(line)
+            index, command = parts[1], parts[2]
+            status, out, err = self._exec(command)
+            output.append(
+                f"{token} {index} out\n{out}\n{token} {index} err\n{err}\n{token} {index} rc {status}\n"
+            )
+            if status and "|| exit 0" in line:
+                break
+        return 0, "".join(output), ""
+
+    def _exec(self, command):
+        with self._lock:
+            self.commands.append(command)
+        args = shlex.split(command)
+        if args[:2] == ["sh", "-c"] and args[3:4] == ["librechat-backup"]:
+            return self._backup_put(*args[4:])
+        if args[:2] == ["sh", "-c"] and args[3:4] == ["librechat-backup-images"]:
+            return self._backup_images(args[4])
+        if args[:2] == ["sh", "-c"] and args[3:4] == ["librechat-digest-record"]:
+            root, image_id, repo_digest = args[4:7]
+            with self._lock:
+                self.files[f"{root}/digests/{image_id.partition(':')[2]}"] = f"{repo_digest}\n".encode()
+            return 0, "", ""
+        if args[:2] == ["sh", "-c"] and args[3:4] == ["librechat-digests"]:
+            root, reference = args[4:6]
+            with self._lock:
+                image = self._image(reference)
+                if image is None:
+                    return 1, "", f"Error: No such image: {reference}\n"
+                recorded = self.files.get(f"{root}/digests/{image['Id'].partition(':')[2]}", b"").decode()
+                return 0, "".join(f"{line}\n" for line in [image["Id"], *image["RepoDigests"]]) + recorded, ""
+        if args[:2] == ["sh", "-c"] and args[3:4] == ["librechat-journal"]:
+            root, step, container_name, entry = args[4:8]
+            path = f"{root}/journal/{container_name}.jsonl"
+            with self._lock:
+                previous = b"" if step == "begin" else self.files.get(path, b"")
+                self.files[path] = previous + entry.encode() + b"\n"
+            return 0, "", ""
+        if args[:2] == ["sh", "-c"] and args[3:4] == ["librechat-journal-read"]:
+            prefix = f"{args[4]}/journal/"
+            with self._lock:
+                return 0, "".join(
+                    data.decode() for path, data in sorted(self.files.items()) if path.startswith(prefix)
+                ), ""
+        if args[:2] == ["sh", "-c"] and args[3:4] == ["librechat-fence"]:
+            root, container_name, token = args[4:7]
+            path = f"{root}/fence/{container_name}"
+            with self._lock:
+                highest = int(self.files.get(path, b"0"))
+                if int(token) < highest:
+                    return 75, "", f"stale fencing token {token} < {highest}\n"
+                self.files[path] = f"{token}\n".encode()
+            return 0, "", ""
+        if args[:2] == ["sh", "-c"] and args[3:4] == ["librechat-canary"]:
+            # 金丝雀探测需要真实的 HTTP 服务，只在测试提供 run_local 时交给它在本机执行
+            # The canary probe needs a real HTTP server, so it only runs locally when a test provides run_local
+            if self.run_local is None:
+                return 127, "", "sh: curl: not found\n"
+            return self.run_local(command)
+        if args[:2] == ["df", "-P"]:
+            with self._lock:
+                used = 10_000_000 + sum(image["Size"] for image in self._unique_images()) // 1024
+            return 0, f"Filesystem 1024-blocks Used Available Capacity Mounted on\n/dev/sda1 {self.disk_size} {used} {self.disk_size - used} {100 * used // self.disk_size}% /\n", ""
+        if " | xargs -r " in command:
+            # 左侧命令的输出作为右侧命令的参数 / The output of the left command becomes arguments of the right one
+            left, _, right = command.partition(" | xargs -r ")
+            status, out, err = self._exec(left)
+            if status != 0 or not out.split():
+                return status, "", err
+            return self._exec(f"{right} {' '.join(out.split())}")
+        if "||" in args:
+            # 依次尝试每个命令，直到有一个成功 / Try each command in turn until one succeeds
+            index = args.index("||")
+            status, out, err = self._exec(shlex.join(args[:index]))
+            return (status, out, err) if status == 0 else self._exec(shlex.join(args[index + 1 :]))
+        if args[:1] in (["curl"], ["wget"]):
+            # 健康检查探测 / Health probe
+            if self.healthy:
+                return 0, "", ""
+            return 22, "", f"{args[0]}: The requested URL returned error: 503\n"
+        if args[:1] == ["cat"]:
+            with self._lock:
+                if args[1] not in self.files:
+                    return 1, "", f"cat: {args[1]}: No such file or directory\n"
+                return 0, self.files[args[1]].decode(), ""
+        if args[:1] != ["docker"]:
+            return 127, "", f"sh: {args[0]}: not found\n"
+        handler = getattr(self, f"_docker_{args[1].replace('-', '_')}", None)
+        if handler is None:
+            return 1, "", f"docker: '{args[1]}' is not a docker command.\n"
+        return handler(args[2:])
+
+    def _backup_put(self, root, container_name, digest, image_id, keep, payload):
+        """
+        模拟 backup_store.PUT_SCRIPT。
+        Emulates backup_store.PUT_SCRIPT.
+        """
+        with self._lock:
+            path = f"{root}/objects/{digest}.json.gz"
+            self.files.setdefault(path, base64.b64decode(payload))
+            image = self._image(image_id)
+            image_digest = image["RepoDigests"][0] if image and image["RepoDigests"] else ""
+            if not image_digest:
+                image_digest = self.files.get(f"{root}/digests/{image_id.partition(':')[2]}", b"").decode().strip()
+            index_path = f"{root}/{container_name}.index"
+            lines = self.files.get(index_path, b"").decode().splitlines()
+            if not lines or lines[-1].split("\t")[1] != digest:
+                created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+                lines.append(f"{created}\t{digest}\t{image_id}\t{image_digest}")
+            lines = lines[-int(keep):]
+            self.files[index_path] = "".join(f"{line}\n" for line in lines).encode()
+            keep_hashes = {
+                line.split("\t")[1]
+                for name, data in self.files.items()
+                if name.startswith(f"{root}/") and name.endswith(".index")
+                for line in data.decode().splitlines()
+            }
+            for name in [name for name in self.files if name.startswith(f"{root}/objects/")]:
+                if name.rpartition("/")[2][: -len(".json.gz")] not in keep_hashes:
+                    del self.files[name]
+            return 0, path + "\n", ""
+
+    def _backup_images(self, root):
+        with self._lock:
+            image_ids = {
+                line.split("\t")[2]
+                for name, data in self.files.items()
+                if name.startswith(f"{root}/") and name.endswith(".index")
+                for line in data.decode().splitlines()
+            }
+        return 0, "".join(f"{image_id}\n" for image_id in sorted(image_ids)), ""
+
+    def _unique_images(self):
+        return list({image["Id"]: image for image in self.images.values()}.values())
+
+    def _image(self, reference):
+        image = self.images.get(reference)
+        if image is None:
+            image = next((image for image in self.images.values() if image["Id"] == reference), None)
+        return image
+
+    def _docker_ps(self, args):
+        with self._lock:
+            if "{{.Image}}" in args:
+                return 0, "".join(f"{info['Config']['Image']}\n" for info in self.containers.values()), ""
+            return 0, "".join(f"{name}\n" for name in self.containers), ""
+
+    def _docker_inspect(self, args):
+        with self._lock:
+            if args and args[0] == "-f":
+                template, names = args[1], args[2:]
+                lines = []
+                for name in names:
+                    if name not in self.containers:
+                        return 1, "", f"Error: No such object: {name}\n"
+                    status, health = self._state(self.containers[name])
+                    lines.append(
+                        f"{status}|{health}" if ".State.Status" in template else json.dumps(self._public(self.containers[name]))
+                    )
+                return 0, "\n".join(lines) + "\n", ""
+            found = [self._public(self.containers[name]) for name in args if name in self.containers]
+            missing = [name for name in args if name not in self.containers]
+            err = "".join(f"Error: No such object: {name}\n" for name in missing)
+            return (1 if missing else 0), json.dumps(found, indent=4) + "\n", err
+
+    def _docker_image(self, args):
+        with self._lock:
+            if args[0] == "inspect":
+                template = args[args.index("--format") + 1] if "--format" in args else None
+                references = args[args.index("--format") + 2 :] if template else args[1:]
+                if not references:
+                    return 1, "", '"docker image inspect" requires at least 1 argument.\n'
+                images = [self._image(reference) for reference in references]
+                missing = [reference for reference, image in zip(references, images) if image is None]
+                if missing:
+                    return 1, "", "".join(f"Error: No such image: {reference}\n" for reference in missing)
+                if template:
+                    return 0, "".join(self._render(template, image) + "\n" for image in images), ""
+                return 0, json.dumps(images) + "\n", ""
+            if args[0] == "rm":
+                in_use = {
+                    image["Id"]
+                    for image in (self._image(info["Config"]["Image"]) for info in self.containers.values())
+                    if image
+                }
+                errors = []
+                for reference in args[1:]:
+                    image = self._image(reference)
+                    if image is None:
+                        errors.append(f"Error: No such image: {reference}\n")
+                    elif image["Id"] in in_use:
+                        errors.append(f"Error: conflict: unable to remove {reference} (in use)\n")
+                    else:
+                        self.images.pop(reference, None)  # 删除标签 / Untag
+                        # 最后一个标签删除后镜像（及其摘要引用）随之删除 / The image and its digest references go with the last tag
+                        if reference == image["Id"] or not any(
+                            value["Id"] == image["Id"] and "@" not in key for key, value in self.images.items()
+                        ):
+                            for key in [key for key, value in self.images.items() if value["Id"] == image["Id"]]:
+                                del self.images[key]
+                return (1 if errors else 0), "", "".join(errors)
+            if args[0] == "ls" and "-q" in args:
+                return 0, "".join(f"{image['Id']}\n" for image in self._unique_images()), ""
+            if args[0] == "ls":
+                lines = [
+                    json.dumps({"Repository": reference.rpartition(":")[0], "Tag": reference.rpartition(":")[2], "ID": image["Id"][7:19]})
+                    for reference, image in self.images.items()
+                ]
+                return 0, "\n".join(lines) + "\n", ""
+            return 1, "", f"unknown image command {args[0]}\n"
+
+    @staticmethod
+    def _render(template, image):
+        return (
+            template.replace("{{json .}}", json.dumps(image))
+            .replace("{{json .RepoDigests}}", json.dumps(image["RepoDigests"]))
+            .replace("{{json .RootFS.Layers}}", json.dumps(image["RootFS"]["Layers"]))
+            .replace("{{.Id}}", image["Id"])
+        )
+
+    def _docker_save(self, args):
+        """
+        生成 OCI 格式（Docker 25+）的 docker save 输出：每层一个 blob，外加配置与 manifest.json。
+        Produce docker save output in the OCI layout (Docker 25+): one blob per layer plus the
+        config and manifest.json.
+        """
+        with self._lock:
+            image = self._image(args[-1])
+            if image is None:
+                return 1, "", f"Error: No such image: {args[-1]}\n"
+            image = dict(image)
+        layers = image["RootFS"]["Layers"]
+        config = json.dumps(
+            {"created": image["Created"], "size": image["Size"], "rootfs": {"type": "layers", "diff_ids": layers}}
+        ).encode()
+        config_name = f"blobs/sha256/{image['Id'][7:]}"
+        manifest = [
+            {
+                "Config": config_name,
+                "RepoTags": image["RepoTags"],
+                "Layers": [f"blobs/sha256/{layer[7:]}" for layer in layers],
+            }
+        ]
+        output = io.BytesIO()
+        with tarfile.open(fileobj=output, mode="w") as tar:
+            for name, data in [
+                *((f"blobs/sha256/{layer[7:]}", layer.encode() * (LAYER_SIZE // len(layer))) for layer in layers),
+                (config_name, config),
+                ("manifest.json", json.dumps(manifest).encode()),
+            ]:
+                member = tarfile.TarInfo(name)
+                member.size = len(data)
+                tar.addfile(member, io.BytesIO(data))
+        return 0, output.getvalue(), ""
+
+    def _docker_load(self, data):
+        """
+        加载 docker save 的输出；与 Docker 一样，chain 已存在的层可以不在 tar 中。
+        Load docker save output; as with Docker, layers whose chain already exists may be missing
+        from the tar.
+        """
+        time.sleep(self.latency.load)
+        with self._lock:
+            self.commands.append("docker load")
+            try:
+                with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+                    names = set(tar.getnames())
+                    manifest = json.load(tar.extractfile("manifest.json"))
+                    configs = [json.load(tar.extractfile(entry["Config"])) for entry in manifest]
+            except (tarfile.TarError, KeyError) as e:
+                return 1, "", f"Error: archive/tar: invalid tar header: {e}\n"
+            chains = [image["RootFS"]["Layers"] for image in self._unique_images()]
+            loaded = []
+            for entry, config in zip(manifest, configs):
+                layers = config["rootfs"]["diff_ids"]
+                for index, path in enumerate(entry["Layers"]):
+                    present = any(chain[: index + 1] == layers[: index + 1] for chain in chains)
+                    if not present and path not in names:
+                        return 1, "", f"Error: open /var/lib/docker/tmp/docker-import/{path}: no such file or directory\n"
+                image_id = "sha256:" + entry["Config"].rpartition("/")[2]
+                image = {
+                    "Id": image_id,
+                    "RepoTags": [],
+                    "RepoDigests": [],  # docker load 不保留仓库摘要 / docker load does not keep repository digests
+                    "Created": config["created"],
+                    "Size": config["size"],
+                    "RootFS": {"Layers": layers},
+                }
+                for tag in entry["RepoTags"] or [image_id]:
+                    self.images[tag] = dict(image, RepoTags=[tag] if tag != image_id else [])
+                    loaded.append(tag)
+            return 0, "".join(f"Loaded image: {tag}\n" for tag in loaded), ""
+
+    def _docker_pull(self, args):
+        time.sleep(self.latency.pull)
+        reference = args[-1]
+        with self._lock:
+            self.pulls += 1
+            digest = reference.partition("@")[2] or None
+            self._add_image(reference, digest)
+        return 0, f"Status: Downloaded newer image for {reference}\n", ""
+
+    def _docker_tag(self, args):
+        with self._lock:
+            source, target = args
+            if source not in self.images:
+                return 1, "", f"Error: No such image: {source}\n"
+            self.images[target] = dict(self.images[source], RepoTags=[target])
+            return 0, "", ""
+
+    def _docker_rename(self, args):
+        with self._lock:
+            old, new = args
+            if old not in self.containers:
+                return 1, "", f"Error: No such container: {old}\n"
+            if new in self.containers:
+                return 1, "", f"Error: Conflict. The container name \"/{new}\" is already in use\n"
+            info = self.containers.pop(old)
+            info["Name"] = f"/{new}"
+            self.containers[new] = info
+            self._mark_down(old)
+            if self._state(info)[0] == "running":
+                self._mark_up(new, time.monotonic())
+            return 0, "", ""
+
+    def _docker_rm(self, args):
+        time.sleep(self.latency.remove)
+        name = args[-1]
+        with self._lock:
+            if self.containers.pop(name, None) is None:
+                return 1, "", f"Error: No such container: {name}\n"
+            self._mark_down(name)
+            return 0, f"{name}\n", ""
+
+    def _docker_run(self, args):
+        time.sleep(self.latency.run)
+        name = args[args.index("--name") + 1]
+        image = args[-1]
+        env, ports, networks, labels = [], {}, [], {}
+        for flag, value in zip(args, args[1:]):
+            if flag == "-e":
+                env.append(value)
+            elif flag == "-p":
+                host_ip, host_port, container_port = value.rsplit(":", 2)
+                ports.setdefault(f"{container_port}/tcp", []).append({"HostIp": host_ip, "HostPort": host_port})
+            elif flag == "--network":
+                networks.append(value)
+            elif flag == "--label":
+                key, _, label_value = value.partition("=")
+                labels[key] = label_value
+        with self._lock:
+            if name in self.containers:
+                return 125, "", f"docker: Error response from daemon: Conflict. The container name \"/{name}\" is already in use.\n"
+            if self._image(image) is None:
+                return 125, "", f"Unable to find image '{image}' locally\n"
+            self._create(name, image, env, ports=ports, networks=networks or None, labels=labels)
+            return 0, self.containers[name]["Id"] + "\n", ""
+
+    def _docker_network(self, args):
+        """
+        docker network connect [--alias 别名...] / disconnect [-f]，记录在容器的 NetworkSettings 中。
+        docker network connect [--alias ALIAS...] / disconnect [-f], kept in the container's NetworkSettings.
+        """
+        action, rest = args[0], [arg for arg in args[1:] if arg != "-f"]
+        aliases = [value for flag, value in zip(rest, rest[1:]) if flag == "--alias"]
+        network, name = rest[-2], rest[-1]
+        with self._lock:
+            info = self.containers.get(name)
+            if info is None:
+                return 1, "", f"Error: No such container: {name}\n"
+            networks = info["NetworkSettings"]["Networks"]
+            if action == "connect":
+                if network in networks:
+                    return 1, "", f"Error response from daemon: endpoint with name {name} already exists in network {network}\n"
+                networks[network] = {"Aliases": aliases}
+            elif action == "disconnect":
+                if network not in networks:
+                    return 1, "", f"Error response from daemon: container {name} is not connected to network {network}\n"
+                del networks[network]
+            return 0, "", ""
+
+    def _docker_stop(self, args):
+        with self._lock:
+            name = args[-1]
+            if name not in self.containers:
+                return 1, "", f"Error: No such container: {name}\n"
+            self._mark_down(name)
+            return 0, f"{name}\n", ""
+
+    def _docker_start(self, args):
+        with self._lock:
+            name = args[-1]
+            if name not in self.containers:
+                return 1, "", f"Error: No such container: {name}\n"
+            self.containers[name]["_started"] = time.monotonic()
+            self._mark_up(name, time.monotonic() + self.latency.ready)
+            return 0, f"{name}\n", ""
+
+
+def fake_connect(hosts):
+    """
+    生成可注入 rollout(connect=...) 的连接函数，按主机名返回对应的模拟主机。
+    Build a connection factory for rollout(connect=...) that returns the fake host by name.
+
+    :param hosts: 主机名 -> FakeDockerHost / host name -> FakeDockerHost
+    """
+
+    def connect(server_address, username, port, private_key):
+        host = hosts[server_address]
+        host._round_trip()  # SSH 握手 / SSH handshake
+        return host
+
+    return connect
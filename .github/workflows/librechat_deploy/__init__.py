@@ -0,0 +1,7 @@
+"""
+LibreChat 部署工具：通过 SSH 在多台主机上拉取镜像、重新创建容器、回滚与清理镜像。
+命令行入口见 cli 模块（python -m librechat_deploy）。
+
+LibreChat deploy tooling: pulls images, recreates containers, rolls back and cleans up images on
+several hosts over SSH. See the cli module for the command line (python -m librechat_deploy).
+"""
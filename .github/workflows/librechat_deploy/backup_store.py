@@ -0,0 +1,201 @@
+import os
+import json
+import gzip
+import shlex
+import base64
+import hashlib
+import logging
+
+from .remote import run_command
+
+# 远程主机上的备份目录与每个容器保留的快照数
+# Backup directory on the remote host and number of snapshots kept per container
+BACKUP_DIR = os.getenv("BACKUP_DIR", "/root/librechat-backups")
+BACKUP_RETENTION = int(os.getenv("BACKUP_RETENTION") or 10)
+
+# 保存快照并维护索引的远程脚本，一次往返完成：
+# 对象按内容哈希命名，已存在则不再写入；索引每行一个快照（时间、哈希、镜像 ID、镜像摘要），
+# 与上一条相同则不追加；超出保留数的条目被截断，不再被任何索引引用的对象被删除。
+# 没有 RepoDigests 的镜像（由 docker load 载入）使用 digests/ 下记录的摘要。
+# Remote script that stores a snapshot and updates the index in one round trip:
+# objects are named by content hash and not rewritten if present; the index holds one snapshot per
+# line (time, hash, image ID, image digest) and is not appended to when the hash repeats the last
+# entry; entries beyond the retention are cut and objects no index references any more are deleted.
+# An image without RepoDigests (brought in by docker load) takes the digest recorded under digests/.
+PUT_SCRIPT = r"""set -e
+d="$1"; o="$d/objects/$3.json.gz"; i="$d/$2.index"
+mkdir -p "$d/objects"
+[ -e "$o" ] || { printf %s "$6" | base64 -d > "$o.tmp"; mv "$o.tmp" "$o"; }
+dg=$(docker image inspect --format '{{index .RepoDigests 0}}' "$4" 2>/dev/null || true)
+[ -n "$dg" ] || dg=$(cat "$d/digests/${4#sha256:}" 2>/dev/null || true)
+if [ "$(tail -n 1 "$i" 2>/dev/null | cut -f 2)" != "$3" ]; then
+  printf '%s\t%s\t%s\t%s\n' "$(date -u +%Y-%m-%dT%H:%M:%SZ)" "$3" "$4" "$dg" >> "$i"
+fi
+tail -n "$5" "$i" > "$i.tmp"; mv "$i.tmp" "$i"
+cut -f 2 "$d"/*.index | sort -u > "$d/.keep"
+for f in "$d"/objects/*.json.gz; do
+  grep -qx "$(basename "$f" .json.gz)" "$d/.keep" || rm -f "$f"
+done
+echo "$o"
+"""
+
+# 列出所有索引中引用的镜像 ID / List the image IDs referenced by every index
+IMAGES_SCRIPT = r"""cut -f 3 "$1"/*.index 2>/dev/null | sort -u"""
+
+
+def snapshot(container_info):
+    """
+    从 docker inspect 信息中提取重建容器所需的部分，去掉每次运行都会变化的字段（状态、ID、IP 等），
+    使配置相同的容器得到相同的快照。
+    Extract what is needed to recreate the container from docker inspect information, dropping
+    fields that change on every run (state, IDs, IPs, ...) so identical configurations give
+    identical snapshots.
+
+    :param container_info: docker inspect 信息 / docker inspect information
+    :return: 快照字典 / Snapshot dictionary
+    """
+    container_id = container_info.get("Id", "")
+    config = dict(container_info.get("Config") or {})
+    # 未指定主机名时 Docker 使用容器 ID / Docker uses the container ID when no hostname was given
+    if container_id.startswith(config.get("Hostname") or "-"):
+        config.pop("Hostname")
+    networks = {
+        name: {
+            "Aliases": [
+                alias for alias in network.get("Aliases") or [] if not container_id.startswith(alias)
+            ],
+            "IPAMConfig": network.get("IPAMConfig"),
+            "Links": network.get("Links"),
+        }
+        for name, network in (
+            (container_info.get("NetworkSettings") or {}).get("Networks") or {}
+        ).items()
+    }
+    return {
+        "Name": container_info.get("Name"),
+        "Image": container_info.get("Image"),
+        "Config": config,
+        "HostConfig": container_info.get("HostConfig") or {},
+        "NetworkSettings": {"Networks": networks},
+    }
+
+
+def encode_snapshot(snapshot_info):
+    """
+    以规范 JSON 压缩快照并计算内容哈希。
+    Compress a snapshot as canonical JSON and compute its content hash.
+
+    :param snapshot_info: 快照字典 / Snapshot dictionary
+    :return: (sha256 十六进制, gzip 数据) / (sha256 hex digest, gzip data)
+    """
+    canonical = json.dumps(snapshot_info, sort_keys=True, separators=(",", ":")).encode()
+    # mtime=0 使相同内容得到相同的压缩结果 / mtime=0 keeps the compressed bytes stable for equal content
+    return hashlib.sha256(canonical).hexdigest(), gzip.compress(canonical, mtime=0)
+
+
+def save_snapshot(ssh, container_name, container_info, root=None, keep=None):
+    """
+    将容器快照保存到远程备份目录，相同内容只存储一次。
+    Store a container snapshot in the remote backup directory; identical content is stored once.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_name: 容器名称 / Container name
+    :param container_info: docker inspect 信息 / docker inspect information
+    :param root: 备份目录，默认 BACKUP_DIR / Backup directory, defaults to BACKUP_DIR
+    :param keep: 保留的快照数，默认 BACKUP_RETENTION / Snapshots kept, defaults to BACKUP_RETENTION
+    :return: (内容哈希, 远程对象路径)，失败时为 None / (content hash, remote object path), None on failure
+    """
+    snapshot_info = snapshot(container_info)
+    digest, payload = encode_snapshot(snapshot_info)
+    command = shlex.join(
+        [
+            "sh",
+            "-c",
+            PUT_SCRIPT,
+            "librechat-backup",
+            root or BACKUP_DIR,
+            container_name,
+            digest,
+            snapshot_info["Image"] or "",
+            str(keep or BACKUP_RETENTION),
+            base64.b64encode(payload).decode(),
+        ]
+    )
+    status, out, err = run_command(ssh, command)
+    if status != 0:
+        logging.error(
+            f"错误：无法保存容器 {container_name} 的快照：{err.strip()}"
+        )  # Error: could not store the container snapshot
+        return None
+    return digest, out.strip()
+
+
+def list_snapshots(ssh, container_name, root=None):
+    """
+    列出容器的快照，最新的在前。
+    List the snapshots of a container, newest first.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_name: 容器名称 / Container name
+    :param root: 备份目录，默认 BACKUP_DIR / Backup directory, defaults to BACKUP_DIR
+    :return: 快照条目列表 {created, hash, image_id, image_digest} / List of snapshot entries
+    """
+    status, out, _ = run_command(ssh, f"cat {shlex.quote(f'{root or BACKUP_DIR}/{container_name}.index')}")
+    if status != 0:
+        return []
+    entries = []
+    for line in out.splitlines():
+        fields = line.split("\t")
+        if len(fields) == 4:
+            entries.append(dict(zip(("created", "hash", "image_id", "image_digest"), fields)))
+    return entries[::-1]
+
+
+def find_snapshot(entries, selector=None, exclude=None):
+    """
+    选择快照：selector 为哈希前缀或序号（0 为最新）；未指定时选择最新的、与 exclude 不同的快照。
+    Pick a snapshot: selector is a hash prefix or an index (0 is the newest); without one the newest
+    snapshot whose hash differs from exclude is picked.
+
+    :param entries: list_snapshots() 的结果 / Result of list_snapshots()
+    :param selector: 哈希前缀或序号 / Hash prefix or index
+    :param exclude: 要跳过的哈希（通常为当前配置）/ Hash to skip (usually the current configuration)
+    :return: 快照条目或 None / Snapshot entry or None
+    """
+    if selector is None:
+        return next((entry for entry in entries if entry["hash"] != exclude), None)
+    if selector.isdigit() and len(selector) < 8:
+        index = int(selector)
+        return entries[index] if index < len(entries) else None
+    matches = [entry for entry in entries if entry["hash"].startswith(selector)]
+    return matches[0] if len({entry["hash"] for entry in matches}) == 1 else None
+
+
+def load_snapshot(ssh, snapshot_hash, root=None):
+    """
+    读取并解压快照。
+    Read and decompress a snapshot.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param snapshot_hash: 快照内容哈希 / Snapshot content hash
+    :param root: 备份目录，默认 BACKUP_DIR / Backup directory, defaults to BACKUP_DIR
+    :return: 快照字典 / Snapshot dictionary
+    """
+    with ssh.open_sftp() as sftp:
+        with sftp.file(f"{root or BACKUP_DIR}/objects/{snapshot_hash}.json.gz", "r") as f:
+            data = gzip.decompress(f.read())
+    if hashlib.sha256(data).hexdigest() != snapshot_hash:
+        raise ValueError(f"snapshot {snapshot_hash} is corrupted")
+    return json.loads(data)
+
+
+def referenced_images_command(root=None):
+    """
+    生成列出备份中引用的所有镜像 ID 的命令，清理镜像时应保留这些镜像以便快速回滚。
+    Build the command listing every image ID referenced by a backup; image cleanup keeps them so
+    rollbacks stay fast.
+
+    :param root: 备份目录，默认 BACKUP_DIR / Backup directory, defaults to BACKUP_DIR
+    :return: shell 命令，每行输出一个镜像 ID / Shell command printing one image ID per line
+    """
+    return shlex.join(["sh", "-c", IMAGES_SCRIPT, "librechat-backup-images", root or BACKUP_DIR])
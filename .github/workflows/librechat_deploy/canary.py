@@ -0,0 +1,198 @@
+import os
+import json
+import math
+import shlex
+import subprocess
+
+# 金丝雀探测的请求组合：以 "&" 分隔的 "方法 路径[*权重]"，默认只请求健康检查路径
+# Canary request mix: "&"-separated "METHOD PATH[*WEIGHT]" entries, defaults to the health probe path
+CANARY_REQUESTS = os.getenv("CANARY_REQUESTS", "")
+CANARY_SAMPLES = int(os.getenv("CANARY_SAMPLES") or 50)  # 每次测量的请求数 / Requests per measurement
+CANARY_TIMEOUT = float(os.getenv("CANARY_TIMEOUT") or 5)  # 单个请求的超时（秒）/ Timeout of a single request (seconds)
+
+# 新版本与基线相比允许的上限：p50 / p99 延迟的倍数（另加固定余量，避免基线极小时误判）与错误率的增量
+# Limits of the new version against the baseline: p50 / p99 latency ratios (plus a fixed slack so a
+# tiny baseline does not fail on noise) and the allowed increase of the error rate
+CANARY_MAX_P50_RATIO = float(os.getenv("CANARY_MAX_P50_RATIO") or 1.5)
+CANARY_MAX_P99_RATIO = float(os.getenv("CANARY_MAX_P99_RATIO") or 2.0)
+CANARY_LATENCY_SLACK = float(os.getenv("CANARY_LATENCY_SLACK") or 0.02)
+CANARY_MAX_ERROR_RATE = float(os.getenv("CANARY_MAX_ERROR_RATE") or 0.01)
+
+# 在主机上依次发送请求的脚本，每个请求输出一行 "状态码 秒"；连接失败时 curl 输出状态码 000
+# Script that sends the requests one by one on the host, printing "status seconds" per request;
+# curl prints status 000 when the connection fails
+PROBE_SCRIPT = r"""t="$1"; u="$2"; shift 2
+while [ $# -gt 1 ]; do
+  curl -s -o /dev/null -m "$t" -X "$1" -w '%{http_code} %{time_total}\n' "$u$2" || true
+  shift 2
+done
+"""
+
+
+def parse_mix(value, default_path="/health"):
+    """
+    解析请求组合。
+    Parse the request mix.
+
+    :param value: 如 "GET /health*4&GET /api/config" / e.g. "GET /health*4&GET /api/config"
+    :param default_path: 未配置时请求的路径 / Path requested when nothing is configured
+    :return: (方法, 路径, 权重) 列表 / List of (method, path, weight)
+    """
+    mix = []
+    for entry in (value or "").split("&"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        request, _, weight = entry.partition("*")
+        method, _, path = request.strip().partition(" ")
+        if not path:
+            method, path = "GET", method
+        mix.append((method.upper(), path.strip(), max(1, int(weight or 1))))
+    return mix or [("GET", default_path, 1)]
+
+
+def schedule(mix, samples):
+    """
+    按权重平滑交错地排列请求，使每种请求均匀分布在整个测量中。
+    Interleave the requests smoothly by weight so every kind is spread over the whole measurement.
+
+    :param mix: parse_mix() 的结果 / Result of parse_mix()
+    :param samples: 请求总数 / Total number of requests
+    :return: (方法, 路径) 列表 / List of (method, path)
+    """
+    total = sum(weight for _, _, weight in mix)
+    current = [0] * len(mix)
+    requests = []
+    for _ in range(samples):
+        for index, (_, _, weight) in enumerate(mix):
+            current[index] += weight
+        chosen = max(range(len(mix)), key=current.__getitem__)
+        current[chosen] -= total
+        requests.append(mix[chosen][:2])
+    return requests
+
+
+def probe_command(base_url, requests, timeout=None):
+    """
+    生成一次往返内完成全部请求的命令。
+    Build the command that sends every request in one round trip.
+    """
+    arguments = [str(CANARY_TIMEOUT if timeout is None else timeout), base_url]
+    for method, path in requests:
+        arguments += [method, path]
+    return "sh -c " + " ".join(
+        shlex.quote(argument) for argument in [PROBE_SCRIPT, "librechat-canary", *arguments]
+    )
+
+
+def percentile(values, fraction):
+    """
+    最近秩百分位数。
+    Nearest-rank percentile.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * fraction) - 1)]
+
+
+def summarize(output):
+    """
+    汇总探测输出：5xx 与连接失败计为错误，延迟只统计成功的请求。
+    Summarise the probe output: 5xx responses and failed connections count as errors, latency only
+    covers the successful requests.
+
+    :param output: PROBE_SCRIPT 的输出 / Output of PROBE_SCRIPT
+    :return: {"count", "errors", "error_rate", "p50", "p99"}
+    """
+    count, errors, latencies = 0, 0, []
+    for line in output.splitlines():
+        status, _, seconds = line.strip().partition(" ")
+        if not status.isdigit():
+            continue
+        count += 1
+        if status == "000" or int(status) >= 500:
+            errors += 1
+        else:
+            latencies.append(float(seconds))
+    return {
+        "count": count,
+        "errors": errors,
+        "error_rate": errors / count if count else None,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+def measure(run, base_url, mix, samples=None, timeout=None):
+    """
+    按请求组合测量一个端点。
+    Measure an endpoint with the request mix.
+
+    :param run: 执行 shell 命令并返回 (退出码, 标准输出, 标准错误) 的函数，如 run_command 或 local_run
+                / Function running a shell command and returning (status, stdout, stderr), e.g. run_command or local_run
+    :param base_url: 如 http://127.0.0.1:3080 / e.g. http://127.0.0.1:3080
+    :param mix: parse_mix() 的结果 / Result of parse_mix()
+    :param samples: 请求数，默认 CANARY_SAMPLES / Number of requests, defaults to CANARY_SAMPLES
+    :param timeout: 单个请求的超时 / Timeout of a single request
+    :return: summarize() 的结果 / Result of summarize()
+    """
+    requests = schedule(mix, samples or CANARY_SAMPLES)
+    _, out, _ = run(probe_command(base_url, requests, timeout))
+    return summarize(out)
+
+
+def local_run(command):
+    """
+    在本机执行命令，用于对本地替身服务器测试探测。
+    Run the command locally, for testing the probe against a local stand-in server.
+    """
+    completed = subprocess.run(command, shell=True, capture_output=True, text=True)
+    return completed.returncode, completed.stdout, completed.stderr
+
+
+def compare(baseline, candidate):
+    """
+    将新版本的测量结果与基线比较。
+    Compare the measurement of the new version with the baseline.
+
+    :param baseline: 旧版本的 summarize() 结果 / summarize() result of the old version
+    :param candidate: 新版本的 summarize() 结果 / summarize() result of the new version
+    :return: 超出阈值的说明列表，为空表示通过 / Descriptions of the exceeded limits, empty if it passed
+    """
+    if not candidate["count"]:
+        return ["no response could be measured"]
+    failures = []
+    allowed_errors = (baseline["error_rate"] or 0.0) + CANARY_MAX_ERROR_RATE
+    if candidate["error_rate"] > allowed_errors:
+        failures.append(f"error rate {candidate['error_rate']:.1%} > {allowed_errors:.1%}")
+    for name, ratio in (("p50", CANARY_MAX_P50_RATIO), ("p99", CANARY_MAX_P99_RATIO)):
+        if baseline[name] is None or candidate[name] is None:
+            continue
+        allowed = baseline[name] * ratio + CANARY_LATENCY_SLACK
+        if candidate[name] > allowed:
+            failures.append(f"{name} {candidate[name] * 1000:.0f}ms > {allowed * 1000:.0f}ms")
+    return failures
+
+
+def describe(summary):
+    if not summary["count"]:
+        return "no responses"
+    latency = " ".join(
+        f"{name} {summary[name] * 1000:.0f}ms" for name in ("p50", "p99") if summary[name] is not None
+    )
+    return f"{summary['count']} requests, {summary['error_rate']:.1%} errors, {latency or 'no successes'}"
+
+
+def write_report(directory, report):
+    """
+    将金丝雀结果写入目录下的 canary.json。
+    Write the canary outcome to canary.json in the directory.
+    """
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "canary.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
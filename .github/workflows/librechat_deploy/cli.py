@@ -0,0 +1,375 @@
+"""
+LibreChat 部署命令行：deploy / rollback / plan / prune / push-env。
+paramiko、requests 与 python-dotenv 只在真正需要时才导入，--help 与参数校验几乎立即返回。
+
+LibreChat deploy command line: deploy / rollback / plan / prune / push-env.
+paramiko, requests and python-dotenv are only imported when actually needed, so --help and
+argument validation return almost immediately.
+
+用法 / Usage:
+    python -m librechat_deploy deploy [--image IMAGE] [--batch-size N] [--max-unavailable N] [--fanout] [--canary] [--env-file FILE]
+    python -m librechat_deploy rollback [CONTAINER ...] [--snapshot SELECTOR] [--list]
+    python -m librechat_deploy plan [--image IMAGE] [--save DIR | --offline DIR] [--timings FILE] [--env-file FILE]
+    python -m librechat_deploy prune [--image IMAGE]
+    python utils/update_env.py .env.example - | python -m librechat_deploy push-env [--path PATH]
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+ENV_FILE_HELP = (
+    "env file rendered by utils/update_env.py; containers whose managed variables differ from it "
+    "are recreated with its values (defaults to DEPLOY_ENV_FILE)"
+)
+
+
+def load_env(start=None):
+    """
+    从当前目录向上查找 .env 文件并加载；找不到时不导入 python-dotenv。
+    Look for a .env file from the current directory upwards and load it; python-dotenv is not
+    imported when there is none.
+
+    :param start: 起始目录，默认当前目录 / Start directory, defaults to the current directory
+    :return: 加载的文件路径或 None / Path of the loaded file or None
+    """
+    directory = os.path.abspath(start or os.getcwd())
+    while True:
+        path = os.path.join(directory, ".env")
+        if os.path.isfile(path):
+            from dotenv import load_dotenv
+
+            load_dotenv(path)
+            return path
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def configure_logging():
+    # 线程名即主机名，便于区分并发部署的输出 / The thread name is the host so concurrent output stays readable
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s",
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="librechat_deploy", description="Deploy LibreChat containers over SSH."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    deploy = commands.add_parser("deploy", help="pull the image and recreate the containers")
+    deploy.add_argument(
+        "--image", help="image to deploy; defaults to IMAGE_URL, then the release manifest"
+    )
+    deploy.add_argument(
+        "--batch-size", type=int, help="rolling update batch size (defaults to ROLLING_BATCH_SIZE)"
+    )
+    deploy.add_argument(
+        "--max-unavailable",
+        type=int,
+        help="containers allowed down at once (defaults to ROLLING_MAX_UNAVAILABLE)",
+    )
+    deploy.add_argument("--concurrency", type=int, help="hosts in flight (defaults to DEPLOY_CONCURRENCY)")
+    deploy.add_argument(
+        "--fanout",
+        action="store_true",
+        default=None,
+        help="pull on the first host only and stream the image to the others over SSH "
+        "(defaults to IMAGE_FANOUT)",
+    )
+    deploy.add_argument(
+        "--canary",
+        action="store_true",
+        default=None,
+        help="update one container first and roll it back if its latency or error rate regresses "
+        "(defaults to CANARY)",
+    )
+    deploy.add_argument("--env-file", metavar="FILE", help=ENV_FILE_HELP)
+
+    rollback = commands.add_parser("rollback", help="recreate containers from a stored snapshot")
+    rollback.add_argument(
+        "containers", nargs="*", help="containers to roll back, defaults to CONTAINER_NAMES"
+    )
+    rollback.add_argument(
+        "--snapshot",
+        help="snapshot hash prefix or index (0 is the newest); defaults to the newest one that "
+        "differs from the running configuration",
+    )
+    rollback.add_argument("--list", action="store_true", help="list the stored snapshots and exit")
+
+    plan = commands.add_parser("plan", help="show what a deploy would change without changing it")
+    plan.add_argument(
+        "--image", help="image to plan for; defaults to IMAGE_URL, then the release manifest"
+    )
+    snapshots = plan.add_mutually_exclusive_group()
+    snapshots.add_argument("--save", metavar="DIR", help="also save the host snapshots for offline planning")
+    snapshots.add_argument(
+        "--offline",
+        metavar="DIR",
+        help="plan from the snapshots saved in DIR without connecting to the hosts",
+    )
+    plan.add_argument(
+        "--timings",
+        metavar="FILE",
+        help="deploy_spans.jsonl of earlier runs for the time estimate "
+        "(defaults to the one in DEPLOY_METRICS_DIR)",
+    )
+    plan.add_argument("--env-file", metavar="FILE", help=ENV_FILE_HELP)
+
+    prune = commands.add_parser("prune", help="clean up images by retention policy")
+    prune.add_argument(
+        "--image", help="image whose recent versions are kept; defaults to IMAGE_URL"
+    )
+
+    push_env = commands.add_parser("push-env", help="write an env file to every host over SFTP")
+    push_env.add_argument(
+        "--source", default="-", help="env content to push, '-' (the default) reads standard input"
+    )
+    push_env.add_argument("--path", help="target path on the hosts (defaults to ENV_PUSH_PATH)")
+    return parser
+
+
+def _target():
+    """
+    读取并校验目标主机的环境变量。
+    Read and validate the target host environment variables.
+
+    :return: read_rollout_env() 的结果，缺少必要变量时为 None / Result of read_rollout_env(), None if a required variable is missing
+    """
+    from . import manager
+
+    target = manager.read_rollout_env()
+    hosts, username, private_key = target[:3]
+    if not all([hosts, username, private_key]):
+        logging.error(
+            "请确保 SERVER_ADDRESS, USERNAME 和 PRIVATE_KEY 环境变量已设置。"
+        )  # Please ensure SERVER_ADDRESS, USERNAME, and PRIVATE_KEY environment variables are set.
+        return None
+    return target
+
+
+def _use_env_file(args):
+    """
+    命令行指定的渲染 env 文件优先于 DEPLOY_ENV_FILE。
+    The rendered env file given on the command line takes precedence over DEPLOY_ENV_FILE.
+    """
+    if args.env_file:
+        from . import env_index
+
+        env_index.DEPLOY_ENV_FILE = args.env_file
+
+
+def _image_url(args):
+    """
+    目标镜像：命令行参数、IMAGE_URL，最后是发布清单。
+    Target image: the command line, then IMAGE_URL, then the release manifest.
+    """
+    from . import manager, timing
+
+    image_url = args.image or os.getenv("IMAGE_URL")
+    if not image_url:
+        # 镜像 URL 在本地获取一次，所有主机共享 / The image URL is resolved once locally and shared by all hosts
+        with timing.span("manifest"):
+            image_url = manager.get_image_url()
+    return image_url
+
+
+def cmd_deploy(args, connect=None):
+    from . import manager
+
+    _use_env_file(args)
+    target = _target()
+    if target is None:
+        return None
+    hosts, username, private_key, container_names, concurrency = target
+    try:
+        image_url = _image_url(args)
+        if not image_url:
+            return None
+        return manager.rollout(
+            hosts,
+            username,
+            private_key,
+            container_names,
+            image_url,
+            args.concurrency or concurrency,
+            connect,
+            batch_size=args.batch_size,
+            max_unavailable=args.max_unavailable,
+            fanout=args.fanout,
+            canary_first=args.canary,
+        )
+    finally:
+        manager.export_timings()
+
+
+def cmd_rollback(args, connect=None):
+    from . import backup_store, manager
+
+    target = _target()
+    if target is None:
+        return None
+    hosts, username, private_key, container_names, concurrency = target
+    container_names = args.containers or container_names
+
+    if args.list:
+        # 打印每台主机上各容器的快照，最新的在前 / Print each container's snapshots per host, newest first
+        for host, port in hosts:
+            ssh = (connect or manager.remote_login)(host, username, port, private_key)
+            try:
+                for container_name in container_names:
+                    print(f"{host} {container_name}")
+                    for index, entry in enumerate(backup_store.list_snapshots(ssh, container_name)):
+                        print(
+                            f"  {index:>2}  {entry['hash'][:12]}  {entry['created']}  "
+                            f"{entry['image_digest'] or entry['image_id']}"
+                        )
+            finally:
+                ssh.close()
+        return []
+
+    try:
+        return manager.rollback(
+            hosts, username, private_key, container_names, args.snapshot, concurrency, connect
+        )
+    finally:
+        manager.export_timings()
+
+
+def cmd_plan(args, connect=None):
+    from . import manager, planner
+
+    _use_env_file(args)
+    if args.offline:
+        # 离线规划不需要 SSH 凭据 / Offline planning needs no SSH credentials
+        hosts, _, _, container_names, concurrency = manager.read_rollout_env()
+        hosts = hosts or [(host, None) for host in planner.snapshot_hosts(args.offline)]
+    else:
+        target = _target()
+        if target is None:
+            return None
+        hosts, username, private_key, container_names, concurrency = target
+    image_url = _image_url(args)
+    if not image_url:
+        return None
+
+    timings = args.timings or os.path.join(manager.DEPLOY_METRICS_DIR or ".", "deploy_spans.jsonl")
+    durations = planner.load_durations(timings) if os.path.isfile(timings) else None
+    if args.offline:
+        # 离线时不访问镜像仓库，摘要只取自镜像引用 / Offline the registry is not asked, the digest only comes from the reference
+        image_digest = image_url.partition("@")[2] or None
+        results = manager.run_on_hosts(
+            planner.plan_offline,
+            hosts,
+            concurrency,
+            "计划",
+            args.offline,
+            container_names,
+            image_url,
+            image_digest,
+            durations,
+        )
+    else:
+        results = manager.run_on_hosts(
+            planner.plan_host,
+            hosts,
+            concurrency,
+            "计划",
+            username,
+            private_key,
+            container_names,
+            image_url,
+            manager.resolve_image_digest(image_url),
+            durations,
+            args.save,
+            connect,
+        )
+    for line in planner.render(results):
+        print(line)
+    print(
+        f"estimated ~{planner.rollout_estimate(results, manager.ROLLING_BATCH_SIZE, concurrency):.0f}s "
+        f"for {len(results)} host(s)" + ("" if durations else " (default phase durations)")
+    )
+    return results
+
+
+def cmd_prune(args, connect=None):
+    from . import manager
+
+    target = _target()
+    if target is None:
+        return None
+    hosts, username, private_key, container_names, concurrency = target
+    try:
+        return manager.run_on_hosts(
+            manager.prune_host,
+            hosts,
+            concurrency,
+            "清理",
+            username,
+            private_key,
+            args.image or os.getenv("IMAGE_URL"),
+            connect,
+        )
+    finally:
+        manager.export_timings()
+
+
+def cmd_push_env(args, connect=None):
+    from . import env_push, manager
+
+    target = _target()
+    if target is None:
+        return None
+    hosts, username, private_key, container_names, concurrency = target
+    # 内容只读入内存，不写临时文件 / The content is only read into memory, never into a temporary file
+    if args.source == "-":
+        data = sys.stdin.buffer.read()
+    else:
+        with open(args.source, "rb") as f:
+            data = f.read()
+    try:
+        return env_push.push_env(hosts, username, private_key, data, args.path, concurrency, connect)
+    finally:
+        manager.export_timings()
+
+
+COMMANDS = {
+    "deploy": cmd_deploy,
+    "rollback": cmd_rollback,
+    "plan": cmd_plan,
+    "prune": cmd_prune,
+    "push-env": cmd_push_env,
+}
+
+
+def run(argv=None, connect=None):
+    """
+    解析参数并执行子命令。
+    Parse the arguments and run the subcommand.
+
+    :param argv: 命令行参数 / Command line arguments
+    :param connect: 建立连接的函数，默认 remote_login；可注入模拟主机 / Connection factory, defaults to remote_login; lets a fake host be injected
+    :return: HostResult 列表，配置错误时为 None / List of HostResult, None on a configuration error
+    """
+    args = build_parser().parse_args(argv)
+    load_env()
+    configure_logging()
+    return COMMANDS[args.command](args, connect)
+
+
+def main(argv=None):
+    results = run(argv)
+    if results is None:
+        return 2
+    # 任一主机失败则以非零状态退出 / Exit non-zero if any host failed
+    return 1 if any(not result.ok for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
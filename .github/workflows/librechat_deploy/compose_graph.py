@@ -0,0 +1,225 @@
+import os
+import logging
+import functools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import timing
+
+# 读取 depends_on 的 compose 文件，以 "&" 分隔；不存在的文件会被忽略
+# Compose files whose depends_on is read, "&"-separated; missing files are ignored
+COMPOSE_FILES = [
+    path.strip()
+    for path in os.getenv("COMPOSE_FILES", "docker-compose.yml&deploy-compose.yml").split("&")
+    if path.strip()
+]
+
+# 为 false 时忽略依赖图，按 CONTAINER_NAMES 顺序依次重新创建；同一主机上同时重新创建的容器数上限（0 表示不限）
+# When false the graph is ignored and containers are recreated one by one in CONTAINER_NAMES order;
+# the most containers recreated at once on a host (0 means no limit)
+COMPOSE_ORDER = os.getenv("COMPOSE_ORDER", "true").lower() not in ("0", "false", "no")
+COMPOSE_MAX_PARALLEL = int(os.getenv("COMPOSE_MAX_PARALLEL") or 0)
+
+
+def service_dependencies(compose):
+    """
+    从一个 compose 文件中读取每个容器依赖的容器。
+    Read the containers each container depends on from one compose file.
+
+    :param compose: 解析后的 compose 文件 / Parsed compose file
+    :return: 容器名 -> 依赖的容器名集合；没有 container_name 的服务以服务名代替
+             / name -> set of names it depends on; services without a container_name go by their service name
+    """
+    services = (compose or {}).get("services") or {}
+    names = {service: (spec or {}).get("container_name") or service for service, spec in services.items()}
+    dependencies = {}
+    for service, spec in services.items():
+        # depends_on 可以是列表，也可以是带 condition 的映射 / depends_on is a list or a mapping with conditions
+        depends_on = (spec or {}).get("depends_on") or []
+        dependencies[names[service]] = {names.get(dependency, dependency) for dependency in depends_on}
+    return dependencies
+
+
+@functools.lru_cache(maxsize=4)
+def _load(paths, mtimes):
+    import yaml  # 只在读取 compose 文件时需要 / Only needed to read compose files
+
+    if not any(mtime is not None for mtime in mtimes):
+        return None
+    dependencies = {}
+    for path, mtime in zip(paths, mtimes):
+        if mtime is None:
+            continue
+        with open(path, encoding="utf-8") as f:
+            for name, depends_on in service_dependencies(yaml.safe_load(f)).items():
+                dependencies.setdefault(name, set()).update(depends_on)
+    return dependencies
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def load_dependencies(paths=None):
+    """
+    合并所有 compose 文件中的依赖关系。文件未修改时只解析一次。
+    Merge the dependencies of every compose file. Files are parsed only once until they change.
+
+    :param paths: compose 文件列表，默认 COMPOSE_FILES / Compose files, defaults to COMPOSE_FILES
+    :return: 容器名 -> 依赖的容器名集合；没有可读取的文件时为 None / name -> set of names it depends on; None when no file can be read
+    """
+    paths = tuple(COMPOSE_FILES if paths is None else paths)
+    try:
+        return _load(paths, tuple(_mtime(path) for path in paths))
+    except ImportError:
+        logging.warning("未安装 PyYAML，忽略 compose 依赖关系")  # PyYAML is not installed, ignoring compose dependencies
+    except Exception as e:
+        logging.warning(f"无法读取 compose 依赖关系：{e}")  # Could not read the compose dependencies
+    return None
+
+
+def dependency_graph(container_names, dependencies):
+    """
+    只保留 container_names 之间的依赖：经过列表之外的服务间接依赖的容器同样计入。
+    不属于任何 compose 服务的容器（如额外的副本）按 container_names 的顺序连成一条链，依次处理，不会同时停机。
+    Keep only the dependencies between container_names; a container reached through services
+    outside the list counts too. Containers that are not a compose service (such as extra
+    replicas) are chained in container_names order, so they are handled one by one and are never
+    down together.
+
+    :param container_names: 容器名称列表 / List of container names
+    :param dependencies: load_dependencies() 的结果 / Result of load_dependencies()
+    :return: 容器名 -> 需要先完成的容器名集合 / name -> set of names that must finish first
+    """
+    selected = set(container_names)
+    graph = {}
+    previous = None
+    for name in container_names:
+        if name not in dependencies:
+            graph[name] = {previous} if previous else set()
+            previous = name
+            continue
+        reached, stack = set(), list(dependencies.get(name, ()))
+        while stack:
+            dependency = stack.pop()
+            if dependency in reached:
+                continue
+            reached.add(dependency)
+            stack += dependencies.get(dependency, ())
+        graph[name] = (reached & selected) - {name}
+    return graph
+
+
+def build_graph(container_names, dependencies=None):
+    """
+    为要重新创建的容器构建依赖图。
+    Build the dependency graph of the containers to recreate.
+
+    :param container_names: 容器名称列表 / List of container names
+    :param dependencies: load_dependencies() 的结果，默认读取 COMPOSE_FILES / Result of load_dependencies(), defaults to reading COMPOSE_FILES
+    :return: 容器名 -> 需要先完成的容器名集合；无法读取 compose 文件或依赖关系成环时为 None，此时按原顺序依次处理
+             / name -> set of names that must finish first; None when the compose files cannot be read or
+             the dependencies form a cycle, in which case containers are handled one by one in their original order
+    """
+    dependencies = load_dependencies() if dependencies is None else dependencies
+    if dependencies is not None:
+        graph = dependency_graph(container_names, dependencies)
+        try:
+            levels(graph)
+            return graph
+        except ValueError as e:
+            logging.warning(f"{e}，按原顺序依次处理")  # Dependency cycle, handling them one by one in order
+    return None
+
+
+def levels(graph):
+    """
+    将依赖图分层：每层只依赖之前的层，层内保持 graph 的顺序。
+    Split the graph into levels: each level only depends on the earlier ones, and keeps the order of graph.
+
+    :param graph: dependency_graph() 的结果 / Result of dependency_graph()
+    :return: 容器名列表的列表 / List of lists of names
+    :raises ValueError: 依赖关系成环 / The dependencies form a cycle
+    """
+    done, result = set(), []
+    while len(done) < len(graph):
+        level = [name for name, needs in graph.items() if name not in done and needs <= done]
+        if not level:
+            raise ValueError(f"compose 依赖关系成环：{', '.join(sorted(set(graph) - done))}")
+        result.append(level)
+        done.update(level)
+    return result
+
+
+def order(graph):
+    """
+    依赖在前的容器顺序；成环时保持原顺序。
+    Container order with dependencies first; the original order is kept when there is a cycle.
+    """
+    try:
+        return [name for level in levels(graph) for name in level]
+    except ValueError as e:
+        logging.warning(f"{e}，按原顺序处理")  # Dependency cycle, keeping the original order
+        return list(graph)
+
+
+def critical_path(graph, seconds):
+    """
+    关键路径：依赖链上预计耗时之和最长的一条，即不限并行时重新创建全部容器所需的时间。
+    Critical path: the dependency chain with the longest expected total, which is how long
+    recreating every container takes with unlimited parallelism.
+
+    :param graph: dependency_graph() 的结果 / Result of dependency_graph()
+    :param seconds: 容器名 -> 预计耗时（秒）/ name -> expected seconds
+    :return: (秒, 容器名列表) / (seconds, list of names)
+    """
+    finish, previous = {}, {}
+    for name in order(graph):
+        # 成环时 order() 保持原顺序，尚未计算的依赖不计入 / With a cycle, dependencies not yet computed are left out
+        start, before = max(((finish[need], need) for need in graph[name] if need in finish), default=(0.0, None))
+        finish[name] = start + seconds.get(name, 0.0)
+        previous[name] = before
+    if not finish:
+        return 0.0, []
+    name = max(finish, key=finish.get)
+    total, path = finish[name], []
+    while name is not None:
+        path.append(name)
+        name = previous[name]
+    return total, path[::-1]
+
+
+def run_graph(graph, apply, max_parallel=None):
+    """
+    按依赖图执行：依赖全部成功后立即开始，互不依赖的容器并行。依赖失败的容器不会执行。
+    Run along the graph: a container starts as soon as all its dependencies succeeded, and
+    independent containers run in parallel. Containers whose dependency failed are not run.
+
+    :param graph: dependency_graph() 的结果 / Result of dependency_graph()
+    :param apply: 处理一个容器的函数，返回是否成功 / Function handling one container, returns whether it succeeded
+    :param max_parallel: 同时执行的上限，默认 COMPOSE_MAX_PARALLEL / Most run at once, defaults to COMPOSE_MAX_PARALLEL
+    :return: 容器名 -> 是否成功，未执行的为 None / name -> whether it succeeded, None if it was not run
+    """
+    max_parallel = COMPOSE_MAX_PARALLEL if max_parallel is None else max_parallel
+    outcome = {name: None for name in graph}
+    waiting = dict(graph)
+    running = {}
+    workers = max(1, min(max_parallel or len(graph), len(graph)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compose") as pool:
+        while waiting or running:
+            ready = [name for name, needs in waiting.items() if all(outcome[need] for need in needs)]
+            for name in ready[: workers - len(running)]:
+                del waiting[name]
+                running[pool.submit(timing.bind(apply), name)] = name
+            if not running:
+                break  # 剩下的容器都在等待失败的依赖 / Everything left waits on a failed dependency
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome[running.pop(future)] = future.result()
+    for name in waiting:
+        logging.error(
+            f"容器 {name} 的依赖未能更新，跳过：{', '.join(sorted(graph[name]))}"
+        )  # A dependency of the container failed, skipping
+    return outcome
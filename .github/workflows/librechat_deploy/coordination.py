@@ -0,0 +1,320 @@
+import os
+import json
+import shlex
+import socket
+import logging
+import secrets
+import threading
+from contextlib import contextmanager
+
+# 协调多次部署的 Redis 地址，格式与 REDIS_URI 相同（逗号分隔表示集群，rediss:// 表示 TLS）；为空时不协调
+# Redis coordinating concurrent deploys, in the REDIS_URI format (comma-separated for a cluster,
+# rediss:// for TLS); empty disables coordination
+DEPLOY_REDIS_URI = os.getenv("DEPLOY_REDIS_URI", "")
+DEPLOY_REDIS_CA = os.getenv("DEPLOY_REDIS_CA", "")  # TLS 的 CA 证书 / CA certificate for TLS
+DEPLOY_REDIS_USERNAME = os.getenv("DEPLOY_REDIS_USERNAME") or None
+DEPLOY_REDIS_PASSWORD = os.getenv("DEPLOY_REDIS_PASSWORD") or None
+DEPLOY_REDIS_PREFIX = os.getenv("DEPLOY_REDIS_PREFIX", "librechat-deploy")
+
+# 租约锁：粒度（"container" 每个容器一把锁，"host" 每台主机一把锁）、租期与等待获取的时间（秒）。
+# 持有期间每隔租期的三分之一续约一次
+# Lease lock: granularity ("container" locks each container, "host" the whole host), lease and wait
+# times in seconds. The lease is renewed every third of its length while held
+DEPLOY_LOCK_SCOPE = os.getenv("DEPLOY_LOCK_SCOPE", "container")
+DEPLOY_LOCK_TTL = float(os.getenv("DEPLOY_LOCK_TTL") or 60)
+DEPLOY_LOCK_WAIT = float(os.getenv("DEPLOY_LOCK_WAIT") or 600)
+
+# 共享缓存（容器 inspect 信息与镜像摘要）的有效期（秒），0 表示不缓存
+# TTL (seconds) of the shared cache of container inspect data and image digests, 0 disables it
+DEPLOY_CACHE_TTL = float(os.getenv("DEPLOY_CACHE_TTL") or 30)
+
+# 获取锁：锁空闲时递增主机的防护计数并以 "持有者:令牌" 占用锁，返回令牌
+# Acquire: when the lock is free, bump the host's fencing counter and take the lock as "owner:token", returning the token
+ACQUIRE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then return false end
+local token = redis.call('incr', KEYS[2])
+redis.call('set', KEYS[1], ARGV[1] .. ':' .. token, 'PX', ARGV[2])
+return token
+"""
+# 续约与释放只对仍由自己持有的锁生效 / Renewing and releasing only act on a lock still held by the caller
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then return 0 end
+return redis.call('pexpire', KEYS[1], ARGV[2])
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then return 0 end
+return redis.call('del', KEYS[1])
+"""
+
+# 在主机上检查防护令牌：小于已见过的最大令牌时拒绝（退出码 75），否则记录它。一行，可放入批处理脚本
+# Check a fencing token on the host: refuse it (exit status 75) when it is lower than the highest one
+# seen, otherwise record it. One line, so it fits a batch script line
+FENCE_SCRIPT = (
+    r"""d="$1/fence"; mkdir -p "$d" || exit 1; c=$(cat "$d/$2" 2>/dev/null || echo 0); """
+    r"""if [ "$3" -lt "$c" ]; then echo "stale fencing token $3 < $c" >&2; exit 75; fi; printf '%s\n' "$3" > "$d/$2";"""
+)
+
+# 本次运行的标识，写入锁的值 / Identity of this run, stored in the lock value
+OWNER = f"{socket.gethostname()}/{os.getpid()}/{secrets.token_hex(4)}"
+
+
+class LeaseError(RuntimeError):
+    """
+    无法获取或保持租约锁。
+    The lease lock could not be acquired or kept.
+    """
+
+
+_client = None
+_client_lock = threading.Lock()
+_held = {}  # 锁键 -> [令牌, 引用数, 续约线程, 停止事件] / lock key -> [token, references, renewer, stop event]
+_held_lock = threading.Lock()
+_cache_warned = False
+
+
+def enabled():
+    return bool(DEPLOY_REDIS_URI)
+
+
+def connect(uri=None):
+    """
+    连接 Redis：逗号分隔的多个地址视为集群。
+    Connect to Redis; several comma-separated addresses are treated as a cluster.
+
+    :param uri: Redis 地址，默认 DEPLOY_REDIS_URI / Redis address, defaults to DEPLOY_REDIS_URI
+    :return: Redis 或 RedisCluster 对象 / Redis or RedisCluster object
+    """
+    import redis  # 只在启用协调时需要 / Only needed when coordination is enabled
+    from redis.cluster import ClusterNode, RedisCluster
+
+    uris = [part.strip() for part in (uri or DEPLOY_REDIS_URI).split(",") if part.strip()]
+    options = {"username": DEPLOY_REDIS_USERNAME, "password": DEPLOY_REDIS_PASSWORD, "socket_timeout": 10}
+    if uris[0].startswith("rediss://") and DEPLOY_REDIS_CA:
+        options["ssl_ca_certs"] = DEPLOY_REDIS_CA
+    options = {key: value for key, value in options.items() if value is not None}
+    if len(uris) == 1:
+        return redis.Redis.from_url(uris[0], **options)
+    nodes = []
+    for part in uris:
+        address = part.split("://", 1)[-1].rsplit("@", 1)[-1].split("/", 1)[0]
+        host, _, port = address.rpartition(":")
+        nodes.append(ClusterNode(host, int(port)))
+    return RedisCluster(startup_nodes=nodes, ssl=uris[0].startswith("rediss://"), **options)
+
+
+def client():
+    """
+    共享的 Redis 连接，首次使用时建立。
+    The shared Redis connection, opened on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = connect()
+        return _client
+
+
+def _key(host, *parts):
+    # 同一主机的键使用相同的哈希标签，集群中落在同一个槽，脚本可同时访问
+    # Keys of one host share a hash tag so they land in one cluster slot and a script can touch them together
+    return ":".join([DEPLOY_REDIS_PREFIX, f"{{{host}}}", *parts])
+
+
+def lock_key(host, container_name):
+    if DEPLOY_LOCK_SCOPE == "host":
+        return _key(host, "lock")
+    return _key(host, "lock", container_name)
+
+
+def fence_key(host):
+    # 防护令牌按主机递增，两种粒度的令牌可以互相比较 / Tokens count up per host, so both granularities compare
+    return _key(host, "fence")
+
+
+def _renew(key, value, stop):
+    ttl = int(DEPLOY_LOCK_TTL * 1000)
+    while not stop.wait(DEPLOY_LOCK_TTL / 3):
+        try:
+            renewed = client().eval(RENEW_SCRIPT, 1, key, value, ttl)
+        except Exception as e:
+            renewed = False
+            logging.warning(f"续约 {key} 失败：{e}")  # Renewing the lease failed
+        if not renewed:
+            # 租约可能已被他人取得，之后的操作由主机上的防护令牌拒绝
+            # The lease may now belong to someone else; the fencing token on the host refuses later steps
+            logging.error(f"已失去租约 {key}")  # Lost the lease
+            return
+
+
+@contextmanager
+def lease(host, container_name, wait=None):
+    """
+    持有主机或容器的租约锁，返回防护令牌。同一次运行中对同一把锁的嵌套或并行获取共享一个租约。
+    未启用协调时直接返回 None。
+    Hold the lease lock of a host or container and yield its fencing token. Nested or parallel
+    acquisitions of the same lock within one run share a single lease. Yields None when
+    coordination is disabled.
+
+    :param host: 服务器地址 / Server address
+    :param container_name: 容器名称 / Container name
+    :param wait: 等待获取的时间（秒），默认 DEPLOY_LOCK_WAIT / Seconds to wait for it, defaults to DEPLOY_LOCK_WAIT
+    :raises LeaseError: 超时或无法访问 Redis / Timed out or Redis is unreachable
+    """
+    if not enabled():
+        yield None
+        return
+    key = lock_key(host, container_name)
+    with _held_lock:
+        entry = _held.get(key)
+        if entry is not None:
+            entry[1] += 1
+    if entry is None:
+        entry = _acquire(host, key, DEPLOY_LOCK_WAIT if wait is None else wait)
+    try:
+        yield entry[0]
+    finally:
+        _release(key, entry)
+
+
+def _acquire(host, key, wait):
+    ttl = int(DEPLOY_LOCK_TTL * 1000)
+    stop = threading.Event()
+    waited, delay = 0.0, 0.1
+    while True:
+        with _held_lock:
+            entry = _held.get(key)
+            if entry is not None:
+                # 等待期间同一次运行的其他线程已取得 / Another thread of this run took it meanwhile
+                entry[1] += 1
+                return entry
+            try:
+                token = client().eval(ACQUIRE_SCRIPT, 2, key, fence_key(host), OWNER, ttl)
+            except Exception as e:
+                raise LeaseError(f"无法获取租约 {key}：{e}") from e  # Could not acquire the lease
+            if token:
+                token = int(token)
+                renewer = threading.Thread(
+                    target=_renew, args=(key, f"{OWNER}:{token}", stop), name=f"lease {key}", daemon=True
+                )
+                entry = _held[key] = [token, 1, renewer, stop]
+                renewer.start()
+                logging.info(f"已取得租约 {key}，防护令牌 {token}")  # Lease acquired, fencing token
+                return entry
+        if waited >= wait:
+            # Timed out waiting for the lease
+            raise LeaseError(f"等待租约 {key} 超时（{wait:g}s），持有者：{_holder(key)}")
+        if not waited:
+            logging.info(
+                f"租约 {key} 由 {_holder(key)} 持有，等待中..."
+            )  # The lease is held by another run, waiting
+        stop.wait(delay)
+        waited += delay
+        delay = min(delay * 2, 2.0)
+
+
+def _holder(key):
+    try:
+        value = client().get(key)
+    except Exception:
+        return "?"
+    return value.decode().rpartition(":")[0] if value else "?"
+
+
+def _release(key, entry):
+    with _held_lock:
+        entry[1] -= 1
+        if entry[1]:
+            return
+        del _held[key]
+    token, _, renewer, stop = entry
+    stop.set()
+    renewer.join()
+    try:
+        client().eval(RELEASE_SCRIPT, 1, key, f"{OWNER}:{token}")
+    except Exception as e:
+        # 租约到期后自动释放 / The lease frees itself once it expires
+        logging.warning(f"释放租约 {key} 失败：{e}")  # Releasing the lease failed
+
+
+def current_token(host, container_name):
+    """
+    本次运行当前持有的防护令牌，没有持有时为 None。
+    The fencing token this run currently holds, None if it holds none.
+    """
+    with _held_lock:
+        entry = _held.get(lock_key(host, container_name))
+    return entry[0] if entry else None
+
+
+def fence_command(root, container_name, token):
+    """
+    生成在主机上检查防护令牌的命令，可放入批处理脚本或用 && 接在其他命令之前。
+    Build the command checking a fencing token on the host; it can go into a batch script or lead
+    other commands joined with &&.
+
+    :param root: 备份目录 / Backup directory
+    :param container_name: 容器名称 / Container name
+    :param token: 防护令牌 / Fencing token
+    :return: shell 命令 / Shell command
+    """
+    return shlex.join(["sh", "-c", FENCE_SCRIPT, "librechat-fence", root, container_name, str(token)])
+
+
+def _cache_failed(e):
+    global _cache_warned
+    if not _cache_warned:
+        _cache_warned = True
+        logging.warning(f"共享缓存不可用，直接查询：{e}")  # The shared cache is unavailable, querying directly
+
+
+def cache_get(host, kind, names):
+    """
+    读取共享缓存，缓存出错时视为未命中。
+    Read the shared cache; errors count as misses.
+
+    :param host: 服务器地址，None 表示不属于某台主机 / Server address, None for entries not tied to a host
+    :param kind: 类型，如 "inspect" / Kind, e.g. "inspect"
+    :param names: 名称列表 / List of names
+    :return: 名称 -> 值，只包含命中的 / name -> value, hits only
+    """
+    if not enabled() or not DEPLOY_CACHE_TTL or not names:
+        return {}
+    try:
+        values = client().mget([_key(host or "*", "cache", kind, name) for name in names])
+    except Exception as e:
+        _cache_failed(e)
+        return {}
+    return {name: json.loads(value) for name, value in zip(names, values) if value is not None}
+
+
+def cache_set(host, kind, values):
+    """
+    写入共享缓存，有效期为 DEPLOY_CACHE_TTL。
+    Write to the shared cache with a DEPLOY_CACHE_TTL expiry.
+
+    :param host: 服务器地址 / Server address
+    :param kind: 类型 / Kind
+    :param values: 名称 -> 值 / name -> value
+    """
+    if not enabled() or not DEPLOY_CACHE_TTL or not values:
+        return
+    try:
+        with client().pipeline(transaction=False) as pipe:
+            for name, value in values.items():
+                pipe.set(_key(host or "*", "cache", kind, name), json.dumps(value), px=int(DEPLOY_CACHE_TTL * 1000))
+            pipe.execute()
+    except Exception as e:
+        _cache_failed(e)
+
+
+def cache_delete(host, kind, names):
+    """
+    删除共享缓存中的条目，如容器重新创建后的 inspect 信息。
+    Drop entries from the shared cache, such as a container's inspect data once it is recreated.
+    """
+    if not enabled() or not DEPLOY_CACHE_TTL or not names:
+        return
+    try:
+        client().delete(*[_key(host or "*", "cache", kind, name) for name in names])
+    except Exception as e:
+        _cache_failed(e)
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import shlex
+import base64
+import logging
+import threading
+
+# 本地日志目录，每台主机一个 JSON lines 文件；为空时只在主机上记录
+# Local journal directory, one JSON lines file per host; empty means the journal is only kept on the hosts
+DEPLOY_JOURNAL_DIR = os.getenv("DEPLOY_JOURNAL_DIR", "")
+
+# 重新创建容器的步骤，按顺序；aborted 表示恢复时发现旧容器仍在原处
+# Steps of recreating a container, in order; aborted means recovery found the old container still in place
+STEPS = ("begin", "renamed", "removed", "created")
+FINISHED_STEPS = ("created", "aborted")
+
+# 在主机上追加一条日志；begin 开始新的日志，覆盖上一次的。日志包含 docker run 命令（含环境变量），只有所有者可读
+# Append one entry on the host; begin starts a fresh journal, replacing the previous one. The journal
+# holds the docker run command (environment included), so only its owner can read it. One line, so it fits a batch script line
+WRITE_SCRIPT = (
+    r"""umask 077; d="$1/journal"; mkdir -p "$d" || exit 1; """
+    r"""if [ "$2" = begin ]; then printf '%s\n' "$4" > "$d/$3.jsonl"; else printf '%s\n' "$4" >> "$d/$3.jsonl"; fi"""
+)
+
+# 输出主机上所有容器的日志 / Print the journals of every container on the host
+READ_SCRIPT = r"""cat "$1"/journal/*.jsonl 2>/dev/null; true"""
+
+_local_lock = threading.Lock()
+
+
+def write_command(root, container_name, step, **fields):
+    """
+    生成在主机上记录一个步骤的命令，可放入批处理脚本或用 && 接在其他命令之后。
+    Build the command recording a step on the host; it can go into a batch script or follow
+    another command with &&.
+
+    :param root: 备份目录 / Backup directory
+    :param container_name: 容器名称 / Container name
+    :param step: STEPS 或 FINISHED_STEPS 之一 / One of STEPS or FINISHED_STEPS
+    :return: shell 命令 / Shell command
+    """
+    entry = json.dumps(
+        {"container": container_name, "step": step, "time": time.time(), **fields},
+        separators=(",", ":"),
+    )
+    return shlex.join(["sh", "-c", WRITE_SCRIPT, "librechat-journal", root, step, container_name, entry])
+
+
+def read_command(root):
+    return shlex.join(["sh", "-c", READ_SCRIPT, "librechat-journal-read", root])
+
+
+def parse_journal(output):
+    """
+    解析主机上的日志，得到每个容器最后一个步骤的条目；begin 条目中的字段会合并到后续条目中。
+    Parse the host journal into the entry of each container's last step; the fields of the begin
+    entry are merged into the later ones.
+
+    :param output: read_command() 的输出 / Output of read_command()
+    :return: 容器名 -> 条目 / name -> entry
+    """
+    entries = {}
+    for line in output.splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue  # 写到一半的行 / A half-written line
+        name = entry.get("container")
+        if entry.get("step") == "begin" or name not in entries:
+            entries[name] = entry
+        else:
+            entries[name] = {**entries[name], **entry}
+    return entries
+
+
+def unfinished(entries):
+    """
+    未完成的容器：停在 created 之前的步骤。
+    Containers left unfinished: stopped at a step before created.
+    """
+    return {name: entry for name, entry in entries.items() if entry.get("step") not in FINISHED_STEPS}
+
+
+def encode_command(command):
+    return base64.b64encode(command.encode()).decode()
+
+
+def decode_command(entry):
+    return base64.b64decode(entry["command"]).decode() if entry.get("command") else None
+
+
+def record_local(host, container_name, step, directory=None, **fields):
+    """
+    在本地日志中记录一个步骤（不含 docker run 命令，避免环境变量落盘）。
+    Record a step in the local journal (without the docker run command, so the environment is not
+    written locally).
+
+    :param host: 服务器地址 / Server address
+    :param container_name: 容器名称 / Container name
+    :param step: 步骤 / Step
+    :param directory: 本地目录，默认 DEPLOY_JOURNAL_DIR / Local directory, defaults to DEPLOY_JOURNAL_DIR
+    """
+    directory = directory or DEPLOY_JOURNAL_DIR
+    if not directory:
+        return
+    fields.pop("command", None)
+    entry = {"host": host, "container": container_name, "step": step, "time": time.time(), **fields}
+    try:
+        with _local_lock:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f"{host or 'local'}.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+    except OSError as e:
+        logging.warning(f"无法写入本地部署日志：{e}")  # Could not write the local deploy journal
+
+
+def load_local(host, directory=None):
+    """
+    读取本地日志中某台主机每个容器的最后一个步骤。
+    Read the last step of each container of a host from the local journal.
+    """
+    directory = directory or DEPLOY_JOURNAL_DIR
+    path = os.path.join(directory, f"{host or 'local'}.jsonl") if directory else None
+    if not path or not os.path.isfile(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return parse_journal(f.read())
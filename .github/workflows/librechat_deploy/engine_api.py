@@ -0,0 +1,242 @@
+import json
+import http.client
+import threading
+from urllib.parse import quote, urlencode
+
+# 在远程主机上连接 Docker 守护进程套接字的命令，docker CLI 的 ssh:// 上下文也使用它
+# Command that connects to the Docker daemon socket on the remote host, also used by docker CLI ssh:// contexts
+DIAL_COMMAND = "docker system dial-stdio"
+
+# 不应从旧镜像继承到新容器的标签前缀 / Label prefixes that must not carry over from the old image
+IMAGE_LABEL_PREFIXES = ("org.opencontainers.image.", "org.label-schema.")
+
+
+class DockerAPIError(Exception):
+    """
+    Docker Engine API 返回错误状态码。
+    The Docker Engine API returned an error status.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class _ChannelConnection(http.client.HTTPConnection):
+    """
+    通过 SSH 通道（而不是 TCP 套接字）发送 HTTP 请求的连接。
+    HTTP connection that talks over an SSH channel instead of a TCP socket.
+    """
+
+    def __init__(self, open_channel):
+        super().__init__("docker")
+        self._open_channel = open_channel
+
+    def connect(self):
+        self.sock = self._open_channel()
+
+
+class EngineAPI:
+    """
+    通过 SSH 转发的 Docker Engine API 客户端。
+    每个线程使用独立的 HTTP keep-alive 连接，即一个 SSH 通道。
+    Docker Engine API client tunneled over SSH.
+    Each thread keeps its own HTTP keep-alive connection, i.e. one SSH channel.
+    """
+
+    def __init__(self, ssh, dial_command=DIAL_COMMAND):
+        """
+        :param ssh: SSHClient 对象 / SSHClient object
+        :param dial_command: 连接守护进程套接字的远程命令 / Remote command connecting to the daemon socket
+        """
+        self._ssh = ssh
+        self._dial_command = dial_command
+        self._local = threading.local()
+
+    def _open_channel(self):
+        channel = self._ssh.get_transport().open_session()
+        channel.exec_command(self._dial_command)
+        return channel
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = _ChannelConnection(self._open_channel)
+        return connection
+
+    def request(self, method, path, params=None, body=None):
+        """
+        发送 API 请求并返回解析后的响应。
+        Send an API request and return the decoded response.
+
+        :param method: HTTP 方法 / HTTP method
+        :param path: API 路径，如 /containers/json / API path
+        :param params: 查询参数 / Query parameters
+        :param body: JSON 请求体 / JSON request body
+        :return: (状态码, 响应数据) / (status, response data)
+        """
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError, EOFError):
+                # 连接被守护进程关闭时重连一次 / Reconnect once if the daemon dropped the connection
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+        text = data.decode(errors="replace")
+        if response.getheader("Content-Type", "").startswith("application/json") and text:
+            try:
+                return response.status, json.loads(text)
+            except ValueError:
+                pass  # 流式 JSON（如拉取进度）按文本返回 / Streamed JSON (pull progress) is returned as text
+        return response.status, text
+
+    def _call(self, method, path, params=None, body=None, allow=()):
+        status, data = self.request(method, path, params, body)
+        if status >= 400 and status not in allow:
+            message = data.get("message") if isinstance(data, dict) else data
+            raise DockerAPIError(status, message)
+        return status, data
+
+    def inspect_container(self, name):
+        """
+        :return: 容器信息，不存在时为 None / Container information, None if it does not exist
+        """
+        status, data = self._call("GET", f"/containers/{quote(name)}/json", allow=(404,))
+        return None if status == 404 else data
+
+    def list_container_names(self):
+        _, data = self._call("GET", "/containers/json", {"all": 1})
+        return [name.lstrip("/") for container in data for name in container["Names"]]
+
+    def create_container(self, name, spec):
+        """
+        :return: 新容器 ID / New container ID
+        """
+        _, data = self._call("POST", "/containers/create", {"name": name}, spec)
+        return data["Id"]
+
+    def start_container(self, name):
+        self._call("POST", f"/containers/{quote(name)}/start", allow=(304,))
+
+    def rename_container(self, name, new_name):
+        self._call("POST", f"/containers/{quote(name)}/rename", {"name": new_name})
+
+    def remove_container(self, name, force=True):
+        """
+        :return: 容器是否存在并已删除 / Whether the container existed and was removed
+        """
+        status, _ = self._call(
+            "DELETE", f"/containers/{quote(name)}", {"force": int(force)}, allow=(404,)
+        )
+        return status != 404
+
+    def connect_network(self, network, name, aliases=None):
+        self._call(
+            "POST",
+            f"/networks/{quote(network)}/connect",
+            body={"Container": name, "EndpointConfig": {"Aliases": aliases or []}},
+        )
+
+    def inspect_image(self, name):
+        """
+        :return: 镜像信息，不存在时为 None / Image information, None if it does not exist
+        """
+        status, data = self._call("GET", f"/images/{quote(name, safe='')}/json", allow=(404,))
+        return None if status == 404 else data
+
+    def pull_image(self, image_url):
+        """
+        拉取镜像；拉取进度以 JSON 流返回，其中的错误也会抛出。
+        Pull an image; progress comes back as a JSON stream whose errors are raised as well.
+
+        :param image_url: Docker 镜像 URL（可带 @摘要）/ Docker image URL, optionally @digest
+        :return: 拉取进度文本 / Pull progress text
+        """
+        _, data = self._call("POST", "/images/create", {"fromImage": image_url})
+        for line in str(data).splitlines():
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event.get("error"):
+                raise DockerAPIError(500, event["error"])
+        return data
+
+    def tag_image(self, source, repository, tag):
+        self._call(
+            "POST", f"/images/{quote(source, safe='')}/tag", {"repo": repository, "tag": tag}
+        )
+
+    def list_image_ids(self):
+        _, data = self._call("GET", "/images/json")
+        return [image["Id"] for image in data]
+
+    def list_container_image_ids(self):
+        _, data = self._call("GET", "/containers/json", {"all": 1})
+        return [container["ImageID"] for container in data]
+
+    def remove_image(self, name):
+        """
+        :return: 是否已删除（仍被使用或不存在时为 False）/ Whether it was removed (False if still in use or missing)
+        """
+        status, _ = self._call("DELETE", f"/images/{quote(name, safe='')}", allow=(404, 409))
+        return status < 400
+
+
+def container_spec(container_info, image_url, labels=None):
+    """
+    根据 docker inspect 信息生成 /containers/create 的请求体，HostConfig 原样复制。
+    Build a /containers/create body from docker inspect information, copying HostConfig verbatim.
+
+    :param container_info: docker inspect 信息 / docker inspect information
+    :param image_url: Docker 镜像 URL / Docker image URL
+    :param labels: 额外的容器标签 / Extra container labels
+    :return: (请求体, 创建后需额外连接的网络 {网络: 别名}) / (body, extra networks {network: aliases} to connect after create)
+    """
+    config = container_info["Config"]
+    host_config = dict(container_info.get("HostConfig") or {})
+    container_labels = {
+        key: value
+        for key, value in (config.get("Labels") or {}).items()
+        if not key.startswith(IMAGE_LABEL_PREFIXES)
+    }
+    container_labels.update(labels or {})
+
+    # 容器 ID 会作为别名自动出现，不应复制 / The container ID shows up as an alias automatically and must not be copied
+    container_id = container_info.get("Id", "")
+    networks = {}
+    for network_name, network in (
+        container_info.get("NetworkSettings", {}).get("Networks") or {}
+    ).items():
+        networks[network_name] = [
+            alias for alias in network.get("Aliases") or [] if not container_id.startswith(alias)
+        ]
+
+    # 旧版 API 创建时只接受一个网络，其余网络在创建后连接
+    # Older APIs accept a single network at create time, the rest are connected afterwards
+    primary = host_config.get("NetworkMode")
+    if primary not in networks:
+        primary = next(iter(networks), None)
+    endpoints = {primary: {"Aliases": networks.pop(primary)}} if primary else {}
+
+    spec = {
+        "Image": image_url,
+        "Env": config.get("Env") or [],
+        "Labels": container_labels,
+        "ExposedPorts": config.get("ExposedPorts") or {},
+        "Volumes": config.get("Volumes") or {},
+        "HostConfig": host_config,
+        "NetworkingConfig": {"EndpointsConfig": endpoints},
+    }
+    return spec, networks
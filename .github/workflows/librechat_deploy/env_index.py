@@ -0,0 +1,188 @@
+import os
+import re
+import hashlib
+import functools
+from dataclasses import dataclass
+
+# 列出所有受管理环境变量的模板（包括注释掉的可选变量）/ Template listing every managed variable, commented-out optional ones included
+ENV_EXAMPLE_PATH = os.getenv("ENV_EXAMPLE_PATH", ".env.example")
+
+# utils/update_env.py 渲染出的 env 文件，设置后部署会让容器的环境与之一致；为空时不比较环境
+# env file rendered by utils/update_env.py; when set, deploys bring the containers' environment in
+# line with it. Empty means the environment is not compared
+DEPLOY_ENV_FILE = os.getenv("DEPLOY_ENV_FILE", "")
+
+# 名称匹配时值被视为机密，日志与差异中只显示短哈希 / Values of matching names are secrets, shown only as a short hash
+SECRET_KEY_PATTERN = re.compile(
+    os.getenv("ENV_SECRET_PATTERN") or r"SECRET|PASSWORD|TOKEN|KEY|SALT|CREDENTIAL|PRIVATE|URI",
+    re.IGNORECASE,
+)
+
+# KEY=value 行，可带 "export" 前缀，也可以被注释掉 / KEY=value lines, optionally with "export", optionally commented out
+ENTRY_PATTERN = re.compile(r"^\s*(#\s*)?(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)\s*=(.*)$")
+
+
+@dataclass(frozen=True)
+class EnvIndex:
+    """
+    环境变量索引：受管理的键、其中的机密键，以及渲染结果中的期望值。
+    Environment index: the managed keys, which of them are secrets, and the desired values from the render.
+    """
+
+    keys: frozenset
+    secrets: frozenset
+    values: dict
+
+
+def parse_value(value):
+    """
+    按 docker compose env_file 的规则解析值：去掉成对的引号，否则去掉行内注释。
+    Parse a value the way docker compose reads an env_file: matching quotes are dropped, otherwise
+    an inline comment is.
+    """
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return re.split(r"\s+#", value, maxsplit=1)[0]
+
+
+def parse_env_lines(lines):
+    """
+    解析 env 文件。
+    Parse an env file.
+
+    :param lines: 文件的行 / Lines of the file
+    :return: (生效的值, 提到的所有键) / (effective values, every key mentioned)
+    """
+    values, mentioned = {}, set()
+    for line in lines:
+        match = ENTRY_PATTERN.match(line.rstrip("\n"))
+        if not match:
+            continue
+        commented, key, value = match.groups()
+        mentioned.add(key)
+        if not commented:
+            values[key] = parse_value(value)
+    return values, mentioned
+
+
+def is_secret(key):
+    return bool(SECRET_KEY_PATTERN.search(key))
+
+
+def mask(key, value):
+    """
+    机密的值替换为与 planner.redact() 相同格式的短哈希，其他值原样返回。
+    Replace a secret value with a short hash in the same format as planner.redact(); other values are returned as they are.
+    """
+    if value is None or not is_secret(key) or value.startswith("<sha256:"):
+        return value
+    return f"<sha256:{hashlib.sha256(value.encode()).hexdigest()[:12]}>"
+
+
+def _read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return f.readlines()
+
+
+@functools.lru_cache(maxsize=8)
+def _build_index(example_path, example_mtime, rendered_path, rendered_mtime):
+    _, keys = parse_env_lines(_read_lines(example_path)) if example_mtime is not None else ({}, set())
+    values, rendered_keys = parse_env_lines(_read_lines(rendered_path))
+    keys = frozenset(keys | rendered_keys)
+    return EnvIndex(keys=keys, secrets=frozenset(key for key in keys if is_secret(key)), values=values)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def load_index(rendered_path=None, example_path=None):
+    """
+    构建环境变量索引。同一对文件只解析一次，所有主机与容器共用；文件修改后重新解析。
+    Build the environment index. Each pair of files is parsed once and shared by every host and
+    container; it is parsed again after a file changes.
+
+    :param rendered_path: 渲染后的 env 文件，默认 DEPLOY_ENV_FILE / Rendered env file, defaults to DEPLOY_ENV_FILE
+    :param example_path: 模板，默认 ENV_EXAMPLE_PATH / Template, defaults to ENV_EXAMPLE_PATH
+    :return: EnvIndex，没有配置渲染文件时为 None / EnvIndex, None when no rendered file is configured
+    """
+    rendered_path = rendered_path or DEPLOY_ENV_FILE
+    if not rendered_path:
+        return None
+    example_path = example_path or ENV_EXAMPLE_PATH
+    return _build_index(example_path, _mtime(example_path), rendered_path, _mtime(rendered_path))
+
+
+def env_dict(env):
+    """
+    将 docker inspect 的 Env 列表转换为字典。
+    Turn a docker inspect Env list into a dictionary.
+    """
+    return dict(entry.partition("=")[::2] for entry in env or [])
+
+
+def _same(current, desired):
+    # 离线快照中的值已脱敏，与期望值的哈希比较 / Values in offline snapshots are redacted, compare with the desired value's hash
+    if current.startswith("<sha256:"):
+        return current == f"<sha256:{hashlib.sha256(desired.encode()).hexdigest()[:12]}>"
+    return current == desired
+
+
+def diff_env(index, container_env):
+    """
+    比较容器的环境与渲染结果，只比较受管理的键；机密的值已脱敏。
+    Compare a container's environment with the render, over the managed keys only; secret values are masked.
+
+    :param index: EnvIndex 对象 / EnvIndex object
+    :param container_env: 容器的 Config.Env 列表 / The container's Config.Env list
+    :return: {"added": {键: 值}, "removed": {键: 值}, "changed": {键: (旧值, 新值)}}
+             / {"added": {key: value}, "removed": {key: value}, "changed": {key: (old, new)}}
+    """
+    current = env_dict(container_env)
+    diff = {"added": {}, "removed": {}, "changed": {}}
+    for key in sorted(index.keys):
+        if key in index.values and key not in current:
+            diff["added"][key] = mask(key, index.values[key])
+        elif key in current and key not in index.values:
+            diff["removed"][key] = mask(key, current[key])
+        elif key in current and not _same(current[key], index.values[key]):
+            diff["changed"][key] = (mask(key, current[key]), mask(key, index.values[key]))
+    return diff
+
+
+def target_env(index, container_env):
+    """
+    容器重新创建后应有的 Env 列表：受管理的键取渲染结果中的值，新增的键追加在末尾。
+    渲染结果中没有的键保留原值，因为 compose 的 environment 等其他来源也可能设置它们。
+    The Env list the recreated container should have: managed keys take the rendered values and
+    added keys are appended. Keys missing from the render keep their value, since other sources
+    such as the compose environment may set them too.
+
+    :param index: EnvIndex 对象 / EnvIndex object
+    :param container_env: 容器的 Config.Env 列表 / The container's Config.Env list
+    :return: 新的 Env 列表 / New Env list
+    """
+    env, seen = [], set()
+    for entry in container_env or []:
+        key, _, value = entry.partition("=")
+        seen.add(key)
+        if key in index.keys and key in index.values and not _same(value, index.values[key]):
+            entry = f"{key}={index.values[key]}"
+        env.append(entry)
+    env += [f"{key}={value}" for key, value in index.values.items() if key in index.keys and key not in seen]
+    return env
+
+
+def describe(diff):
+    """
+    将 diff_env() 的结果格式化为一行。
+    Format the result of diff_env() as one line.
+    """
+    parts = [f"+{key}={value}" for key, value in diff["added"].items()]
+    parts += [f"~{key}: {old} -> {new}" for key, (old, new) in diff["changed"].items()]
+    parts += [f"-{key} (kept)" for key in diff["removed"]]
+    return ", ".join(parts)
@@ -0,0 +1,116 @@
+import os
+import stat
+import hashlib
+import logging
+import secrets
+
+from . import manager, timing
+
+# 主机上 env 文件的路径，相对路径以登录用户的主目录为起点 / Path of the env file on the hosts, relative paths start at the login user's home
+ENV_PUSH_PATH = os.getenv("ENV_PUSH_PATH", "")
+ENV_PUSH_MODE = 0o600  # 新文件的权限，已有文件保留原权限 / Mode of a new file, an existing file keeps its own
+
+
+def remote_digest(sftp, remote_path, size):
+    """
+    远程文件的 SHA-256；大小不同时不读取内容，直接视为不同。
+    SHA-256 of the remote file; when its size differs the content is not read and it counts as different.
+
+    :param sftp: SFTPClient 对象 / SFTPClient object
+    :param remote_path: 远程路径 / Remote path
+    :param size: 新内容的大小 / Size of the new content
+    :return: (摘要或 None, 文件属性或 None) / (digest or None, file attributes or None)
+    """
+    try:
+        attributes = sftp.stat(remote_path)
+    except FileNotFoundError:
+        return None, None
+    if attributes.st_size != size:
+        return None, attributes
+    with sftp.file(remote_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest(), attributes
+
+
+def push_file(sftp, remote_path, data):
+    """
+    将内存中的内容写入远程文件：内容相同时跳过；否则先写入同目录的临时文件，再原子地重命名覆盖。
+    Write in-memory content to a remote file: skipped when the content is the same, otherwise
+    written to a temporary file in the same directory and atomically renamed over the target.
+
+    :param sftp: SFTPClient 对象 / SFTPClient object
+    :param remote_path: 远程路径 / Remote path
+    :param data: 文件内容 / File content
+    :return: 是否写入 / Whether it was written
+    """
+    digest, attributes = remote_digest(sftp, remote_path, len(data))
+    if digest == hashlib.sha256(data).hexdigest():
+        return False
+    temp_path = f"{remote_path}.{secrets.token_hex(4)}.tmp"
+    try:
+        with sftp.file(temp_path, "wb") as f:
+            f.set_pipelined(True)  # 不逐块等待确认 / Do not wait for an acknowledgement per chunk
+            f.write(data)
+        sftp.chmod(temp_path, stat.S_IMODE(attributes.st_mode) if attributes else ENV_PUSH_MODE)
+        # posix-rename 覆盖已有文件，普通 SFTP rename 不会 / posix-rename replaces an existing file, plain SFTP rename does not
+        sftp.posix_rename(temp_path, remote_path)
+    except BaseException:
+        try:
+            sftp.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+@timing.timed("push_env", host="host")
+def push_env_host(host, port, username, private_key, data, remote_path, connect=None):
+    """
+    通过一个 SFTP 会话将 env 内容推送到单台主机。
+    Push the env content to a single host over one SFTP session.
+
+    :param host: 服务器地址 / Server address
+    :param port: SSH 端口 / SSH port
+    :param username: 登录用户名 / Login username
+    :param private_key: 私钥 / Private key
+    :param data: env 文件内容 / env file content
+    :param remote_path: 远程路径 / Remote path
+    :param connect: 建立连接的函数，默认 remote_login / Connection factory, defaults to remote_login
+    :return: HostResult 对象 / HostResult object
+    """
+
+    def push(result):
+        ssh = (connect or manager.remote_login)(host, username, port, private_key)
+        try:
+            with ssh.open_sftp() as sftp:
+                written = push_file(sftp, remote_path, data)
+            result.containers[remote_path] = "written" if written else "unchanged"
+            result.ok = True
+        finally:
+            ssh.close()
+
+    return manager.host_task(host, push)
+
+
+def push_env(hosts, username, private_key, data, remote_path=None, concurrency=None, connect=None):
+    """
+    并发地将同一份 env 内容推送到所有主机，内容只在内存中，不落盘。
+    Push the same env content to all hosts concurrently; it only ever lives in memory.
+
+    :param hosts: (主机, 端口) 列表 / List of (host, port)
+    :param username: 登录用户名 / Login username
+    :param private_key: 私钥 / Private key
+    :param data: env 文件内容 / env file content
+    :param remote_path: 远程路径，默认 ENV_PUSH_PATH / Remote path, defaults to ENV_PUSH_PATH
+    :param concurrency: 同时处理的主机数上限 / Max hosts in flight
+    :param connect: 建立连接的函数，默认 remote_login / Connection factory, defaults to remote_login
+    :return: HostResult 列表，未设置路径时为 None / HostResult list, None if no path is set
+    """
+    remote_path = remote_path or ENV_PUSH_PATH
+    if not remote_path:
+        logging.error("错误：未设置 ENV_PUSH_PATH")  # Error: ENV_PUSH_PATH is not set
+        return None
+    if isinstance(data, str):
+        data = data.encode()
+    return manager.run_on_hosts(
+        push_env_host, hosts, concurrency, "推送", username, private_key, data, remote_path, connect
+    )
@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import shlex
+import hashlib
+import logging
+import tarfile
+
+from .remote import run_command
+
+# 是否在传输中省略目标主机已有的层 / Whether layers the target already has are left out of the stream
+FANOUT_SKIP_LAYERS = os.getenv("IMAGE_FANOUT_SKIP_LAYERS", "true").lower() not in ("0", "false", "no")
+FANOUT_CHUNK_SIZE = 1 << 20  # 每次读写的字节数，也是内存占用的上限 / Bytes per read and write, also the memory bound
+
+# 一次往返内列出主机上每个镜像的 ID 与层 / List the ID and layers of every image on the host in one round trip
+LAYERS_COMMAND = (
+    "docker image ls -q --no-trunc | xargs -r "
+    "docker image inspect --format '{{.Id}} {{json .RootFS.Layers}}'"
+)
+
+# docker load 载入的镜像没有 RepoDigests，其仓库摘要按镜像 ID 记录在主机的 $1/digests 下
+# An image brought in by docker load has no RepoDigests, so its repository digest is recorded by image ID under $1/digests on the host
+RECORD_DIGEST_SCRIPT = r"""set -e
+mkdir -p "$1/digests"
+printf '%s\n' "$3" > "$1/digests/${2#sha256:}"
+"""
+
+# 输出镜像的 ID、RepoDigests 与记录的仓库摘要，每行一个 / Print the image ID, its RepoDigests and the recorded repository digest, one per line
+DIGESTS_SCRIPT = r"""i=$(docker image inspect --format '{{.Id}}{{range .RepoDigests}} {{.}}{{end}}' "$2") || exit 1
+id=${i%% *}; printf '%s\n' $i; cat "$1/digests/${id#sha256:}" 2>/dev/null; true"""
+
+
+def parse_layers(output):
+    """
+    解析 "ID 层列表JSON" 格式的输出。
+    Parse output in the "ID layer-list-JSON" format.
+
+    :param output: 命令输出 / Command output
+    :return: 镜像 ID -> 层 diff ID 列表 / Image ID -> list of layer diff IDs
+    """
+    images = {}
+    for line in output.splitlines():
+        image_id, _, layers = line.strip().partition(" ")
+        if image_id:
+            images[image_id] = json.loads(layers or "null") or []
+    return images
+
+
+def image_layers(ssh, reference):
+    """
+    获取主机上某个镜像的 ID 与层。
+    Get the ID and layers of an image on the host.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param reference: 镜像引用 / Image reference
+    :return: (镜像 ID, 层列表)，镜像不存在时为 None / (image ID, layers), None if the image is not present
+    """
+    status, out, _ = run_command(
+        ssh,
+        "docker image inspect --format '{{.Id}} {{json .RootFS.Layers}}' " + shlex.quote(reference),
+    )
+    images = parse_layers(out) if status == 0 else {}
+    return next(iter(images.items()), None)
+
+
+def record_digest_command(root, image_id, repo_digest):
+    """
+    生成在主机上记录 docker load 所载入镜像的仓库摘要的命令。
+    Build the command recording the repository digest of an image brought in by docker load.
+
+    :param root: 备份目录 / Backup directory
+    :param image_id: 镜像 ID / Image ID
+    :param repo_digest: 仓库摘要，如 happyclo/librechat@sha256:... / Repository digest, e.g. happyclo/librechat@sha256:...
+    :return: shell 命令 / Shell command
+    """
+    return shlex.join(["sh", "-c", RECORD_DIGEST_SCRIPT, "librechat-digest-record", root, image_id, repo_digest])
+
+
+def digests_command(root, reference):
+    """
+    生成输出镜像仓库摘要的命令，包括 record_digest_command() 记录的摘要；镜像不存在时失败。
+    Build the command printing the repository digests of an image, including the one recorded by
+    record_digest_command(); it fails when the image is not present.
+
+    :param root: 备份目录 / Backup directory
+    :param reference: 镜像引用 / Image reference
+    :return: shell 命令 / Shell command
+    """
+    return shlex.join(["sh", "-c", DIGESTS_SCRIPT, "librechat-digests", root, reference])
+
+
+def local_images(ssh):
+    """
+    列出主机上所有镜像的层。
+    List the layers of every image on the host.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :return: 镜像 ID -> 层列表 / Image ID -> list of layers
+    """
+    status, out, err = run_command(ssh, LAYERS_COMMAND)
+    if status != 0:
+        logging.warning(f"无法列出镜像的层：{err.strip()}")  # Could not list the image layers
+        return {}
+    return parse_layers(out)
+
+
+def chain_ids(layers):
+    """
+    按 Docker 的规则计算层的 chain ID：一个层只有在其下所有层都相同时才能复用。
+    Compute the chain IDs of the layers the way Docker does: a layer can only be reused when
+    every layer below it is the same too.
+
+    :param layers: 层 diff ID 列表，从底层开始 / List of layer diff IDs, bottom first
+    :return: chain ID 列表 / List of chain IDs
+    """
+    chains = []
+    for layer in layers:
+        chain = (
+            "sha256:" + hashlib.sha256(f"{chains[-1]} {layer}".encode()).hexdigest()
+            if chains
+            else layer
+        )
+        chains.append(chain)
+    return chains
+
+
+def skippable_layers(layers, images):
+    """
+    找出目标主机已有的层，docker load 遇到已存在的 chain 时不会读取对应的层文件。
+    Find the layers the target already has; docker load does not read a layer file whose chain
+    already exists.
+
+    :param layers: 要传输镜像的层 / Layers of the image being sent
+    :param images: 目标主机上的镜像，local_images() 的结果 / Images on the target, as returned by local_images()
+    :return: 可以省略的层 diff ID 集合 / Set of layer diff IDs that can be left out
+    """
+    present = {chain for image_layers in images.values() for chain in chain_ids(image_layers)}
+    return {layer for layer, chain in zip(layers, chain_ids(layers)) if chain in present}
+
+
+def layer_of(member_name):
+    """
+    由 docker save 输出中的文件名得到层的 diff ID；只有 OCI 格式（Docker 25+）的 blobs/sha256/<摘要> 能对应。
+    Map a file name in the docker save output to its layer diff ID; only the OCI layout
+    (Docker 25+) blobs/sha256/<digest> names can be mapped.
+    """
+    if member_name.startswith("blobs/sha256/"):
+        return "sha256:" + member_name.rpartition("/")[2]
+    return None
+
+
+def _exit_error(stdout, stderr):
+    """
+    已退出且失败的远程命令的错误信息；仍在运行或成功时为 None。
+    Error message of a remote command that exited with a failure; None while running or on success.
+    """
+    channel = stdout.channel
+    if not channel.exit_status_ready() or channel.recv_exit_status() == 0:
+        return None
+    return stderr.read().decode().strip() or f"exit status {channel.recv_exit_status()}"
+
+
+class _Reader:
+    """
+    统计读取字节数的文件包装。
+    File wrapper counting the bytes read.
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self.bytes += len(data)
+        return data
+
+
+class _ChannelWriter:
+    """
+    直接写入 SSH 通道的文件包装，统计写入字节数；通道窗口满时 sendall 阻塞，形成背压。
+    File wrapper writing straight into an SSH channel and counting the bytes; sendall blocks while
+    the channel window is full, which is the back-pressure.
+    """
+
+    def __init__(self, channel):
+        self._channel = channel
+        self.bytes = 0
+
+    def write(self, data):
+        self._channel.sendall(data)
+        self.bytes += len(data)
+        return len(data)
+
+
+def stream_image(source_ssh, target_ssh, reference, skip=()):
+    """
+    以 docker save | docker load 将镜像从源主机传到目标主机：两个 SSH 通道之间逐块转发 tar 流，
+    不落盘，内存中最多保留一块；skip 中的层不发送给目标主机（仍需从源主机读出）。
+    Send the image from the source host to the target host as docker save | docker load: the tar
+    stream is relayed chunk by chunk between the two SSH channels, never written to disk and never
+    held in memory beyond one chunk; layers in skip are not sent to the target (they are still read
+    from the source).
+
+    :param source_ssh: 源主机的 SSHClient / SSHClient of the source host
+    :param target_ssh: 目标主机的 SSHClient / SSHClient of the target host
+    :param reference: 镜像引用 / Image reference
+    :param skip: 省略的层 diff ID / Layer diff IDs to leave out
+    :return: 传输报告字典 / Transfer report dictionary
+    """
+    report = {
+        "ok": False,
+        "present": False,
+        "read": 0,
+        "sent": 0,
+        "skipped_layers": 0,
+        "skipped_bytes": 0,
+        "error": None,
+    }
+    started = time.monotonic()
+    _, source_out, source_err = source_ssh.exec_command("docker save " + shlex.quote(reference))
+    _, target_out, target_err = target_ssh.exec_command("docker load")
+    source = _Reader(source_out)
+    target = _ChannelWriter(target_out.channel)
+    try:
+        with tarfile.open(fileobj=source, mode="r|", bufsize=FANOUT_CHUNK_SIZE) as tar_in, tarfile.open(
+            fileobj=target, mode="w|", bufsize=FANOUT_CHUNK_SIZE
+        ) as tar_out:
+            tar_out.copybufsize = FANOUT_CHUNK_SIZE
+            for member in tar_in:
+                if member.isfile() and layer_of(member.name) in skip:
+                    # 未读取的数据由 tarfile 在读下一个成员时跳过 / tarfile skips the unread data when reading the next member
+                    report["skipped_layers"] += 1
+                    report["skipped_bytes"] += member.size
+                    continue
+                tar_out.addfile(member, tar_in.extractfile(member) if member.isfile() else None)
+        target_out.channel.shutdown_write()
+        # 等待两端退出 / Wait for both ends to exit
+        source_out.channel.recv_exit_status()
+        target_out.channel.recv_exit_status()
+        report["error"] = _exit_error(source_out, source_err) or _exit_error(target_out, target_err)
+        report["ok"] = report["error"] is None
+    except (tarfile.TarError, OSError, EOFError) as e:
+        # 一端提前退出时，它的错误输出比 tar 的错误更有用 / When one end exits early its stderr says more than the tar error
+        report["error"] = _exit_error(source_out, source_err) or _exit_error(target_out, target_err) or str(e)
+    finally:
+        source_out.channel.close()
+        target_out.channel.close()
+    report["read"] = source.bytes
+    report["sent"] = target.bytes
+    report["seconds"] = time.monotonic() - started
+    return report
+
+
+def transfer(source_ssh, target_ssh, reference, image):
+    """
+    将镜像传给一台目标主机：目标已有该镜像时跳过，否则省略已有的层；省略层后加载失败
+    （例如使用 containerd 镜像存储时）则完整重传一次。
+    Send the image to one target host: skipped when the target already has the image, otherwise
+    the layers it has are left out; if the load fails with layers left out (e.g. with the containerd
+    image store) the full stream is sent once more.
+
+    :param source_ssh: 源主机的 SSHClient / SSHClient of the source host
+    :param target_ssh: 目标主机的 SSHClient / SSHClient of the target host
+    :param reference: 镜像引用 / Image reference
+    :param image: (镜像 ID, 层列表)，image_layers() 的结果 / (image ID, layers), as returned by image_layers()
+    :return: 传输报告字典 / Transfer report dictionary
+    """
+    image_id, layers = image
+    images = local_images(target_ssh)
+    if image_id in images:
+        return {
+            "ok": True,
+            "present": True,
+            "read": 0,
+            "sent": 0,
+            "skipped_layers": len(layers),
+            "skipped_bytes": 0,
+            "seconds": 0.0,
+            "error": None,
+        }
+    skip = skippable_layers(layers, images) if FANOUT_SKIP_LAYERS else set()
+    report = stream_image(source_ssh, target_ssh, reference, skip)
+    if not report["ok"] and skip:
+        logging.warning(
+            f"省略已有层后加载失败（{report['error']}），重新完整传输"
+        )  # Loading with layers left out failed, sending the full stream
+        report = stream_image(source_ssh, target_ssh, reference)
+    return report
@@ -0,0 +1,106 @@
+import os
+
+# 每个仓库保留的最近镜像版本数 / Most recent image versions kept per repository
+IMAGE_RETENTION = int(os.getenv("IMAGE_RETENTION") or 3)
+
+# Docker 数据目录所在磁盘的使用率（百分比）超过此值才删除镜像，0 表示总是清理
+# Images are only removed once the disk holding the Docker data root is fuller than this percentage, 0 always cleans up
+IMAGE_PRUNE_THRESHOLD = float(os.getenv("IMAGE_PRUNE_THRESHOLD") or 80)
+DOCKER_ROOT = os.getenv("DOCKER_ROOT", "/var/lib/docker")
+
+
+def repository_of(reference):
+    """
+    去掉镜像引用中的标签或摘要，得到仓库名。
+    Strip the tag or digest from an image reference, leaving the repository.
+    """
+    name = reference.partition("@")[0]
+    if ":" in name.rpartition("/")[2]:
+        name = name.rpartition(":")[0]
+    return name
+
+
+def image_matches(image, reference):
+    """
+    判断镜像引用（标签、摘要或长短 ID）是否指向该镜像。
+    Whether an image reference (tag, digest or full / short ID) points at the image.
+    """
+    tags = image.get("RepoTags") or []
+    if reference in tags or f"{reference}:latest" in tags or reference in (image.get("RepoDigests") or []):
+        return True
+    if reference.startswith("sha256:"):
+        return image["Id"] == reference
+    # docker ps 对已失去标签的镜像显示短 ID / docker ps shows a short ID for images that lost their tag
+    return len(reference) >= 12 and image["Id"].partition(":")[2].startswith(reference)
+
+
+def parse_df(output):
+    """
+    解析 df -P 的输出。
+    Parse the output of df -P.
+
+    :return: (已用字节, 总字节, 使用率百分比)，无法解析时为 None / (used bytes, total bytes, percent used), None if unparsable
+    """
+    lines = output.strip().splitlines()
+    if len(lines) < 2:
+        return None
+    fields = lines[-1].split()
+    try:
+        total, used = int(fields[1]) * 1024, int(fields[2]) * 1024
+    except (IndexError, ValueError):
+        return None
+    return used, total, (100.0 * used / total if total else 0.0)
+
+
+def select_images(images, in_use, protected, repositories, keep=None):
+    """
+    根据保留策略选择要删除的镜像：容器正在使用的镜像、备份引用的镜像，以及 repositories 中每个仓库
+    最近的 keep 个版本都会保留，其余镜像可以删除。
+    Apply the retention policy: images used by a container, images referenced by a backup and the
+    keep most recent versions of each repository in repositories are kept, everything else may go.
+
+    :param images: docker image inspect 信息列表 / List of docker image inspect information
+    :param in_use: 容器使用的镜像引用 / Image references used by containers
+    :param protected: 备份引用的镜像 ID / Image IDs referenced by backups
+    :param repositories: 需要保留历史版本的仓库 / Repositories whose recent versions are kept
+    :param keep: 每个仓库保留的版本数，默认 IMAGE_RETENTION / Versions kept per repository, defaults to IMAGE_RETENTION
+    :return: (保留 {镜像 ID: 原因}, 可删除的镜像列表) / (kept {image ID: reason}, removable images)
+    """
+    keep = IMAGE_RETENTION if keep is None else keep
+    kept = {}
+    for image in images:
+        if any(image_matches(image, reference) for reference in in_use):
+            kept[image["Id"]] = "in use"
+        elif image["Id"] in protected:
+            kept[image["Id"]] = "backup"
+
+    for repository in repositories:
+        versions = sorted(
+            (
+                image
+                for image in images
+                if any(
+                    repository_of(reference) == repository
+                    for reference in (image.get("RepoTags") or []) + (image.get("RepoDigests") or [])
+                )
+            ),
+            key=lambda image: image.get("Created") or "",
+            reverse=True,
+        )
+        for image in versions[:keep]:
+            kept.setdefault(image["Id"], "recent")
+
+    return kept, [image for image in images if image["Id"] not in kept]
+
+
+def layer_report(images, kept_ids, removed_ids):
+    """
+    统计保留的层数，以及已删除镜像中因与保留镜像共享而保留下来的层数。
+    Count the layers kept, and how many layers of the removed images survive because a kept image shares them.
+
+    :return: (保留的层数, 共享的层数) / (layers kept, shared layers)
+    """
+    layers = {image["Id"]: set((image.get("RootFS") or {}).get("Layers") or []) for image in images}
+    kept_layers = set().union(*(layers[image_id] for image_id in kept_ids if image_id in layers))
+    removed_layers = set().union(*(layers[image_id] for image_id in removed_ids if image_id in layers))
+    return len(kept_layers), len(kept_layers & removed_layers)
@@ -0,0 +1,2612 @@
+import os
+import json
+import time
+import threading
+import re
+import shlex
+import secrets
+import weakref
+import collections
+from io import StringIO
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import logging
+
+from . import backup_store, canary, compose_graph, coordination, deploy_journal, env_index, image_fanout, image_retention, timing
+from .engine_api import DockerAPIError, EngineAPI, container_spec
+from .release_manifest import fetch_manifest
+from .remote import run_command
+
+# paramiko 与 requests 只在需要连接主机或访问网络时才导入，环境变量由命令行入口在导入本模块前加载
+# paramiko and requests are only imported once a host or the network is contacted; the command line
+# entry point loads the environment before this module is imported
+
+# 等待旧容器删除、新容器就绪的超时时间（秒）
+# Timeouts (seconds) for the old container to disappear and the new one to become ready
+CONTAINER_REMOVE_TIMEOUT = float(os.getenv("CONTAINER_REMOVE_TIMEOUT") or 30)
+CONTAINER_READY_TIMEOUT = float(os.getenv("CONTAINER_READY_TIMEOUT") or 120)
+
+# 蓝绿部署：以 "&" 分隔的容器名称（"*" 表示全部），新容器的端口偏移量与健康检查路径
+# Blue/green: "&"-separated container names ("*" for all), host port offset of the new slot and probe path
+BLUE_GREEN_CONTAINERS = [
+    name.strip() for name in os.getenv("BLUE_GREEN_CONTAINERS", "").split("&") if name.strip()
+]
+BLUE_GREEN_PORT_OFFSET = int(os.getenv("BLUE_GREEN_PORT_OFFSET") or 1)
+HEALTH_PROBE_PATH = os.getenv("HEALTH_PROBE_PATH", "/health")
+SLOT_LABEL = "librechat.deploy.slot"  # 记录容器所在槽位的标签 / Label recording the container's slot
+ROLLED_BACK = "rolled back"  # 已回滚容器的状态 / Status of a container that was rolled back
+SKIPPED = "skipped"  # 已是目标版本、无需重新创建的容器的状态 / Status of a container already at the target
+
+# Docker 后端："cli" 在远程执行 docker 命令，"api" 通过 SSH 转发调用 Docker Engine API
+# Docker backend: "cli" runs docker commands remotely, "api" calls the Docker Engine API tunneled over SSH
+DOCKER_BACKEND = os.getenv("DOCKER_BACKEND", "cli")
+
+# 为 false 时不向镜像仓库查询摘要，始终按标签拉取 / When false, never ask the registry for a digest and pull by tag
+RESOLVE_IMAGE_DIGEST = os.getenv("RESOLVE_IMAGE_DIGEST", "true").lower() not in ("0", "false", "no")
+
+# 为 true 时即使容器与目标一致也重新创建 / When true, recreate containers even if they already match the target
+FORCE_RECREATE = os.getenv("FORCE_RECREATE", "").lower() in ("1", "true", "yes")
+
+# 为 true 时先更新一个容器作为金丝雀，与旧版本比较延迟与错误率后再继续，超出阈值则自动回滚（阈值见 canary 模块）
+# When true, one container is updated first as a canary and compared with the old version's latency and
+# error rate before the rollout continues; it is rolled back automatically beyond the limits (see the canary module)
+CANARY = os.getenv("CANARY", "").lower() in ("1", "true", "yes")
+
+# 为 true 时只在第一台主机上拉取镜像，再经 SSH 点对点传给其他主机
+# When true, only the first host pulls the image and it is passed on to the other hosts over SSH
+IMAGE_FANOUT = os.getenv("IMAGE_FANOUT", "").lower() in ("1", "true", "yes")
+
+# 发布清单 API 地址与本地缓存有效期（秒）/ Release manifest API and local cache TTL in seconds
+RELEASE_API_URL = os.getenv("RELEASE_API_URL", "https://api-us.hapx.one/lc")
+RELEASE_CACHE_TTL = float(os.getenv("RELEASE_CACHE_TTL") or 300)
+
+# 滚动更新：每批更新的容器数（0 表示每台主机依次更新全部容器）、同时不可用的容器数上限（0 表示与批大小相同），
+# 以及批次之间的健康检查是否额外做 HTTP 探测、通过检查前需保持运行的时间（秒）
+# Rolling update: containers per batch (0 updates every container of a host in turn), the most containers
+# allowed down at once (0 means the batch size), whether the gate between batches also probes HTTP,
+# and how long (seconds) a batch must stay up before it passes the gate
+ROLLING_BATCH_SIZE = int(os.getenv("ROLLING_BATCH_SIZE") or 0)
+ROLLING_MAX_UNAVAILABLE = int(os.getenv("ROLLING_MAX_UNAVAILABLE") or 0)
+ROLLING_HEALTH_PROBE = os.getenv("ROLLING_HEALTH_PROBE", "").lower() in ("1", "true", "yes")
+ROLLING_GATE_DELAY = float(os.getenv("ROLLING_GATE_DELAY") or 0)
+
+# 计时结果（JSON lines 与 Prometheus 文本）的输出目录，为空则不输出
+# Output directory for timing results (JSON lines and Prometheus text), empty disables it
+DEPLOY_METRICS_DIR = os.getenv("DEPLOY_METRICS_DIR", ".")
+
+# 流式读取远程输出时为错误报告保留的末尾行数 / Trailing lines kept for error reports when streaming remote output
+STREAM_TAIL_LINES = int(os.getenv("STREAM_TAIL_LINES") or 50)
+STREAM_CHUNK_SIZE = 32768  # 每次读取的字节数 / Bytes read per receive
+STREAM_MAX_LINE = 65536  # 超过此长度的行被截断输出 / Lines longer than this are emitted in pieces
+
+
+def remote_login(server_address, username, port, private_key):
+    """
+    使用 Paramiko 库远程登录到服务器。
+    Use Paramiko library to log in to the server remotely.
+
+    :param server_address: 服务器地址 / Server address
+    :param username: 登录用户名 / Login username
+    :param port: SSH 端口 / SSH port
+    :param private_key: 私钥 / Private key
+    :return: SSHClient 对象 / SSHClient object
+    """
+    import paramiko
+
+    private_key_obj = paramiko.RSAKey.from_private_key(
+        StringIO(private_key)
+    )  # 从私钥字符串创建私钥对象 / Create private key object from private key string
+    ssh = paramiko.SSHClient()  # 创建 SSHClient 实例 / Create SSHClient instance
+    ssh.set_missing_host_key_policy(
+        paramiko.AutoAddPolicy()
+    )  # 自动添加主机密钥 / Automatically add host key
+    ssh.connect(
+        hostname=server_address, username=username, port=port, pkey=private_key_obj
+    )  # 连接到服务器 / Connect to the server
+    return ssh
+
+
+class _LineSplitter:
+    """
+    将分块到达的字节切分为行；未结束的行长度有上限，内存占用不随输出增长。
+    Split bytes arriving in chunks into lines; the unfinished line is bounded so memory
+    does not grow with the output.
+    """
+
+    def __init__(self, emit, tail_lines):
+        self._emit = emit
+        self._pending = b""
+        self.tail = collections.deque(maxlen=tail_lines)
+
+    def _line(self, data):
+        line = data.decode(errors="replace").rstrip()
+        if line:
+            self.tail.append(line)
+            self._emit(line)
+
+    def feed(self, data):
+        # docker pull 等命令可能用 \r 刷新进度 / Commands such as docker pull may use \r to redraw progress
+        lines = re.split(rb"[\r\n]", self._pending + data)
+        self._pending = lines.pop()
+        for line in lines:
+            self._line(line)
+        while len(self._pending) > STREAM_MAX_LINE:
+            self._line(self._pending[:STREAM_MAX_LINE])
+            self._pending = self._pending[STREAM_MAX_LINE:]
+
+    def close(self):
+        self._line(self._pending)
+        self._pending = b""
+
+
+def stream_prefix():
+    """
+    由当前计时标签生成输出前缀，例如 "host-1/api"。
+    Build the output prefix from the current timing tags, e.g. "host-1/api".
+    """
+    tags = timing.RECORDER.current_tags()
+    return "/".join(str(tags[key]) for key in ("host", "container") if tags.get(key))
+
+
+def stream_command(ssh, command, prefix=None, tail_lines=None, poll_interval=0.05):
+    """
+    执行远程命令，同时读取标准输出和标准错误并逐行记录日志，只保留末尾若干行用于错误报告。
+    两个流同时读取，一个流写满缓冲区也不会导致死锁。
+    Execute a remote command, draining stdout and stderr together and logging each line as it
+    arrives; only the trailing lines are kept for error reporting. Both streams are read at the
+    same time, so a full buffer on one of them cannot deadlock the command.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param command: 要执行的命令 / Command to execute
+    :param prefix: 日志前缀，默认取自当前主机与容器 / Log prefix, defaults to the current host and container
+    :param tail_lines: 保留的末尾行数 / Number of trailing lines kept
+    :param poll_interval: 无数据时的等待间隔（秒）/ Wait between polls when no data is available (seconds)
+    :return: CommandResult，stdout / stderr 为末尾若干行 / CommandResult whose stdout / stderr hold the trailing lines
+    """
+    prefix = stream_prefix() if prefix is None else prefix
+    label = f"[{prefix}] " if prefix else ""
+    tail_lines = tail_lines or STREAM_TAIL_LINES
+    out = _LineSplitter(lambda line: logging.info(f"{label}{line}"), tail_lines)
+    err = _LineSplitter(lambda line: logging.warning(f"{label}{line}"), tail_lines)
+
+    stdin, stdout, stderr = ssh.exec_command(command)
+    channel = stdout.channel
+    while True:
+        received = False
+        if channel.recv_ready():
+            out.feed(channel.recv(STREAM_CHUNK_SIZE))
+            received = True
+        if channel.recv_stderr_ready():
+            err.feed(channel.recv_stderr(STREAM_CHUNK_SIZE))
+            received = True
+        if received:
+            continue
+        # 退出状态到达时之前的输出都已进入缓冲区 / Once the exit status arrives all earlier output is buffered
+        if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+            break
+        time.sleep(poll_interval)
+    out.close()
+    err.close()
+    return CommandResult(
+        command, channel.recv_exit_status(), "\n".join(out.tail), "\n".join(err.tail)
+    )
+
+
+_engine_apis = weakref.WeakKeyDictionary()
+_engine_apis_lock = threading.Lock()
+
+
+def engine_api(ssh):
+    """
+    获取与 SSH 会话绑定的 Docker Engine API 客户端；使用 CLI 后端时返回 None。
+    Get the Docker Engine API client bound to the SSH session; None when the CLI backend is used.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :return: EngineAPI 对象或 None / EngineAPI object or None
+    """
+    if DOCKER_BACKEND != "api":
+        return None
+    with _engine_apis_lock:
+        api = _engine_apis.get(ssh)
+        if api is None:
+            api = _engine_apis[ssh] = EngineAPI(ssh)
+    return api
+
+
+@dataclass
+class CommandResult:
+    """
+    批量执行中单条命令的结果。
+    Result of a single command within a batch.
+    """
+
+    command: str
+    status: int = None  # None 表示命令未执行 / None means the command did not run
+    stdout: str = ""
+    stderr: str = ""
+
+    @property
+    def ok(self):
+        return self.status == 0
+
+
+# 远程批处理脚本：每条命令的输出都包在带随机标记的分隔行之间
+# Remote batch script: each command's output is framed by lines carrying a random marker
+BATCH_PRELUDE = (
+    "__run() { "
+    '__e=$(mktemp) || exit 1; '
+    "printf '%s %s out\\n' \"$__T\" \"$1\"; "
+    'sh -c "$2" 2>"$__e" </dev/null; __rc=$?; '
+    "printf '\\n%s %s err\\n' \"$__T\" \"$1\"; "
+    'cat "$__e"; rm -f "$__e"; '
+    "printf '\\n%s %s rc %s\\n' \"$__T\" \"$1\" \"$__rc\"; "
+    "return $__rc; }"
+)
+
+
+def build_batch_script(commands, token, stop_on_error=False):
+    """
+    生成在一个 SSH 通道中依次执行多条命令的 shell 脚本。
+    Build a shell script that runs several commands over a single SSH channel.
+
+    :param commands: 命令列表 / List of commands
+    :param token: 分隔标记 / Frame marker
+    :param stop_on_error: 某条命令失败后是否停止执行后续命令 / Stop after the first failing command
+    :return: shell 脚本 / Shell script
+    """
+    lines = [f"__T={token}", BATCH_PRELUDE]
+    for index, command in enumerate(commands):
+        line = f"__run {index} {shlex.quote(command)}"
+        lines.append(line + " || exit 0" if stop_on_error else line)
+    return "\n".join(lines) + "\n"
+
+
+def parse_batch_output(commands, token, output):
+    """
+    将批处理脚本的输出按命令拆分为结构化结果。
+    Demultiplex the output of a batch script into per-command results.
+
+    :param commands: 命令列表 / List of commands
+    :param token: 分隔标记 / Frame marker
+    :param output: 脚本的标准输出 / Standard output of the script
+    :return: CommandResult 列表，与 commands 一一对应 / CommandResult list matching commands
+    """
+    results = [CommandResult(command) for command in commands]
+    frame = re.compile(
+        rf"^{token} (\d+) out\n(.*?)\n{token} \1 err\n(.*?)\n{token} \1 rc (\d+)$",
+        re.S | re.M,
+    )
+    for match in frame.finditer(output):
+        result = results[int(match.group(1))]
+        result.stdout = match.group(2)
+        result.stderr = match.group(3)
+        result.status = int(match.group(4))
+    return results
+
+
+def run_batch(ssh, commands, stop_on_error=False):
+    """
+    在一次往返中执行多条相互独立（或按顺序依赖）的命令。
+    Run several independent (or sequentially dependent) commands in one round trip.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param commands: 命令列表 / List of commands
+    :param stop_on_error: 某条命令失败后是否停止执行后续命令 / Stop after the first failing command
+    :return: CommandResult 列表，与 commands 一一对应 / CommandResult list matching commands
+    """
+    if not commands:
+        return []
+    token = f"__batch_{secrets.token_hex(8)}"
+    _, out, err = run_command(ssh, build_batch_script(commands, token, stop_on_error))
+    if err.strip():
+        logging.error(
+            f"批处理脚本错误：{err.strip()}"
+        )  # Batch script error
+    return parse_batch_output(commands, token, out)
+
+
+def inspect_containers(ssh, container_names):
+    """
+    在一次往返中获取多个容器的 docker inspect 信息。
+    Fetch docker inspect information for several containers in one round trip.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_names: 容器名称列表 / List of container names
+    :return: 容器名 -> inspect 信息（不存在为 None）/ name -> inspect info (None if missing)
+    """
+    api = engine_api(ssh)
+    if api is not None:
+        return {name: api.inspect_container(name) for name in container_names}
+
+    results = run_batch(ssh, [f"docker inspect {name}" for name in container_names])
+    infos = {}
+    for name, result in zip(container_names, results):
+        info = json.loads(result.stdout or "[]") if result.ok else []
+        infos[name] = info[0] if info else None
+    return infos
+
+
+def inspect_cached(ssh, container_names):
+    """
+    与 inspect_containers() 相同，但先查共享缓存：其他运行刚获取过的信息无需再次往返。
+    不存在的容器不缓存，重新创建后的容器由 _leased() 移出缓存。
+    Same as inspect_containers(), but the shared cache is tried first so data another run just
+    fetched needs no round trip. Missing containers are not cached, and _leased() drops a
+    container from the cache once it is recreated.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_names: 容器名称列表 / List of container names
+    :return: 容器名 -> inspect 信息（不存在为 None）/ name -> inspect info (None if missing)
+    """
+    host = timing.RECORDER.current_tags().get("host")
+    infos = coordination.cache_get(host, "inspect", container_names)
+    missing = [name for name in container_names if name not in infos]
+    if missing:
+        fetched = inspect_containers(ssh, missing)
+        coordination.cache_set(host, "inspect", {name: info for name, info in fetched.items() if info})
+        infos.update(fetched)
+    return {name: infos[name] for name in container_names}
+
+
+def parse_image_reference(image_url):
+    """
+    将镜像引用拆分为仓库地址、仓库名和标签。
+    Split an image reference into registry, repository and tag.
+
+    :param image_url: Docker 镜像 URL，如 happyclo/librechat:main / Docker image URL
+    :return: (仓库地址, 仓库名, 标签) / (registry, repository, tag)
+    """
+    name, _, tag = image_url.partition("@")[0].rpartition(":")
+    if not name or "/" in tag:
+        name, tag = image_url.partition("@")[0], "latest"
+    first, _, rest = name.partition("/")
+    if rest and ("." in first or ":" in first or first == "localhost"):
+        return first, rest, tag
+    if not rest:
+        return "registry-1.docker.io", f"library/{name}", tag
+    return "registry-1.docker.io", name, tag
+
+
+@timing.timed("digest")
+def resolve_image_digest(image_url, timeout=10):
+    """
+    向镜像仓库查询标签当前指向的清单摘要，不需要拉取镜像。
+    Ask the registry which manifest digest the tag currently points to, without pulling.
+
+    :param image_url: Docker 镜像 URL / Docker image URL
+    :param timeout: 请求超时时间（秒）/ Request timeout in seconds
+    :return: 形如 sha256:... 的摘要，无法解析时为 None / Digest like sha256:..., None if it cannot be resolved
+    """
+    if "@" in image_url:
+        return image_url.partition("@")[2]
+    if not RESOLVE_IMAGE_DIGEST:
+        return None
+    # 其他运行刚解析过的摘要 / A digest another run just resolved
+    cached = coordination.cache_get(None, "digest", [image_url]).get(image_url)
+    if cached:
+        logging.info(
+            f"镜像 {image_url} 的摘要（共享缓存）：{cached}"
+        )  # Digest of image (shared cache)
+        return cached
+    import requests
+
+    registry, repository, tag = parse_image_reference(image_url)
+    manifest_url = f"https://{registry}/v2/{repository}/manifests/{tag}"
+    headers = {
+        "Accept": ", ".join(
+            [
+                "application/vnd.oci.image.index.v1+json",
+                "application/vnd.docker.distribution.manifest.list.v2+json",
+                "application/vnd.oci.image.manifest.v1+json",
+                "application/vnd.docker.distribution.manifest.v2+json",
+            ]
+        )
+    }
+    try:
+        response = requests.head(manifest_url, headers=headers, timeout=timeout)
+        challenge = response.headers.get("WWW-Authenticate", "")
+        if response.status_code == 401 and challenge.startswith("Bearer "):
+            # 按仓库给出的参数获取匿名拉取令牌 / Fetch an anonymous pull token as the registry instructs
+            params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+            realm = params.pop("realm")
+            token = requests.get(realm, params=params, timeout=timeout).json()
+            headers["Authorization"] = (
+                f"Bearer {token.get('token') or token.get('access_token')}"
+            )
+            response = requests.head(manifest_url, headers=headers, timeout=timeout)
+        digest = response.headers.get("Docker-Content-Digest")
+        if response.status_code == 200 and digest:
+            logging.info(
+                f"镜像 {image_url} 的摘要：{digest}"
+            )  # Digest of image
+            coordination.cache_set(None, "digest", {image_url: digest})
+            return digest
+        logging.warning(
+            f"无法解析镜像 {image_url} 的摘要，状态码：{response.status_code}"
+        )  # Could not resolve image digest
+    except (requests.RequestException, KeyError, ValueError) as e:
+        logging.warning(
+            f"无法解析镜像 {image_url} 的摘要：{e}"
+        )  # Could not resolve image digest
+    return None
+
+
+@timing.timed("pull")
+def pull_docker_image(ssh, image_url, image_digest=None):
+    """
+    从 Docker 仓库拉取指定的 Docker 镜像；如果主机上已有相同摘要的镜像则跳过。
+    Pull the specified Docker image; skipped when the host already has the same digest.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param image_url: Docker 镜像 URL / Docker image URL
+    :param image_digest: 预先解析的镜像摘要，为 None 时按标签拉取 / Pre-resolved digest, pull by tag if None
+    :return: 镜像是否可用 / Whether the image is available
+    """
+    if not image_url or ":" not in image_url:
+        logging.error(
+            "错误：无效的 Docker 镜像 URL 格式"
+        )  # Error: Invalid Docker image URL format
+        return False  # 如果图像 URL 无效，返回 / Return if the image URL is invalid
+
+    api = engine_api(ssh)
+    if api is not None:
+        return _pull_docker_image_api(ssh, api, image_url, image_digest)
+
+    if image_digest:
+        # 检查主机上的标签是否已指向该摘要（包括分发时记录的摘要）
+        # Check whether the tag on the host already points to the digest (including one recorded by the fan-out)
+        status, out, _ = run_command(ssh, image_fanout.digests_command(backup_store.BACKUP_DIR, image_url))
+        if status == 0 and any(repo_digest.endswith(f"@{image_digest}") for repo_digest in out.split()):
+            logging.info(
+                f"主机上已存在镜像 {image_url}（{image_digest}），跳过拉取"
+            )  # Image already present on host, skipping pull
+            timing.annotate(skipped=True)
+            return True
+
+        # 按摘要拉取并打上标签，保证所有主机运行同一镜像 / Pull by digest and tag it so every host runs the same image
+        pinned = f"{image_retention.repository_of(image_url)}@{image_digest}"
+        command = f"docker pull {pinned} && docker tag {pinned} {image_url}"
+    else:
+        command = f"docker pull {image_url}"
+
+    # 拉取进度逐行输出 / Pull progress is logged line by line
+    result = stream_command(ssh, command)
+    if not result.ok:
+        logging.error(
+            f"错误：拉取镜像 {image_url} 失败（退出码 {result.status}）：{result.stderr}"
+        )  # Error: pulling the image failed
+    return result.ok
+
+
+def _pull_docker_image_api(ssh, api, image_url, image_digest=None):
+    """
+    通过 Docker Engine API 拉取镜像，逻辑与 pull_docker_image 相同。
+    Pull the image through the Docker Engine API, with the same logic as pull_docker_image.
+    """
+    try:
+        image_info = api.inspect_image(image_url)
+        repo_digests = (image_info or {}).get("RepoDigests") or []
+        if image_digest and image_info and not repo_digests:
+            # docker load 载入的镜像只有分发时记录的摘要 / An image brought in by docker load only has the digest recorded by the fan-out
+            status, out, _ = run_command(ssh, image_fanout.digests_command(backup_store.BACKUP_DIR, image_url))
+            repo_digests = out.split() if status == 0 else []
+        if image_digest and image_info and any(
+            repo_digest.endswith(f"@{image_digest}") for repo_digest in repo_digests
+        ):
+            logging.info(
+                f"主机上已存在镜像 {image_url}（{image_digest}），跳过拉取"
+            )  # Image already present on host, skipping pull
+            return True
+
+        name = image_url.partition("@")[0]
+        tag = "latest"
+        if ":" in name.rpartition("/")[2]:
+            name, _, tag = name.rpartition(":")
+        if image_digest:
+            # 按摘要拉取并打上标签 / Pull by digest and tag it
+            api.pull_image(f"{name}@{image_digest}")
+            api.tag_image(f"{name}@{image_digest}", name, tag)
+        else:
+            api.pull_image(image_url)
+        logging.info(f"已拉取镜像 {image_url}")  # Image pulled
+        return True
+    except DockerAPIError as e:
+        logging.error(f"错误：拉取镜像 {image_url} 失败：{e}")  # Error: pulling image failed
+        return False
+
+
+def image_id(ssh, image_url):
+    """
+    获取主机上镜像的 ID（容器 inspect 信息中的 Image 字段即为此值）。
+    Get the ID of an image on the host (what a container's inspect data reports as Image).
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param image_url: Docker 镜像 URL / Docker image URL
+    :return: 镜像 ID，不存在时为 None / Image ID, None if the image is not present
+    """
+    api = engine_api(ssh)
+    if api is not None:
+        image_info = api.inspect_image(image_url)
+        return image_info.get("Id") if image_info else None
+    status, out, _ = run_command(ssh, "docker image inspect --format '{{.Id}}' " + image_url)
+    return out.strip() if status == 0 else None
+
+
+def container_spec_summary(container_info):
+    """
+    提取决定容器是否需要重新创建的字段，统一为可比较的形式。
+    Extract the fields that decide whether a container needs recreating, in comparable form.
+
+    :param container_info: docker inspect 信息 / docker inspect information
+    :return: {"image", "env", "ports", "networks", "restart"}
+    """
+    config = container_info.get("Config") or {}
+    host_config = container_info.get("HostConfig") or {}
+    restart_policy = host_config.get("RestartPolicy") or {}
+    ports = sorted(
+        (port, binding.get("HostIp") or "0.0.0.0", binding.get("HostPort") or "")
+        for port, bindings in (host_config.get("PortBindings") or {}).items()
+        for binding in bindings or []
+    )
+    return {
+        "image": container_info.get("Image"),
+        "env": dict(env.partition("=")[::2] for env in config.get("Env") or []),
+        "ports": ports,
+        "networks": sorted(
+            (container_info.get("NetworkSettings") or {}).get("Networks") or {}
+        ),
+        "restart": (
+            restart_policy.get("Name") or "no",
+            restart_policy.get("MaximumRetryCount") or 0,
+        ),
+    }
+
+
+def target_spec_summary(container_info, target_image_id, env=None):
+    """
+    生成重新创建后容器应有的字段：除镜像（及可选的环境变量）外均沿用当前容器。
+    Build the fields the recreated container will have: everything but the image
+    (and optionally the environment) is carried over from the current container.
+
+    :param container_info: 当前容器的 docker inspect 信息 / docker inspect information of the current container
+    :param target_image_id: 目标镜像 ID / Target image ID
+    :param env: 覆盖的环境变量字典 / Environment variable overrides
+    :return: 与 container_spec_summary 相同结构 / Same shape as container_spec_summary
+    """
+    target = container_spec_summary(container_info)
+    target["image"] = target_image_id
+    if env is not None:
+        target["env"] = dict(env)
+    return target
+
+
+def with_rendered_env(index, container_name, container_info):
+    """
+    按渲染的 env 文件更新容器设置中的环境变量，并记录受管理键的差异（机密已脱敏）。
+    Update the environment in a container's settings from the rendered env file and log the
+    differences of the managed keys (secrets masked).
+
+    :param index: env_index.load_index() 的结果 / Result of env_index.load_index()
+    :param container_name: 容器名称 / Container name
+    :param container_info: docker inspect 信息 / docker inspect information
+    :return: 环境不变时为原对象，否则为更新了 Config.Env 的副本 / The same object if the environment is unchanged, else a copy with Config.Env updated
+    """
+    config = container_info.get("Config") or {}
+    diff = env_index.diff_env(index, config.get("Env"))
+    if any(diff.values()):
+        logging.info(
+            f"容器 {container_name} 的环境变量差异：{env_index.describe(diff)}"
+        )  # Environment differences of the container
+    if not diff["added"] and not diff["changed"]:
+        return container_info
+    return {**container_info, "Config": {**config, "Env": env_index.target_env(index, config.get("Env"))}}
+
+
+def diff_container_spec(current, target):
+    """
+    比较当前容器与目标规格，返回不同的字段。
+    Compare the current container with the target spec and return the fields that differ.
+
+    :param current: container_spec_summary 的结果 / Result of container_spec_summary
+    :param target: target_spec_summary 的结果 / Result of target_spec_summary
+    :return: 字段 -> 说明，无差异时为空字典 / field -> description, empty if nothing differs
+    """
+    changes = {}
+    for field_name in ("image", "ports", "networks", "restart"):
+        if current[field_name] != target[field_name]:
+            changes[field_name] = f"{current[field_name]} -> {target[field_name]}"
+    changed_keys = sorted(
+        key
+        for key in set(current["env"]) | set(target["env"])
+        if current["env"].get(key) != target["env"].get(key)
+    )
+    if changed_keys:
+        changes["env"] = ", ".join(changed_keys)  # 只记录键名，不输出值 / Keys only, never values
+    return changes
+
+
+@timing.timed("backup", container="container_name")
+def backup_container_settings(ssh, container_name, container_info=None):
+    """
+    备份指定容器的设置：快照压缩后按内容哈希存入 BACKUP_DIR，每个容器保留 BACKUP_RETENTION 份，
+    可以用 rollback_container() 恢复。
+    Backup the settings of the specified container: the snapshot is compressed and stored under
+    BACKUP_DIR by content hash, BACKUP_RETENTION generations are kept per container and
+    rollback_container() restores them.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_name: 容器名称 / Container name
+    :param container_info: 已获取的 inspect 信息，为 None 时远程查询 / Pre-fetched inspect info, queried remotely if None
+    :return: 远程快照路径 / Remote snapshot path
+    """
+    # 获取容器的详细信息 / Get detailed information about the container
+    if container_info is None:
+        container_info = inspect_containers(ssh, [container_name])[container_name]
+
+    # 如果未找到容器信息，则返回 None / Return None if container information is not found
+    if not container_info:
+        logging.error(
+            f"错误：未找到容器 {container_name} 的信息"
+        )  # Error: Could not find information for container
+        return None
+
+    saved = backup_store.save_snapshot(ssh, container_name, container_info)
+    if not saved:
+        return None
+    backup_file = saved[1]
+    logging.info(
+        f"容器设置已备份到：{backup_file}"
+    )  # Container settings have been backed up to
+    return backup_file
+
+
+def container_state(ssh, container_name):
+    """
+    获取容器的运行状态与健康状态。
+    Get the run state and health state of a container.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_name: 容器名称 / Container name
+    :return: (状态, 健康状态)，容器不存在时为 None / (status, health), None if the container does not exist
+    """
+    api = engine_api(ssh)
+    if api is not None:
+        container_info = api.inspect_container(container_name)
+        if container_info is None:
+            return None
+        state = container_info.get("State") or {}
+        return state.get("Status", ""), (state.get("Health") or {}).get("Status", "")
+
+    status, out, _ = run_command(
+        ssh,
+        "docker inspect -f "
+        "'{{.State.Status}}|{{if .State.Health}}{{.State.Health.Status}}{{end}}' "
+        + container_name,
+    )
+    if status != 0:
+        return None
+    state, _, health = out.strip().partition("|")
+    return state, health
+
+
+def wait_until(condition, timeout, description, interval=0.2):
+    """
+    轮询 condition 直到其返回非 None 的结果或超时，并记录等待时长。
+    Poll condition until it returns a non-None result or times out, logging how long it took.
+
+    :param condition: 无参函数，返回 None 表示继续等待 / Callable, None means keep waiting
+    :param timeout: 超时时间（秒）/ Timeout in seconds
+    :param description: 日志中使用的描述 / Description used in logs
+    :param interval: 初始轮询间隔（秒），之后逐步加倍 / Initial poll interval, doubled up to 2s
+    :return: condition 的结果，超时为 None / Result of condition, None on timeout
+    """
+    started = time.monotonic()
+    while True:
+        result = condition()
+        elapsed = time.monotonic() - started
+        if result is not None:
+            logging.info(
+                f"{description}：用时 {elapsed:.1f}s"
+            )  # {description}: took {elapsed}s
+            return result
+        if elapsed >= timeout:
+            logging.error(
+                f"{description}：等待 {timeout}s 后超时"
+            )  # {description}: timed out after {timeout}s
+            return None
+        time.sleep(min(interval, timeout - elapsed))
+        interval = min(interval * 2, 2.0)
+
+
+def wait_for_container_removed(ssh, container_name, timeout=None):
+    """
+    等待容器被删除。
+    Wait until the container no longer exists.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_name: 容器名称 / Container name
+    :param timeout: 超时时间（秒）/ Timeout in seconds
+    :return: 是否已删除 / Whether the container is gone
+    """
+    removed = wait_until(
+        lambda: True if container_state(ssh, container_name) is None else None,
+        CONTAINER_REMOVE_TIMEOUT if timeout is None else timeout,
+        f"等待容器 {container_name} 删除",  # Waiting for container removal
+    )
+    return bool(removed)
+
+
+def wait_for_container_ready(ssh, container_name, timeout=None):
+    """
+    等待容器进入运行状态；如果定义了健康检查，则等待其变为 healthy。
+    Wait until the container is running, or healthy if it defines a health check.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_name: 容器名称 / Container name
+    :param timeout: 超时时间（秒）/ Timeout in seconds
+    :return: 容器是否就绪 / Whether the container is ready
+    """
+
+    def check():
+        state = container_state(ssh, container_name)
+        if state is None:
+            return None  # 容器尚未出现 / Container has not appeared yet
+        status, health = state
+        if status in ("exited", "dead") or health == "unhealthy":
+            logging.error(
+                f"容器 {container_name} 启动失败：{status} {health}".strip()
+            )  # Container failed to start
+            return False
+        if status == "running" and health in ("", "healthy"):
+            return True
+        return None
+
+    with timing.span("ready") as ready_span:
+        ready_span.ok = bool(
+            wait_until(
+                check,
+                CONTAINER_READY_TIMEOUT if timeout is None else timeout,
+                f"等待容器 {container_name} 就绪",  # Waiting for container to become ready
+            )
+        )
+    return ready_span.ok
+
+
+def build_run_command(container_info, container_name, image_url, port_offset=0, labels=None):
+    """
+    根据 docker inspect 信息生成创建新容器的 docker run 命令。每个参数都经过 shell 转义，
+    环境变量中的引号、$ 与反引号原样传给容器（命令也会写入部署日志供恢复时重放）。
+    Build the docker run command that recreates a container from its docker inspect information.
+    Every argument is shell-quoted, so quotes, $ and backticks in environment values reach the
+    container unchanged (the command is also journaled and replayed on recovery).
+
+    :param container_info: docker inspect 信息 / docker inspect information
+    :param container_name: 新容器名称 / New container name
+    :param image_url: Docker 镜像 URL / Docker image URL
+    :param port_offset: 主机端口偏移量 / Offset added to published host ports
+    :param labels: 额外的容器标签 / Extra container labels
+    :return: docker run 命令 / docker run command
+    """
+    config = container_info["Config"]  # 获取容器配置 / Get container configuration
+    create_command = f"docker run -d --name {shlex.quote(container_name)} "  # 创建新容器的基本命令 / Basic command to create new container
+
+    # 添加环境变量 / Add environment variables
+    env_vars = config.get("Env") or []
+    for env in env_vars:
+        create_command += f"-e {shlex.quote(env)} "  # 将每个环境变量添加到创建命令中 / Add each environment variable to the create command
+
+    # 添加端口映射 / Add port mappings
+    host_config = container_info.get("HostConfig", {})
+    port_bindings = host_config.get("PortBindings") or {}
+
+    for port, bindings in port_bindings.items():
+        for binding in bindings or []:
+            host_ip = binding.get("HostIp") or "0.0.0.0"  # 默认主机 IP / Default host IP
+            host_port = binding.get("HostPort")
+            if host_port and port_offset:
+                host_port = int(host_port) + port_offset  # 备用槽位的端口 / Port of the alternate slot
+            mapping = f"{host_ip}:{host_port}:{port.split('/')[0]}"
+            create_command += f"-p {shlex.quote(mapping)} "  # 添加端口映射 / Add port mapping
+
+    # 添加卷挂载 / Add volume mounts
+    mounts = config.get("Volumes", {})
+    if mounts:
+        for mount in mounts.keys():
+            create_command += f"-v {shlex.quote(f'{mount}:{mount}')} "  # 将卷挂载到新容器 / Mount volumes to the new container
+
+    # 添加网络设置 / Add network settings
+    networks = container_info.get("NetworkSettings", {}).get("Networks", {})
+    for network_name in networks.keys():
+        create_command += f"--network {shlex.quote(network_name)} "  # 将网络设置添加到创建命令 / Add network settings to the create command
+
+    # 添加重启策略 / Add restart policy
+    restart_policy = host_config.get("RestartPolicy") or {}
+    if restart_policy.get("Name"):
+        create_command += f"--restart {shlex.quote(restart_policy['Name'])} "
+        if (restart_policy.get("MaximumRetryCount") or 0) > 0:
+            create_command += (
+                f"--restart-max-retries {restart_policy['MaximumRetryCount']} "
+            )
+
+    # 添加标签 / Add labels
+    for key, value in (labels or {}).items():
+        create_command += f"--label {shlex.quote(f'{key}={value}')} "
+
+    create_command += shlex.quote(image_url)  # 添加新的镜像 URL / Add new image URL
+    return create_command
+
+
+def uses_blue_green(container_name):
+    """
+    容器是否配置为蓝绿切换。
+    Whether the container is configured for a blue/green swap.
+    """
+    return "*" in BLUE_GREEN_CONTAINERS or container_name in BLUE_GREEN_CONTAINERS
+
+
+@timing.timed("recreate", container="old_container_name")
+def recreate_container(ssh, old_container_name, new_image_url, blue_green=None, container_info=None):
+    """
+    重新创建指定的 Docker 容器；启用协调（DEPLOY_REDIS_URI）时在容器的租约锁内进行。
+    Recreate the specified Docker container; with coordination (DEPLOY_REDIS_URI) enabled it runs
+    under the container's lease lock.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param old_container_name: 旧容器名称 / Old container name
+    :param new_image_url: 新的 Docker 镜像 URL / New Docker image URL
+    :param blue_green: 是否使用蓝绿切换，默认取 BLUE_GREEN_CONTAINERS / Use a blue/green swap, defaults to BLUE_GREEN_CONTAINERS
+    :param container_info: 新容器使用的设置（如备份快照），默认取自当前容器 / Settings for the new container (e.g. a backup snapshot), defaults to the current container's
+    :return: 新容器是否成功就绪，容器在取得租约时已是目标版本则为 SKIPPED / Whether the new container became ready, SKIPPED if the container was already at the target once the lease was held
+    """
+    try:
+        with _leased(old_container_name) as token:
+            # 取得租约前的判断可能已过时：其他部署可能刚完成了同样的重新创建
+            # The decision made before the lease may be stale: another deploy may just have done the same recreate
+            if token is not None and not FORCE_RECREATE and _already_current(
+                ssh, old_container_name, new_image_url, container_info
+            ):
+                logging.info(
+                    f"容器 {old_container_name} 已是目标版本，跳过"
+                )  # Container already matches the target, skipping
+                timing.annotate(skipped=True)
+                return SKIPPED
+            return _recreate_container(ssh, old_container_name, new_image_url, blue_green, container_info)
+    except coordination.LeaseError as e:
+        logging.error(f"错误：{e}")  # Error: the lease could not be acquired
+        return False
+
+
+def _already_current(ssh, container_name, image_url, container_info=None):
+    """
+    重新检查容器是否已与目标一致：镜像为 image_url，其余设置与 container_info（默认当前容器）相同。
+    Re-check whether the container already matches the target: image_url as its image and the
+    other settings of container_info (the current container's by default).
+    """
+    current = inspect_containers(ssh, [container_name])[container_name]
+    target_image_id = image_id(ssh, image_url)
+    if current is None or target_image_id is None:
+        return False
+    target = target_spec_summary(container_info or current, target_image_id)
+    return not diff_container_spec(container_spec_summary(current), target)
+
+
+def _recreate_container(ssh, old_container_name, new_image_url, blue_green, container_info):
+    if blue_green is None:
+        blue_green = uses_blue_green(old_container_name)
+    if blue_green:
+        return swap_container(ssh, old_container_name, new_image_url, container_info)
+
+    api = engine_api(ssh)
+    if api is not None:
+        return _recreate_container_api(
+            ssh, api, old_container_name, new_image_url, container_info
+        )
+
+    new_container_name = (
+        f"{old_container_name}_old"  # 生成新容器名称 / Generate new container name
+    )
+
+    # 一次往返内获取所有容器名称和容器设置 / Get all container names and the container settings in one round trip
+    names_result, inspect_result = run_batch(
+        ssh, ["docker ps -a --format '{{.Names}}'", f"docker inspect {old_container_name}"]
+    )
+    existing_containers = (
+        names_result.stdout.splitlines()
+    )  # 获取所有容器名称 / Get all container names
+    current_info = (
+        json.loads(inspect_result.stdout or "[]") if inspect_result.ok else []
+    )  # 解析容器信息 / Parse container information
+
+    # 如果未找到容器信息，直接返回 / Return directly if container information is not found
+    if not current_info:
+        logging.error(
+            f"错误：未找到容器 {old_container_name} 的信息"
+        )  # Error: Could not find information for container
+        return False
+    container_info = container_info or current_info[0]
+
+    # 检查新容器名称是否已被占用，如果已被占用，则继续添加 "_old"
+    # Check if the new name is already in use, if so keep adding "_old"
+    while new_container_name in existing_containers:
+        new_container_name += "_old"
+
+    create_command = build_run_command(
+        container_info, old_container_name, new_image_url
+    )  # 创建新容器的命令 / Command to create the new container
+
+    # 从删除旧容器到新容器就绪的这段时间即停机时间 / Downtime lasts from removing the old container until the new one is ready
+    with timing.span("downtime") as downtime:
+        downtime.ok = _replace_container(
+            ssh, old_container_name, new_container_name, create_command
+        )
+    return downtime.ok
+
+
+@contextmanager
+def _leased(container_name):
+    """
+    持有当前主机上容器的租约锁（启用协调时）并返回防护令牌，之后将容器移出共享缓存。
+    Hold the lease lock of a container on the current host (when coordination is enabled) and
+    yield its fencing token, then drop the container from the shared cache.
+    """
+    host = timing.RECORDER.current_tags().get("host")
+    try:
+        with coordination.lease(host, container_name) as token:
+            yield token
+    finally:
+        coordination.cache_delete(host, "inspect", [container_name])
+
+
+def _fence(container_name):
+    """
+    持有租约时在主机上检查防护令牌的命令，放在每个破坏性步骤之前；未持有时为空列表。
+    Commands checking the fencing token on the host ahead of each destructive step while a lease
+    is held; an empty list otherwise.
+    """
+    token = coordination.current_token(timing.RECORDER.current_tags().get("host"), container_name)
+    return [] if token is None else [coordination.fence_command(backup_store.BACKUP_DIR, container_name, token)]
+
+
+def _fence_refused(container_name, result):
+    """
+    防护令牌被主机拒绝时记录错误：租约已过期，其他运行已接手该容器。
+    Log an error when the host refuses the fencing token: the lease expired and another run took over the container.
+    """
+    logging.error(
+        f"错误：容器 {container_name} 的防护令牌被拒绝，租约已被其他部署取得：{result.stderr.strip()}"
+    )  # Error: the fencing token was refused, another deploy holds the lease
+
+
+def _journal(container_name, step, **fields):
+    """
+    在主机上记录一个步骤的命令。
+    Command recording a step on the host.
+    """
+    return deploy_journal.write_command(backup_store.BACKUP_DIR, container_name, step, **fields)
+
+
+def _record(container_name, step, **fields):
+    """
+    在本地日志中记录已完成的步骤。
+    Record a completed step in the local journal.
+    """
+    deploy_journal.record_local(timing.RECORDER.current_tags().get("host"), container_name, step, **fields)
+
+
+def _replace_container(ssh, old_container_name, new_container_name, create_command):
+    """
+    重命名并删除旧容器，然后创建新容器并等待其就绪。每个破坏性步骤之前都先写入部署日志（与该步骤在同一往返），
+    中断后重新运行时由 resume_host() 从中断的步骤继续。
+    Rename and remove the old container, then create the new one and wait until it is ready. Every
+    destructive step is journaled before it runs (in the same round trip), so a rerun after an
+    interruption continues from that step through resume_host().
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param old_container_name: 容器名称 / Container name
+    :param new_container_name: 旧容器重命名后的名称 / Name the old container is renamed to
+    :param create_command: 创建新容器的 docker run 命令 / docker run command creating the new container
+    :return: 新容器是否成功就绪 / Whether the new container became ready
+    """
+    # 重命名并删除旧容器（同一往返，重命名失败则不删除），然后等待其真正消失
+    # Rename and remove the old container in one round trip (no removal if the rename fails), then wait until it is gone
+    logging.info(
+        f"正在删除旧容器 {old_container_name}（{new_container_name}）..."
+    )  # Removing old container...
+    _record(old_container_name, "begin", temp=new_container_name)
+    fence = _fence(old_container_name)
+    with timing.span("remove") as remove_span:
+        results = run_batch(
+            ssh,
+            fence
+            + [
+                _journal(
+                    old_container_name,
+                    "begin",
+                    temp=new_container_name,
+                    command=deploy_journal.encode_command(create_command),
+                ),
+                f"docker rename {old_container_name} {new_container_name}",
+                _journal(old_container_name, "renamed"),
+                f"docker rm -f {new_container_name}",
+            ],
+            stop_on_error=True,
+        )
+        if fence and not results[0].ok:
+            _fence_refused(old_container_name, results[0])
+            remove_span.ok = False
+            return False
+        begin_result, rename_result, _, remove_result = results[len(fence) :]
+        if not begin_result.ok:
+            logging.error(
+                f"错误：无法写入部署日志：{begin_result.stderr.strip()}"
+            )  # Error: could not write the deploy journal
+            remove_span.ok = False
+            return False
+        if not rename_result.ok:
+            logging.error(
+                f"错误：无法重命名容器 {old_container_name}：{rename_result.stderr.strip()}"
+            )  # Error: Could not rename container
+            run_command(ssh, _journal(old_container_name, "aborted"))
+            _record(old_container_name, "aborted")
+            remove_span.ok = False
+            return False
+        _record(old_container_name, "renamed")
+        # docker rm -f 成功返回时容器已被删除，否则轮询等待 / A successful docker rm -f means it is gone, otherwise poll
+        if not remove_result.ok and not wait_for_container_removed(ssh, new_container_name):
+            remove_span.ok = False
+            return False
+        _record(old_container_name, "removed")
+
+    with timing.span("run") as run_span:
+        # 创建新容器，前后的日志写入在同一往返 / Create the new container, journaled before and after in the same round trip
+        result = stream_command(
+            ssh,
+            " && ".join(
+                fence
+                + [
+                    _journal(old_container_name, "removed"),
+                    create_command,
+                    _journal(old_container_name, "created"),
+                ]
+            ),
+        )
+        if not result.ok:
+            logging.error(
+                f"错误：无法创建容器 {old_container_name}：{result.stderr}"
+            )  # Error: Could not create the container
+            run_span.ok = False
+            return False
+        _record(old_container_name, "created")
+
+    # 等待新容器运行或通过健康检查 / Wait for the new container to run or pass its health check
+    return wait_for_container_ready(ssh, old_container_name)
+
+
+def resume_host(ssh, container_names):
+    """
+    读取主机上的部署日志，从中断的步骤继续未完成的容器；已完成的容器不受影响。
+    Read the deploy journal on the host and continue every unfinished container from the step
+    where it stopped; finished containers are left alone.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_names: 容器名称列表 / List of container names
+    :return: 容器名 -> 是否恢复成功，只包含未完成的容器 / name -> whether it was recovered, unfinished containers only
+    """
+    status, out, err = run_command(ssh, deploy_journal.read_command(backup_store.BACKUP_DIR))
+    if status != 0:
+        logging.warning(f"无法读取部署日志：{err.strip()}")  # Could not read the deploy journal
+        return {}
+    entries = deploy_journal.parse_journal(out)
+    host = timing.RECORDER.current_tags().get("host")
+    local = deploy_journal.unfinished(deploy_journal.load_local(host))
+    for container_name in set(local) & set(container_names) - set(entries):
+        logging.warning(
+            f"本地日志显示容器 {container_name} 的部署未完成，但主机上没有对应的日志"
+        )  # The local journal shows an unfinished deploy, but the host has no journal for it
+
+    unfinished = deploy_journal.unfinished(entries)
+    return {
+        container_name: resume_container(ssh, container_name, unfinished[container_name])
+        for container_name in container_names
+        if container_name in unfinished
+    }
+
+
+@timing.timed("resume", container="container_name")
+def resume_container(ssh, container_name, entry):
+    """
+    从日志条目记录的步骤继续重新创建容器：旧容器仍在原处时放弃，否则删除残留的旧容器并用记录的命令创建新容器。
+    中断的蓝绿切换则完成改名。
+    Continue recreating a container from the step its journal entry records: give up if the old
+    container is still in place, otherwise remove what is left of the old one and create the new
+    one with the recorded command. An interrupted blue/green switch has its renames completed.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_name: 容器名称 / Container name
+    :param entry: deploy_journal.parse_journal() 中的条目 / Entry from deploy_journal.parse_journal()
+    :return: 容器是否就绪 / Whether the container is ready
+    """
+    try:
+        with _leased(container_name):
+            return _resume_container(ssh, container_name, entry)
+    except coordination.LeaseError as e:
+        logging.error(f"错误：{e}")  # Error: the lease could not be acquired
+        return False
+
+
+def _resume_container(ssh, container_name, entry):
+    logging.warning(
+        f"容器 {container_name} 的上次部署中断于 {entry['step']} 步骤，正在继续"
+    )  # The previous deploy of the container stopped at a step, continuing
+    status, out, _ = run_command(ssh, "docker ps -a --format '{{.Names}}'")
+    names = set(out.split())
+    temp_name = entry.get("temp")
+    if entry.get("candidate"):
+        return _resume_swap(ssh, container_name, entry, names)
+    if container_name in names:
+        # 重命名没有发生，或新容器已经创建 / The rename never happened, or the new container already exists
+        run_command(ssh, _journal(container_name, "aborted"))
+        _record(container_name, "aborted")
+        return True
+
+    create_command = deploy_journal.decode_command(entry)
+    if not create_command:
+        logging.error(
+            f"错误：容器 {container_name} 的日志中没有创建命令，请使用 rollback 恢复"
+        )  # Error: the journal has no create command, use rollback to restore it
+        return False
+    commands = _fence(container_name)
+    if temp_name and temp_name in names:
+        commands.append(f"docker rm -f {temp_name}")
+    commands += [_journal(container_name, "removed"), create_command, _journal(container_name, "created")]
+    with timing.span("run") as run_span:
+        result = stream_command(ssh, " && ".join(commands))
+        if not result.ok:
+            logging.error(
+                f"错误：无法创建容器 {container_name}：{result.stderr}"
+            )  # Error: Could not create the container
+            run_span.ok = False
+            return False
+        _record(container_name, "created")
+    return wait_for_container_ready(ssh, container_name)
+
+
+def _resume_swap(ssh, container_name, entry, names):
+    """
+    完成中断的蓝绿切换。日志在别名移交之后写入，新容器已通过健康检查并接管了别名，因此只需完成改名并删除旧容器；
+    新容器已不存在时把旧容器改回原名称。
+    Complete an interrupted blue/green switch. The journal is written once the aliases were handed
+    over to the new container, which already passed its checks, so only the renames and the removal
+    of the old container are left; if the new container is gone the old one gets its name back.
+    """
+    retired_name, candidate_name = entry["temp"], entry["candidate"]
+    commands = _fence(container_name)
+    if candidate_name in names:
+        if container_name in names:
+            commands.append(f"docker rename {container_name} {retired_name}")
+            names = names | {retired_name}
+        commands.append(f"docker rename {candidate_name} {container_name}")
+    elif container_name not in names and retired_name in names:
+        logging.warning(
+            f"容器 {container_name} 的新容器 {candidate_name} 已不存在，恢复旧容器"
+        )  # The new container is gone, restoring the old one
+        commands.append(f"docker rename {retired_name} {container_name}")
+        names = names - {retired_name}
+    elif container_name not in names:
+        logging.error(
+            f"错误：容器 {container_name} 的新旧容器都已不存在，请使用 rollback 恢复"
+        )  # Error: both the new and the old container are gone, use rollback to restore it
+        return False
+    if retired_name in names:
+        commands.append(f"docker rm -f {retired_name}")
+    commands.append(_journal(container_name, "created"))
+    results = run_batch(ssh, commands, stop_on_error=True)
+    failed = [result for result in results if not result.ok]
+    if failed:
+        logging.error(
+            f"错误：无法完成容器 {container_name} 的切换：{failed[0].command}：{failed[0].stderr.strip()}"
+        )  # Error: could not complete the switch of the container
+        return False
+    _record(container_name, "created")
+    return wait_for_container_ready(ssh, container_name)
+
+
+def _check_fence(ssh, container_name):
+    """
+    单独检查防护令牌（API 调用不经过 shell）。
+    Check the fencing token on its own (API calls bypass the shell).
+    """
+    for command in _fence(container_name):
+        result = run_batch(ssh, [command])[0]
+        if not result.ok:
+            _fence_refused(container_name, result)
+            return False
+    return True
+
+
+def _recreate_container_api(ssh, api, old_container_name, new_image_url, container_info=None):
+    """
+    通过 Docker Engine API 重新创建容器：容器规格直接复制自 inspect 信息中的 HostConfig。
+    Recreate the container through the Docker Engine API, copying HostConfig from the inspect data.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param api: EngineAPI 对象 / EngineAPI object
+    :param old_container_name: 旧容器名称 / Old container name
+    :param new_image_url: 新的 Docker 镜像 URL / New Docker image URL
+    :param container_info: 新容器使用的设置，默认取自当前容器 / Settings for the new container, defaults to the current container's
+    :return: 新容器是否成功就绪 / Whether the new container became ready
+    """
+    try:
+        current_info = api.inspect_container(old_container_name)
+        if not current_info:
+            logging.error(
+                f"错误：未找到容器 {old_container_name} 的信息"
+            )  # Error: Could not find information for container
+            return False
+
+        container_info = container_info or current_info
+        existing_containers = api.list_container_names()
+        new_container_name = f"{old_container_name}_old"
+        while new_container_name in existing_containers:
+            new_container_name += "_old"
+
+        spec, extra_networks = container_spec(container_info, new_image_url)
+    except DockerAPIError as e:
+        logging.error(
+            f"错误：重新创建容器 {old_container_name} 失败：{e}"
+        )  # Error: recreating container failed
+        return False
+
+    # 从删除旧容器到新容器就绪的这段时间即停机时间 / Downtime lasts from removing the old container until the new one is ready
+    with timing.span("downtime") as downtime:
+        try:
+            # 重命名并删除旧容器，强制删除在容器消失后才返回
+            # Rename and remove the old container; a forced removal only returns once it is gone
+            logging.info(
+                f"正在删除旧容器 {old_container_name}（{new_container_name}）..."
+            )  # Removing old container...
+            with timing.span("remove"):
+                # API 调用不经过 shell，日志单独写入 / API calls bypass the shell, so the journal is written separately
+                create_command = build_run_command(container_info, old_container_name, new_image_url)
+                if not _check_fence(ssh, old_container_name):
+                    downtime.ok = False
+                    return False
+                _record(old_container_name, "begin", temp=new_container_name)
+                status, _, err = run_command(
+                    ssh,
+                    _journal(
+                        old_container_name,
+                        "begin",
+                        temp=new_container_name,
+                        command=deploy_journal.encode_command(create_command),
+                    ),
+                )
+                if status != 0:
+                    logging.error(f"错误：无法写入部署日志：{err.strip()}")  # Error: could not write the deploy journal
+                    downtime.ok = False
+                    return False
+                api.rename_container(old_container_name, new_container_name)
+                api.remove_container(new_container_name, force=True)
+                run_command(ssh, _journal(old_container_name, "removed"))
+                _record(old_container_name, "removed")
+
+            with timing.span("run"):
+                if not _check_fence(ssh, old_container_name):
+                    downtime.ok = False
+                    return False
+                container_id = api.create_container(old_container_name, spec)
+                for network_name, aliases in extra_networks.items():
+                    api.connect_network(network_name, container_id, aliases)
+                api.start_container(container_id)
+                run_command(ssh, _journal(old_container_name, "created"))
+                _record(old_container_name, "created")
+            logging.info(f"已创建新容器 {old_container_name}：{container_id}")  # New container created
+        except DockerAPIError as e:
+            logging.error(
+                f"错误：重新创建容器 {old_container_name} 失败：{e}"
+            )  # Error: recreating container failed
+            downtime.ok = False
+            return False
+
+        # 等待新容器运行或通过健康检查 / Wait for the new container to run or pass its health check
+        downtime.ok = wait_for_container_ready(ssh, old_container_name)
+    return downtime.ok
+
+
+def container_address(container_info):
+    """
+    主机上访问容器 HTTP 服务的地址：优先使用发布的主机端口，否则使用容器 IP 与暴露的端口。
+    Address at which the host reaches the container's HTTP service: its published host port,
+    or else its IP and exposed port.
+
+    :param container_info: docker inspect 信息 / docker inspect information
+    :return: "地址:端口"，没有可访问的端口时为 None / "address:port", None if there is nothing to reach
+    """
+    network_settings = container_info.get("NetworkSettings") or {}
+    for bindings in (network_settings.get("Ports") or {}).values():
+        for binding in bindings or []:
+            if binding.get("HostPort"):
+                return f"127.0.0.1:{binding['HostPort']}"
+    exposed = list((container_info["Config"].get("ExposedPorts") or {}).keys())
+    addresses = [
+        network.get("IPAddress")
+        for network in (network_settings.get("Networks") or {}).values()
+        if network.get("IPAddress")
+    ]
+    if not exposed or not addresses:
+        return None
+    return f"{addresses[0]}:{exposed[0].split('/')[0]}"
+
+
+def probe_container(ssh, container_name, timeout=None):
+    """
+    通过 HTTP 探测容器是否正常提供服务。优先使用发布的主机端口，否则使用容器 IP。
+    Probe over HTTP whether the container serves traffic, via its published host port or else its IP.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_name: 容器名称 / Container name
+    :param timeout: 超时时间（秒）/ Timeout in seconds
+    :return: 探测是否通过（无可探测端口或未配置路径时视为通过）/ Whether the probe passed (True if nothing to probe)
+    """
+    if not HEALTH_PROBE_PATH:
+        return True
+    status, out, _ = run_command(ssh, f"docker inspect {container_name}")
+    container_info = json.loads(out or "[]") if status == 0 else []
+    if not container_info:
+        return False
+
+    target = container_address(container_info[0])
+    if target is None:
+        logging.info(
+            f"容器 {container_name} 没有可探测的端口，跳过 HTTP 探测"
+        )  # No port to probe, skipping HTTP probe
+        return True
+
+    url = f"http://{target}{HEALTH_PROBE_PATH}"
+    probe = (
+        f"curl -fsS -o /dev/null -m 5 {url} 2>/dev/null"
+        f" || wget -q -O /dev/null -T 5 {url}"
+    )
+    with timing.span("probe") as probe_span:
+        probe_span.ok = bool(
+            wait_until(
+                lambda: True if run_command(ssh, probe)[0] == 0 else None,
+                CONTAINER_READY_TIMEOUT if timeout is None else timeout,
+                f"等待 {url} 健康检查通过",  # Waiting for the health probe to pass
+            )
+        )
+    return probe_span.ok
+
+
+def container_slot(container_info):
+    """
+    容器所在的蓝绿槽位，没有槽位标签的容器属于 blue。
+    The blue/green slot of a container; containers without a slot label are in blue.
+    """
+    labels = (container_info.get("Config") or {}).get("Labels") or {}
+    return "green" if labels.get(SLOT_LABEL) == "green" else "blue"
+
+
+def slot_port_offset(slot):
+    """
+    槽位的主机端口相对 blue 槽位的偏移量。
+    Host port offset of a slot relative to the blue slot.
+    """
+    return BLUE_GREEN_PORT_OFFSET if slot == "green" else 0
+
+
+def swap_container(ssh, container_name, new_image_url, container_info=None):
+    """
+    蓝绿切换：先在备用名称和端口上启动新容器，健康检查通过后再接管网络别名并下线旧容器。
+    旧容器在新容器就绪之前一直提供服务，停机时间仅为切换本身。
+    发布的主机端口在两个槽位之间交替（端口 / 端口 + BLUE_GREEN_PORT_OFFSET），
+    主机上的反向代理应同时配置两个端口；同一网络内通过别名访问的服务（如 NGINX 访问 api）无需改动。
+
+    Blue/green swap: start the new container on an alternate name and port, and once it passes
+    the health probe hand the network aliases over to it and retire the old container.
+    The old container keeps serving until the new one is ready, so downtime is only the switch itself.
+    Published host ports alternate between two slots (port / port + BLUE_GREEN_PORT_OFFSET), so a host
+    reverse proxy should list both; services reaching it by alias on a shared network (e.g. NGINX -> api)
+    need no change.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_name: 容器名称 / Container name
+    :param new_image_url: 新的 Docker 镜像 URL / New Docker image URL
+    :param container_info: 新容器使用的设置，默认取自当前容器 / Settings for the new container, defaults to the current container's
+    :return: 切换是否成功 / Whether the swap succeeded
+    """
+    names_result, inspect_result = run_batch(
+        ssh, ["docker ps -a --format '{{.Names}}'", f"docker inspect {container_name}"]
+    )
+    existing_containers = names_result.stdout.splitlines()
+    current_info = json.loads(inspect_result.stdout or "[]") if inspect_result.ok else []
+    if not current_info:
+        logging.error(
+            f"错误：未找到容器 {container_name} 的信息"
+        )  # Error: Could not find information for container
+        return False
+    current_info = current_info[0]
+    container_info = container_info or current_info
+
+    # 新容器使用运行中容器的另一个槽位；container_info（如快照）可能来自任一槽位，其端口按所在槽位换算
+    # The new container takes the other slot of the running container; container_info (e.g. a snapshot)
+    # may come from either slot, so its ports are shifted from the slot it was taken in
+    slot = "blue" if container_slot(current_info) == "green" else "green"
+    port_offset = slot_port_offset(slot) - slot_port_offset(container_slot(container_info))
+    candidate_name = f"{container_name}_{slot}"
+
+    # 清理上次失败留下的备用容器后启动新容器 / Remove a leftover candidate from a failed run, then start the new one
+    create_command = build_run_command(
+        container_info, candidate_name, new_image_url, port_offset, {SLOT_LABEL: slot}
+    )
+    commands = [create_command]
+    if candidate_name in existing_containers:
+        commands.insert(0, f"docker rm -f {candidate_name}")
+    fence = _fence(container_name)
+    results = run_batch(ssh, fence + commands, stop_on_error=bool(fence))
+    if fence and not results[0].ok:
+        _fence_refused(container_name, results[0])
+        return False
+    run_result = results[-1]
+    logging.info(run_result.stdout)  # 打印标准输出 / Print standard output
+    if not run_result.ok:
+        logging.error(run_result.stderr)  # 打印标准错误输出 / Print standard error output
+        return False
+
+    if not (
+        wait_for_container_ready(ssh, candidate_name)
+        and probe_container(ssh, candidate_name)
+    ):
+        logging.error(
+            f"新容器 {candidate_name} 未通过健康检查，保留旧容器 {container_name}"
+        )  # New container failed its health check, keeping the old one
+        run_command(ssh, f"docker rm -f {candidate_name}")
+        return False
+
+    retired_name = f"{container_name}_old"
+    while retired_name in existing_containers:
+        retired_name += "_old"
+
+    # 先为新容器挂上别名，再断开旧容器，最后交换名称并删除旧容器；交换名称前后写入部署日志，中断后由 resume_host() 完成切换
+    # Give the new container the aliases first, then detach the old one, then swap names and retire it;
+    # the renames are journaled before and after, so resume_host() completes them after an interruption
+    switch = _fence(container_name)
+    networks = container_info.get("NetworkSettings", {}).get("Networks") or {}
+    for network_name, network in networks.items():
+        if network_name in ("bridge", "host", "none"):
+            continue  # 默认网络不支持别名 / Default networks do not support aliases
+        aliases = [
+            alias
+            for alias in network.get("Aliases") or []
+            if not container_info.get("Id", "").startswith(alias) and alias != container_name
+        ] + [container_name]
+        alias_flags = " ".join(f"--alias {alias}" for alias in aliases)
+        switch += [
+            f"docker network disconnect {network_name} {candidate_name}",
+            f"docker network connect {alias_flags} {network_name} {candidate_name}",
+            f"docker network disconnect -f {network_name} {container_name}",
+        ]
+    _record(container_name, "begin", temp=retired_name, candidate=candidate_name)
+    switch += [
+        _journal(container_name, "begin", temp=retired_name, candidate=candidate_name),
+        f"docker rename {container_name} {retired_name}",
+        f"docker rename {candidate_name} {container_name}",
+        f"docker rm -f {retired_name}",
+        _journal(container_name, "created"),
+    ]
+    started = time.monotonic()
+    # 蓝绿模式下停机时间只有切换本身 / In blue/green mode the downtime is only the switch
+    with timing.span("downtime") as downtime:
+        results = run_batch(ssh, switch, stop_on_error=True)
+        failed = [result for result in results if result.status not in (0, None)]
+        downtime.ok = not failed
+    if failed:
+        logging.error(
+            f"切换容器 {container_name} 失败：{failed[0].command}：{failed[0].stderr.strip()}"
+        )  # Swapping container failed
+        if fence and failed[0] is results[0]:
+            return False  # 其他部署已接手，不做改动 / Another deploy took over, leave everything alone
+        done = {result.command for result in results if result.ok}
+        if f"docker rename {candidate_name} {container_name}" not in done:
+            _undo_switch(ssh, container_name, candidate_name, retired_name, current_info, done)
+            return False
+        # 新容器已接管，只剩清理 / The new container took over, only the cleanup is left
+        run_batch(ssh, [f"docker rm -f {retired_name}", _journal(container_name, "created")], stop_on_error=True)
+    _record(container_name, "created")
+    logging.info(
+        f"容器 {container_name} 已切换到 {slot} 槽位，切换用时 {time.monotonic() - started:.2f}s"
+    )  # Container switched to slot, switch took
+    return True
+
+
+def _undo_switch(ssh, container_name, candidate_name, retired_name, current_info, done):
+    """
+    撤销未完成的蓝绿切换：旧容器改回原名称，以原来的别名重新接入已断开的网络，然后删除新容器。
+    Undo a partial blue/green switch: give the old container its name back, reconnect it with its
+    original aliases to the networks it was detached from, then remove the new container.
+
+    :param current_info: 旧容器的 docker inspect 信息 / docker inspect information of the old container
+    :param done: 切换中已成功执行的命令 / Commands of the switch that succeeded
+    """
+    undo = []
+    if f"docker rename {container_name} {retired_name}" in done:
+        undo.append(f"docker rename {retired_name} {container_name}")
+    networks = current_info.get("NetworkSettings", {}).get("Networks") or {}
+    for network_name, network in networks.items():
+        if f"docker network disconnect -f {network_name} {container_name}" not in done:
+            continue
+        aliases = [
+            alias for alias in network.get("Aliases") or [] if not current_info.get("Id", "").startswith(alias)
+        ]
+        alias_flags = "".join(f"--alias {alias} " for alias in aliases)
+        undo.append(f"docker network connect {alias_flags}{network_name} {container_name}")
+    undo += [f"docker rm -f {candidate_name}", _journal(container_name, "aborted")]
+    failed = [result for result in run_batch(ssh, undo) if not result.ok]
+    if failed:
+        logging.error(
+            f"错误：无法恢复旧容器 {container_name}：{failed[0].command}：{failed[0].stderr.strip()}"
+        )  # Error: could not restore the old container
+        return
+    _record(container_name, "aborted")
+    logging.warning(f"已恢复旧容器 {container_name}")  # Restored the old container
+
+
+def get_image_url(api_url=None, cache_dir=None, ttl=None):
+    """
+    从指定的 API 获取 Docker 镜像 URL。清单在本地获取并缓存，同一次运行中的所有主机共享。
+    Get the Docker image URL from the specified API. The manifest is fetched locally
+    and cached, shared by every host in the run.
+
+    :param api_url: API 地址，默认 RELEASE_API_URL / API address, defaults to RELEASE_API_URL
+    :param cache_dir: 缓存目录，默认 RELEASE_CACHE_DIR / Cache directory, defaults to RELEASE_CACHE_DIR
+    :param ttl: 缓存有效期（秒），默认 RELEASE_CACHE_TTL / Cache TTL, defaults to RELEASE_CACHE_TTL
+    :return: Docker 镜像 URL / Docker image URL
+    """
+    data = fetch_manifest(
+        api_url or RELEASE_API_URL,
+        user_agent=os.getenv("USER_AGENT"),  # 获取用户代理 / Get user agent
+        cache_dir=cache_dir or os.getenv("RELEASE_CACHE_DIR"),
+        ttl=ttl if ttl is not None else RELEASE_CACHE_TTL,
+    )
+    if data is None:
+        return None
+
+    image_name = (
+        data.get("image_name") if isinstance(data, dict) else None
+    )  # 获取 image_name 字段 / Get the image_name field
+    if image_name is not None:
+        logging.info(
+            f"找到的 image_name: {image_name}"
+        )  # Found image_name: {image_name}
+        return image_name  # 返回 Docker 镜像名称 / Return Docker image name
+    logging.error(
+        "错误：响应中未找到 'image_name' 字段"
+    )  # Error: 'image_name' field not found in response
+    return None
+
+
+@timing.timed("cleanup")
+def cleanup_unused_images(ssh, image_url=None):
+    """
+    按保留策略清理 Docker 镜像：保留容器正在使用的镜像、备份引用的镜像（用于快速回滚）
+    以及目标仓库最近的 IMAGE_RETENTION 个版本；仅当 Docker 数据目录所在磁盘的使用率
+    超过 IMAGE_PRUNE_THRESHOLD 时才删除其余镜像，以免下次部署或回滚重新下载共享的基础层。
+    Clean up Docker images by retention policy: images used by a container, images referenced by
+    a backup (for fast rollbacks) and the IMAGE_RETENTION most recent versions of the target
+    repository are kept; the rest is only removed once the disk holding the Docker data root is
+    fuller than IMAGE_PRUNE_THRESHOLD, so the next deploy or rollback does not download shared
+    base layers again.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param image_url: 本次部署的镜像 URL，其仓库保留最近版本 / Image URL of this deploy, its repository keeps recent versions
+    :return: 清理报告字典，无法获取镜像信息时为 None / Cleanup report dictionary, None if the images could not be listed
+    """
+    logging.info(
+        "正在清理未使用的 Docker 镜像..."
+    )  # Cleaning up unused Docker images...
+    df_command = f"df -P {image_retention.DOCKER_ROOT}"
+    api = engine_api(ssh)
+
+    # 一次往返内获取镜像、容器使用的镜像、磁盘使用率与备份引用的镜像
+    # Get the images, the images used by containers, disk usage and backup references in one round trip
+    commands = [df_command, backup_store.referenced_images_command()]
+    if api is None:
+        commands += ["docker image ls -q --no-trunc", "docker ps -a --format '{{.Image}}'"]
+    results = run_batch(ssh, commands)
+    disk = image_retention.parse_df(results[0].stdout)
+    protected = set(results[1].stdout.split())
+    try:
+        if api is not None:
+            image_ids = api.list_image_ids()
+            in_use = api.list_container_image_ids()
+            images = [image for image in map(api.inspect_image, image_ids) if image]
+        else:
+            image_ids = sorted(set(results[2].stdout.split()))
+            in_use = results[3].stdout.split()
+            if not results[2].ok:
+                raise DockerAPIError(results[2].status, results[2].stderr.strip())
+            images = []
+            if image_ids:  # 没有镜像时 docker image inspect 会报错 / docker image inspect fails without arguments
+                status, out, err = run_command(ssh, "docker image inspect " + " ".join(image_ids))
+                if status != 0:
+                    raise DockerAPIError(status, err.strip())
+                images = json.loads(out or "[]")
+    except DockerAPIError as e:
+        logging.error(f"错误：无法获取镜像列表：{e}")  # Error: could not list the images
+        return None
+
+    repositories = [image_retention.repository_of(image_url)] if image_url else []
+    kept, removable = image_retention.select_images(images, in_use, protected, repositories)
+    report = {"removed": [], "reclaimed_bytes": 0, "kept": kept}
+
+    if removable and disk and disk[2] < image_retention.IMAGE_PRUNE_THRESHOLD:
+        logging.info(
+            f"磁盘使用率 {disk[2]:.0f}% 未超过 {image_retention.IMAGE_PRUNE_THRESHOLD:.0f}%，"
+            f"保留 {len(removable)} 个可删除的镜像"
+        )  # Disk usage below the threshold, keeping removable images
+        removable = []
+
+    if removable:
+        if api is not None:
+            report["removed"] = [image["Id"] for image in removable if api.remove_image(image["Id"])]
+            after = image_retention.parse_df(run_command(ssh, df_command)[1])
+        else:
+            # 按标签删除，标签全部删除后镜像随之删除 / Remove by tag, the image goes with its last tag
+            removals = run_batch(
+                ssh,
+                [
+                    "docker image rm " + " ".join(image.get("RepoTags") or [image["Id"]])
+                    for image in removable
+                ]
+                + [df_command],
+            )
+            report["removed"] = [
+                image["Id"] for image, result in zip(removable, removals) if result.ok
+            ]
+            for result in removals[:-1]:
+                if not result.ok:
+                    logging.warning(
+                        f"无法删除镜像：{result.stderr.strip()}"
+                    )  # Could not remove the image
+            after = image_retention.parse_df(removals[-1].stdout)
+        if disk and after:
+            report["reclaimed_bytes"] = max(0, disk[0] - after[0])
+
+    layers_kept, layers_shared = image_retention.layer_report(images, kept, report["removed"])
+    report["layers_kept"] = layers_kept
+    logging.info(
+        f"已删除 {len(report['removed'])} 个镜像，回收 {report['reclaimed_bytes']} 字节；"
+        f"保留 {len(kept)} 个镜像、{layers_kept} 个层（其中 {layers_shared} 个与已删除镜像共享）"
+    )  # Removed images, reclaimed bytes; kept images and layers (shared with removed images)
+    return report
+
+
+@dataclass
+class HostResult:
+    """
+    单台主机的部署结果。
+    Deployment result of a single host.
+    """
+
+    host: str
+    ok: bool = False
+    containers: dict = field(default_factory=dict)  # 容器名 -> 状态 / name -> status
+    error: str = None
+    duration: float = 0.0
+    changes: dict = field(default_factory=dict)  # 容器名 -> 计划的变更 / name -> planned changes
+    actions: list = field(default_factory=list)  # 计划的操作 / Planned actions
+    estimate: float = 0.0  # 计划的预计耗时（秒）/ Expected duration of the plan (seconds)
+
+
+def parse_hosts(value, default_port=22):
+    """
+    解析以 "&" 分隔的主机列表，每项可带 ":端口" 覆盖默认端口。
+    Parse an "&"-separated host list, each entry may carry ":port" to override the default.
+
+    :param value: 主机列表字符串，如 "a.example.com&b.example.com:2222" / Host list string
+    :param default_port: 默认 SSH 端口 / Default SSH port
+    :return: (主机, 端口) 列表 / List of (host, port)
+    """
+    hosts = []
+    for entry in (value or "").split("&"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, sep, port = entry.rpartition(":")
+        if sep and port.isdigit():
+            hosts.append((host, int(port)))
+        else:
+            hosts.append((entry, default_port))
+    return hosts
+
+
+@dataclass
+class HostPlan:
+    """
+    单台主机的部署计划：已建立的连接、需要重新创建的容器以及部署结果。
+    Deployment plan of a single host: the open connection, the containers to recreate and the result.
+    """
+
+    host: str
+    result: HostResult
+    image_url: str = None
+    ssh: object = None
+    recreate: list = field(default_factory=list)
+    started: float = 0.0
+    # 环境变化的容器重新创建时使用的设置 / Settings used to recreate containers whose environment changes
+    settings: dict = field(default_factory=dict)
+    # 容器 -> 需要先重新创建的容器（来自 compose 的 depends_on）/ name -> containers to recreate first (from compose depends_on)
+    depends: dict = field(default_factory=dict)
+
+
+@timing.timed("prepare", host="host")
+def prepare_host(
+    host,
+    port,
+    username,
+    private_key,
+    container_names,
+    image_url,
+    image_digest=None,
+    connect=None,
+    pulled=False,
+):
+    """
+    准备单台主机的部署：连接、拉取镜像、备份容器设置并找出需要重新创建的容器。
+    镜像只拉取一次，并在备份容器设置的同时在后台进行。异常记录在结果中，连接随之关闭。
+    Prepare a host for deployment: connect, pull the image, back up the container settings and
+    find the containers that need recreating. The image is pulled once, in the background while the
+    settings are backed up. Errors are captured in the result and close the connection.
+
+    :param host: 服务器地址 / Server address
+    :param port: SSH 端口 / SSH port
+    :param username: 登录用户名 / Login username
+    :param private_key: 私钥 / Private key
+    :param container_names: 容器名称列表 / List of container names
+    :param image_url: Docker 镜像 URL / Docker image URL
+    :param image_digest: 预先解析的镜像摘要 / Pre-resolved image digest
+    :param connect: 建立连接的函数，默认 remote_login / Connection factory, defaults to remote_login
+    :param pulled: 镜像已由 fan_out_image() 送达，无需拉取 / The image was already delivered by fan_out_image(), no pull needed
+    :return: HostPlan 对象 / HostPlan object
+    """
+    threading.current_thread().name = host  # 日志中显示主机名 / Show host name in logs
+    plan = HostPlan(host=host, result=HostResult(host=host), image_url=image_url)
+    plan.started = time.monotonic()
+    result = plan.result
+    try:
+        with timing.span("connect"):
+            plan.ssh = (connect or remote_login)(
+                host, username, port, private_key
+            )  # 远程登录 / Remote login
+        ssh = plan.ssh
+        # 先完成上次中断的部署，之后的检查会跳过已是目标版本的容器
+        # Finish an interrupted deploy first; the checks below then skip the containers already at the target
+        resumed = resume_host(ssh, container_names)
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{host}/pull") as pool:
+            # 后台拉取新的 Docker 镜像 / Pull the new Docker image in the background
+            pull = None if pulled else pool.submit(
+                timing.bind(pull_docker_image), ssh, image_url, image_digest
+            )
+
+            # 一次往返内获取所有容器的信息 / Inspect all containers in one round trip
+            with timing.span("inspect"):
+                container_infos = inspect_cached(ssh, container_names)
+            backed_up = []
+            for container_name in container_names:
+                logging.info(
+                    f"正在备份容器：{container_name}"
+                )  # Backing up container: {container_name}
+                backup_file = backup_container_settings(
+                    ssh, container_name, container_infos[container_name] or {}
+                )  # 备份容器设置 / Backup container settings
+
+                # 如果未找到容器，则跳过后续操作 / If the container is not found, skip subsequent operations
+                if not backup_file:
+                    result.containers[container_name] = "missing"
+                    continue
+                backed_up.append(container_name)
+            for container_name, recovered in resumed.items():
+                if not recovered:
+                    result.containers[container_name] = "failed"
+                    backed_up = [name for name in backed_up if name != container_name]
+
+            with timing.span("pull_wait"):
+                image_ready = pull.result() if pull else True  # 等待镜像拉取完成 / Wait for the pull to finish
+
+        target_image_id = image_id(ssh, image_url) if image_ready else None
+        index = env_index.load_index()
+        for container_name in backed_up:
+            if not image_ready:
+                result.containers[container_name] = "failed"
+                continue
+
+            container_info = container_infos[container_name]
+            env = None
+            if index is not None:
+                container_info = with_rendered_env(index, container_name, container_info)
+                env = env_index.env_dict(container_info["Config"].get("Env"))
+                if container_info is not container_infos[container_name]:
+                    plan.settings[container_name] = container_info
+
+            # 与目标一致的容器无需重新创建 / Containers that already match the target are left alone
+            changes = diff_container_spec(
+                container_spec_summary(container_infos[container_name]),
+                target_spec_summary(container_infos[container_name], target_image_id, env),
+            )
+            if not changes and not FORCE_RECREATE:
+                logging.info(
+                    f"容器 {container_name} 已是目标版本，跳过"
+                )  # Container already matches the target, skipping
+                result.containers[container_name] = SKIPPED
+                continue
+            for field_name, change in changes.items():
+                logging.info(
+                    f"容器 {container_name} 的 {field_name} 将变更：{change}"
+                )  # Container field will change
+            plan.recreate.append(container_name)
+        graph = compose_graph.build_graph(plan.recreate) if compose_graph.COMPOSE_ORDER else None
+        if graph is not None:
+            # 依赖在前 / Dependencies first
+            plan.depends = graph
+            plan.recreate = compose_graph.order(graph)
+    except Exception as e:
+        logging.exception(f"主机 {host} 部署失败")  # Deployment failed on host
+        result.error = str(e)
+        if plan.ssh is not None:
+            plan.ssh.close()
+            plan.ssh = None
+        plan.recreate = []
+    return plan
+
+
+def apply_container(plan, container_name):
+    """
+    按计划重新创建一个容器并记录结果。
+    Recreate one planned container and record the outcome.
+
+    :param plan: HostPlan 对象 / HostPlan object
+    :param container_name: 容器名称 / Container name
+    :return: 是否成功 / Whether it succeeded
+    """
+    logging.info(
+        f"正在处理容器：{container_name}"
+    )  # Processing container: {container_name}
+    try:
+        recreated = recreate_container(
+            plan.ssh, container_name, plan.image_url, container_info=plan.settings.get(container_name)
+        )  # 重新创建容器 / Recreate container
+    except Exception:
+        logging.exception(
+            f"重新创建容器 {container_name} 失败"
+        )  # Recreating the container failed
+        recreated = False
+    status = "recreated" if recreated else "failed"
+    plan.result.containers[container_name] = SKIPPED if recreated == SKIPPED else status
+    return recreated
+
+
+def critical_path_estimate(plan):
+    """
+    按每个容器的历史重新创建耗时（没有时取主机的平均值）估算主机上重新创建计划容器的关键路径。
+    Estimate the critical path of recreating the planned containers of a host from each container's
+    earlier recreate timings, falling back to the host's mean.
+
+    :param plan: HostPlan 对象 / HostPlan object
+    :return: (关键路径秒数, 依次处理的秒数, 容器名列表) / (critical path seconds, one-by-one seconds, list of names)
+    """
+    from . import planner  # planner 导入了本模块 / planner imports this module
+
+    timings = os.path.join(DEPLOY_METRICS_DIR or ".", "deploy_spans.jsonl")
+    durations = planner.load_durations(timings) if os.path.isfile(timings) else None
+    seconds = {name: planner.expected(durations, "recreate", plan.host, name) for name in plan.recreate}
+    total, path = compose_graph.critical_path(
+        {name: plan.depends.get(name, set()) & set(plan.recreate) for name in plan.recreate}, seconds
+    )
+    return total, sum(seconds.values()), path
+
+
+def apply_plan(plan):
+    """
+    按 compose 依赖图重新创建主机上的计划容器：互不依赖的容器并行，依赖就绪（healthy）后才处理依赖它的容器，
+    依赖失败的容器标记为 pending。未启用 COMPOSE_ORDER 或没有依赖图时依次处理。
+    Recreate the planned containers of a host along the compose dependency graph: independent
+    containers run in parallel and a container only starts once its dependencies are ready
+    (healthy); containers whose dependency failed are marked pending. Without COMPOSE_ORDER
+    or a dependency graph they are handled one by one.
+
+    :param plan: HostPlan 对象 / HostPlan object
+    """
+    if not compose_graph.COMPOSE_ORDER or not plan.depends or len(plan.recreate) < 2:
+        for container_name in plan.recreate:
+            apply_container(plan, container_name)
+        return
+    total, sequential, path = critical_path_estimate(plan)
+    logging.info(
+        f"主机 {plan.host} 关键路径预计 {total:.0f} 秒（依次处理约 {sequential:.0f} 秒）：{' -> '.join(path)}"
+    )  # Critical path estimate of the host
+
+    def apply(container_name):
+        threading.current_thread().name = plan.host  # 日志中显示主机名 / Show host name in logs
+        return apply_container(plan, container_name)
+
+    outcome = compose_graph.run_graph(
+        {name: plan.depends.get(name, set()) & set(plan.recreate) for name in plan.recreate}, apply
+    )
+    for container_name, recreated in outcome.items():
+        if recreated is None:
+            plan.result.containers[container_name] = "pending"
+
+
+def finish_host(plan):
+    """
+    清理镜像、关闭连接并汇总单台主机的结果。
+    Clean up images, close the connection and finalise the result of a single host.
+
+    :param plan: HostPlan 对象 / HostPlan object
+    :return: HostResult 对象 / HostResult object
+    """
+    result = plan.result
+    if plan.ssh is not None:
+        try:
+            with timing.context(host=plan.host):
+                # 清理未使用的 Docker 镜像 / Clean up unused Docker images
+                cleanup_unused_images(plan.ssh, plan.image_url)
+        except Exception as e:
+            logging.exception(f"主机 {plan.host} 清理镜像失败")  # Image cleanup failed on host
+            result.error = str(e)
+        finally:
+            plan.ssh.close()  # 关闭 SSH 连接 / Close SSH connection
+            plan.ssh = None
+    result.ok = result.error is None and not {"failed", "pending", ROLLED_BACK} & set(
+        result.containers.values()
+    )
+    result.duration = time.monotonic() - plan.started
+    return result
+
+
+@timing.timed("host", host="host")
+def deploy_host(
+    host,
+    port,
+    username,
+    private_key,
+    container_names,
+    image_url,
+    image_digest=None,
+    connect=None,
+    pulled=False,
+):
+    """
+    在单台主机上按 apply_plan() 部署所有容器，异常不会向外抛出，而是记录在结果中。
+    Deploy every container of a single host with apply_plan(); errors are captured in the result instead of raised.
+
+    :param host: 服务器地址 / Server address
+    :param port: SSH 端口 / SSH port
+    :param username: 登录用户名 / Login username
+    :param private_key: 私钥 / Private key
+    :param container_names: 容器名称列表 / List of container names
+    :param image_url: Docker 镜像 URL / Docker image URL
+    :param image_digest: 预先解析的镜像摘要 / Pre-resolved image digest
+    :param connect: 建立连接的函数，默认 remote_login / Connection factory, defaults to remote_login
+    :param pulled: 镜像已由 fan_out_image() 送达 / The image was already delivered by fan_out_image()
+    :return: HostResult 对象 / HostResult object
+    """
+    plan = prepare_host(
+        host,
+        port,
+        username,
+        private_key,
+        container_names,
+        image_url,
+        image_digest,
+        connect,
+        pulled,
+    )
+    apply_plan(plan)
+    return finish_host(plan)
+
+
+def health_gate(plan, container_name, probe=None):
+    """
+    批次之间的健康检查：等待 ROLLING_GATE_DELAY 后容器仍在运行（或 healthy），
+    启用时还需通过 HTTP 探测。
+    Health gate between batches: the container must still be running (or healthy) after
+    ROLLING_GATE_DELAY, and pass the HTTP probe when enabled.
+
+    :param plan: HostPlan 对象 / HostPlan object
+    :param container_name: 容器名称 / Container name
+    :param probe: 是否做 HTTP 探测，默认 ROLLING_HEALTH_PROBE / Whether to probe over HTTP, defaults to ROLLING_HEALTH_PROBE
+    :return: 是否通过 / Whether the gate passed
+    """
+    if ROLLING_GATE_DELAY:
+        time.sleep(ROLLING_GATE_DELAY)
+    state = container_state(plan.ssh, container_name)
+    if state is None or state[0] != "running" or state[1] not in ("", "healthy"):
+        logging.error(
+            f"容器 {container_name} 未通过健康检查：{state}"
+        )  # Container failed the health gate
+        return False
+    if ROLLING_HEALTH_PROBE if probe is None else probe:
+        return probe_container(plan.ssh, container_name)
+    return True
+
+
+def rolling_update(plans, batch_size, max_unavailable=None, probe=None):
+    """
+    跨主机滚动更新：按批重新创建容器，同一批内并行，原地重建同时不可用的容器数不超过 max_unavailable
+    （蓝绿切换不减少容量，不计入）。每批结束后做健康检查，任一容器未通过即停止，
+    其余容器保持原样并标记为 pending。
+    容器按 CONTAINER_NAMES 顺序（启用 COMPOSE_ORDER 时依赖在前）在主机之间交错排列，同一容器的副本分布在不同批次，
+    依赖与依赖它的容器不在同一批。
+
+    Rolling update across hosts: containers are recreated in batches, in parallel within a batch,
+    with at most max_unavailable in-place recreations down at once (blue/green swaps keep capacity
+    and do not count). Each batch must pass the health gate; the first failure stops the rollout
+    and the remaining containers are left untouched and marked pending.
+    Containers are interleaved across hosts in CONTAINER_NAMES order (dependencies first with
+    COMPOSE_ORDER), and a container never shares a batch with its dependencies.
+
+    :param plans: HostPlan 列表 / List of HostPlan
+    :param batch_size: 每批容器数 / Containers per batch
+    :param max_unavailable: 同时不可用的容器数上限，默认等于 batch_size / Most containers down at once, defaults to batch_size
+    :param probe: 健康检查是否做 HTTP 探测 / Whether the gate probes over HTTP
+    :return: 是否全部批次通过 / Whether every batch passed
+    """
+    units = []
+    for index in range(max((len(plan.recreate) for plan in plans), default=0)):
+        units += [(plan, plan.recreate[index]) for plan in plans if index < len(plan.recreate)]
+    if not units:
+        return True
+    batch_size = max(1, batch_size)
+    slots = threading.BoundedSemaphore(max(1, max_unavailable or batch_size))
+
+    def update(unit):
+        plan, container_name = unit
+        threading.current_thread().name = plan.host  # 日志中显示主机名 / Show host name in logs
+        in_place = not uses_blue_green(container_name)
+        with timing.context(host=plan.host):
+            if in_place:
+                slots.acquire()
+            try:
+                recreated = apply_container(plan, container_name)
+            finally:
+                if in_place:
+                    slots.release()
+            if recreated and not health_gate(plan, container_name, probe):
+                plan.result.containers[container_name] = "failed"
+                return False
+            return recreated
+
+    batches = []
+    for plan, container_name in units:
+        # 依赖在前一批通过健康检查后才更新 / A dependency must pass an earlier batch's gate first
+        if (
+            not batches
+            or len(batches[-1]) >= batch_size
+            or any(other is plan and name in plan.depends.get(container_name, ()) for other, name in batches[-1])
+        ):
+            batches.append([])
+        batches[-1].append((plan, container_name))
+    with ThreadPoolExecutor(max_workers=batch_size, thread_name_prefix="rolling") as pool:
+        for number, batch in enumerate(batches, 1):
+            logging.info(
+                f"滚动更新第 {number}/{len(batches)} 批："
+                + ", ".join(f"{plan.host}/{name}" for plan, name in batch)
+            )  # Rolling update batch
+            with timing.span("batch", batch=number) as batch_span:
+                batch_span.ok = all(pool.map(update, batch))
+            if not batch_span.ok:
+                remaining = [unit for later in batches[number:] for unit in later]
+                for plan, container_name in remaining:
+                    plan.result.containers[container_name] = "pending"
+                logging.error(
+                    f"第 {number} 批未通过健康检查，停止滚动更新，{len(remaining)} 个容器未更新"
+                )  # Batch failed its health gate, stopping the rollout
+                return False
+    return True
+
+
+def measure_container(ssh, container_name, mix):
+    """
+    按请求组合在主机上测量容器的 HTTP 延迟与错误率。
+    Measure the container's HTTP latency and error rate on the host with the request mix.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_name: 容器名称 / Container name
+    :param mix: canary.parse_mix() 的结果 / Result of canary.parse_mix()
+    :return: canary.summarize() 的结果，没有可访问的端口时为 None / Result of canary.summarize(), None if there is nothing to reach
+    """
+    container_info = inspect_containers(ssh, [container_name])[container_name]
+    address = container_address(container_info) if container_info else None
+    if address is None:
+        return None
+    with timing.span("measure"):
+        return canary.measure(lambda command: run_command(ssh, command), f"http://{address}", mix)
+
+
+@timing.timed("canary")
+def canary_step(plans, mix=None):
+    """
+    金丝雀：先测量第一个待更新容器的旧版本作为基线，更新后以同样的请求组合测量新版本。
+    延迟或错误率超出阈值时自动回滚该容器，其余容器保持原样并标记为 pending。
+    Canary: measure the old version of the first container to update as the baseline, update it
+    and measure the new version with the same request mix. Beyond the limits the container is rolled
+    back automatically and the remaining containers are left untouched and marked pending.
+
+    :param plans: HostPlan 列表，金丝雀容器会从其计划中移除 / List of HostPlan, the canary container is taken out of its plan
+    :param mix: 请求组合，默认 CANARY_REQUESTS / Request mix, defaults to CANARY_REQUESTS
+    :return: 是否可以继续 / Whether the rollout may continue
+    """
+    plan = next((plan for plan in plans if plan.recreate), None)
+    if plan is None:
+        return True
+    container_name = plan.recreate.pop(0)
+    mix = mix or canary.parse_mix(canary.CANARY_REQUESTS, HEALTH_PROBE_PATH or "/")
+    report = {"host": plan.host, "container": container_name, "image": plan.image_url}
+
+    def stop(reason):
+        for other in plans:
+            for name in other.recreate:
+                other.result.containers[name] = "pending"
+            other.recreate = []
+        report["failures"] = reason
+        canary.write_report(DEPLOY_METRICS_DIR, report)
+        return False
+
+    with timing.context(host=plan.host, container=container_name):
+        logging.info(
+            f"金丝雀：{plan.host}/{container_name}"
+        )  # Canary
+        report["baseline"] = baseline = measure_container(plan.ssh, container_name, mix)
+        if not apply_container(plan, container_name):
+            return stop(["recreate failed"])
+        if baseline is None or not baseline["count"]:
+            # 无法测量时只依赖重新创建时的就绪与健康检查 / Without a measurement only the readiness and health checks apply
+            logging.warning(
+                f"无法测量容器 {container_name} 的基线，跳过延迟比较"
+            )  # Could not measure the baseline, skipping the latency comparison
+            canary.write_report(DEPLOY_METRICS_DIR, report)
+            return True
+        report["canary"] = candidate = measure_container(plan.ssh, container_name, mix) or canary.summarize("")
+        failures = canary.compare(baseline, candidate)
+        logging.info(
+            f"金丝雀 {container_name}：基线 {canary.describe(baseline)}；新版本 {canary.describe(candidate)}"
+        )  # Canary: baseline; new version
+        if failures:
+            logging.error(
+                f"金丝雀 {container_name} 超出阈值（{'; '.join(failures)}），正在回滚"
+            )  # Canary beyond the limits, rolling back
+            rolled_back = rollback_container(plan.ssh, container_name)
+            plan.result.containers[container_name] = ROLLED_BACK if rolled_back else "failed"
+            return stop(failures)
+    report["failures"] = []
+    canary.write_report(DEPLOY_METRICS_DIR, report)
+    return True
+
+
+def _mib(size):
+    return size / (1 << 20)
+
+
+@timing.timed("fanout")
+def fan_out_image(hosts, username, private_key, image_url, image_digest=None, concurrency=None, connect=None):
+    """
+    点对点分发镜像：第一台主机作为种子从仓库拉取镜像，然后以 docker save | docker load 经 SSH 通道
+    流式传给其他主机。每收到镜像的主机随即成为下一轮的源，传输轮数随主机数按对数增长。
+    数据经由运行本脚本的机器中转，不落盘；目标已有的层不发送。docker load 不保留 RepoDigests，
+    因此在每台目标主机上记录摘要，供下次部署的摘要检查与备份使用。分发失败的主机在准备阶段照常拉取。
+    Distribute the image peer to peer: the first host is the seed and pulls from the registry, then
+    the image is streamed to the other hosts as docker save | docker load over SSH channels. Every
+    host that received the image becomes a source for the next round, so the number of rounds grows
+    with the logarithm of the host count. The data is relayed through the machine running this
+    script and never written to disk; layers a target already has are not sent. docker load keeps no
+    RepoDigests, so the digest is recorded on each target for the next deploy's digest check and the
+    backups. Hosts the fan-out failed for pull as usual when they are prepared.
+
+    :param hosts: (主机, 端口) 列表，第一台为种子 / List of (host, port), the first one is the seed
+    :param username: 登录用户名 / Login username
+    :param private_key: 私钥 / Private key
+    :param image_url: Docker 镜像 URL / Docker image URL
+    :param image_digest: 预先解析的镜像摘要 / Pre-resolved image digest
+    :param concurrency: 同时进行的传输数上限，默认不限 / Max transfers in flight, defaults to no limit
+    :param connect: 建立连接的函数，默认 remote_login / Connection factory, defaults to remote_login
+    :return: 已有镜像的主机集合 / Set of hosts that have the image
+    """
+    connections = {}
+    repo_digest = f"{image_retention.repository_of(image_url)}@{image_digest}" if image_digest else None
+
+    def open_connection(entry):
+        host, port = entry
+        try:
+            connections[host] = (connect or remote_login)(host, username, port, private_key)
+        except Exception as e:
+            logging.warning(f"分发镜像时无法连接主机 {host}：{e}")  # Could not connect to the host for the fan-out
+
+    def hop(pair):
+        source, target = pair
+        threading.current_thread().name = target  # 日志中显示主机名 / Show host name in logs
+        with timing.context(host=target), timing.span("fanout_hop", source=source) as span:
+            report = image_fanout.transfer(connections[source], connections[target], image_url, image)
+            if report["ok"] and not report["present"] and repo_digest:
+                # 记录载入镜像的仓库摘要，下次部署的摘要检查与备份都用得到
+                # Record the repository digest of the loaded image for the next deploy's digest check and the backups
+                record = image_fanout.record_digest_command(backup_store.BACKUP_DIR, image[0], repo_digest)
+                status, _, err = run_command(connections[target], record)
+                if status != 0:
+                    logging.warning(f"无法记录镜像 {image_url} 的摘要：{err.strip()}")  # Could not record the image digest
+            span.ok = report["ok"]
+        if not report["ok"]:
+            logging.warning(
+                f"从 {source} 传输镜像失败，将从仓库拉取：{report['error']}"
+            )  # Transfer from the source failed, the host will pull from the registry
+        elif report["present"]:
+            logging.info(f"主机上已有镜像 {image_url}，跳过传输")  # Image already on host, transfer skipped
+        else:
+            seconds = max(report["seconds"], 1e-6)
+            logging.info(
+                f"镜像从 {source} 传到 {target}：发送 {_mib(report['sent']):.1f} MiB，"
+                f"跳过 {report['skipped_layers']} 个已有层（{_mib(report['skipped_bytes']):.1f} MiB），"
+                f"用时 {seconds:.1f}s，{_mib(report['sent']) / seconds:.1f} MiB/s"
+                f"（读取 {_mib(report['read']) / seconds:.1f} MiB/s）"
+            )  # Image sent from source to target: MiB sent, existing layers skipped, time, throughput (read throughput)
+        return report["ok"]
+
+    ready = set()
+    try:
+        with ThreadPoolExecutor(max_workers=len(hosts), thread_name_prefix="fanout") as pool:
+            list(pool.map(open_connection, hosts))
+            seed = hosts[0][0]
+            if seed not in connections:
+                return ready
+            with timing.context(host=seed):
+                if not pull_docker_image(connections[seed], image_url, image_digest):
+                    return ready
+            image = image_fanout.image_layers(connections[seed], image_url)
+            if image is None:
+                return ready
+            ready.add(seed)
+
+            sources = [seed]
+            pending = [host for host, _ in hosts[1:] if host in connections]
+            while pending:
+                width = min(len(sources), len(pending), concurrency or len(pending))
+                pairs = list(zip(sources[:width], pending[:width]))
+                pending = pending[width:]
+                for (source, target), ok in zip(pairs, pool.map(hop, pairs)):
+                    if ok:
+                        ready.add(target)
+                        sources.append(target)
+    finally:
+        for ssh in connections.values():
+            ssh.close()
+    logging.info(
+        f"镜像已分发到 {len(ready)}/{len(hosts)} 台主机"
+    )  # Image distributed to hosts
+    return ready
+
+
+@timing.timed("rollout")
+def rollout(
+    hosts,
+    username,
+    private_key,
+    container_names,
+    image_url,
+    concurrency=None,
+    connect=None,
+    batch_size=None,
+    max_unavailable=None,
+    fanout=None,
+    canary_first=None,
+):
+    """
+    并发地在所有主机上部署，总耗时取决于最慢的主机而不是所有主机之和。
+    设置 batch_size 时，各主机先并发完成准备，然后按 rolling_update() 分批更新容器。
+    Deploy to all hosts concurrently so the total time follows the slowest host, not the sum.
+    With batch_size set, every host is prepared concurrently and the containers are then
+    updated in batches by rolling_update().
+
+    :param hosts: (主机, 端口) 列表 / List of (host, port)
+    :param username: 登录用户名 / Login username
+    :param private_key: 私钥 / Private key
+    :param container_names: 容器名称列表 / List of container names
+    :param image_url: Docker 镜像 URL / Docker image URL
+    :param concurrency: 同时部署的主机数上限，默认全部 / Max hosts in flight, defaults to all
+    :param connect: 建立连接的函数，默认 remote_login；可注入模拟主机 / Connection factory, defaults to remote_login; lets a fake host be injected
+    :param batch_size: 滚动更新每批容器数，默认 ROLLING_BATCH_SIZE，0 表示每台主机依次更新 / Containers per rolling batch, defaults to ROLLING_BATCH_SIZE, 0 updates each host in turn
+    :param max_unavailable: 同时不可用的容器数上限，默认 ROLLING_MAX_UNAVAILABLE / Most containers down at once, defaults to ROLLING_MAX_UNAVAILABLE
+    :param fanout: 是否用 fan_out_image() 分发镜像，默认 IMAGE_FANOUT / Whether to distribute the image with fan_out_image(), defaults to IMAGE_FANOUT
+    :param canary_first: 是否先做 canary_step()，默认 CANARY / Whether to run canary_step() first, defaults to CANARY
+    :return: HostResult 列表，顺序与 hosts 一致 / HostResult list in the order of hosts
+    """
+    # 镜像摘要只解析一次，所有主机共享 / Resolve the digest once and share it across hosts
+    image_digest = resolve_image_digest(image_url)
+    batch_size = ROLLING_BATCH_SIZE if batch_size is None else batch_size
+    fanout = IMAGE_FANOUT if fanout is None else fanout
+    canary_first = CANARY if canary_first is None else canary_first
+    workers = max(1, min(concurrency or len(hosts), len(hosts)))
+    pulled = set()
+    if fanout and len(hosts) > 1:
+        pulled = fan_out_image(
+            hosts, username, private_key, image_url, image_digest, concurrency, connect
+        )
+    arguments = [
+        (
+            host,
+            port,
+            username,
+            private_key,
+            container_names,
+            image_url,
+            image_digest,
+            connect,
+            host in pulled,
+        )
+        for host, port in hosts
+    ]
+    def apply_host(plan):
+        with timing.context(host=plan.host):
+            apply_plan(plan)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="deploy") as pool:
+        if not batch_size and not canary_first:
+            results = list(pool.map(lambda args: deploy_host(*args), arguments))
+        else:
+            plans = list(pool.map(lambda args: prepare_host(*args), arguments))
+            if not canary_first or canary_step(plans):
+                if batch_size:
+                    rolling_update(
+                        plans,
+                        batch_size,
+                        ROLLING_MAX_UNAVAILABLE if max_unavailable is None else max_unavailable,
+                    )
+                else:
+                    list(pool.map(apply_host, plans))
+            results = list(pool.map(finish_host, plans))
+    report_results(results)
+    return results
+
+
+@timing.timed("rollback", container="container_name")
+def rollback_container(ssh, container_name, selector=None):
+    """
+    用备份快照及其镜像重新创建容器。镜像仍在主机上时直接使用镜像 ID，否则按摘要拉取。
+    Recreate a container from a backup snapshot and its image. The image ID is used directly when
+    the image is still on the host, otherwise it is pulled by digest.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_name: 容器名称 / Container name
+    :param selector: 快照哈希前缀或序号（0 为最新），默认为最新的、与当前配置不同的快照
+                     / Snapshot hash prefix or index (0 is the newest), defaults to the newest one that differs from the current configuration
+    :return: 回滚是否成功 / Whether the rollback succeeded
+    """
+    current = inspect_containers(ssh, [container_name])[container_name]
+    current_hash = (
+        backup_store.encode_snapshot(backup_store.snapshot(current))[0] if current else None
+    )
+    entry = backup_store.find_snapshot(
+        backup_store.list_snapshots(ssh, container_name), selector, exclude=current_hash
+    )
+    if entry is None:
+        logging.error(
+            f"错误：未找到容器 {container_name} 可用的快照"
+        )  # Error: no usable snapshot for the container
+        return False
+    snapshot_info = backup_store.load_snapshot(ssh, entry["hash"])
+
+    image = entry["image_id"]
+    status, _, _ = run_command(ssh, "docker image inspect --format '{{.Id}}' " + image)
+    if status != 0:
+        if not entry["image_digest"]:
+            logging.error(
+                f"错误：镜像 {image} 已不在主机上且没有可拉取的摘要"
+            )  # Error: the image is gone and there is no digest to pull
+            return False
+        image = entry["image_digest"]
+        if not pull_docker_image(ssh, image):
+            return False
+
+    logging.info(
+        f"正在将容器 {container_name} 回滚到快照 {entry['hash'][:12]}（{entry['created']}）"
+    )  # Rolling the container back to snapshot
+    if current:
+        return recreate_container(ssh, container_name, image, container_info=snapshot_info)
+
+    # 容器已不存在时直接按快照创建 / Create straight from the snapshot when the container is gone
+    result = stream_command(ssh, build_run_command(snapshot_info, container_name, image))
+    if not result.ok:
+        logging.error(
+            f"错误：无法创建容器 {container_name}：{result.stderr}"
+        )  # Error: Could not create the container
+        return False
+    return wait_for_container_ready(ssh, container_name)
+
+
+@timing.timed("host", host="host")
+def rollback_host(host, port, username, private_key, container_names, selector=None, connect=None):
+    """
+    在单台主机上回滚容器，异常记录在结果中。
+    Roll back the containers on a single host; errors are captured in the result.
+
+    :param host: 服务器地址 / Server address
+    :param port: SSH 端口 / SSH port
+    :param username: 登录用户名 / Login username
+    :param private_key: 私钥 / Private key
+    :param container_names: 容器名称列表 / List of container names
+    :param selector: 快照哈希前缀或序号 / Snapshot hash prefix or index
+    :param connect: 建立连接的函数，默认 remote_login / Connection factory, defaults to remote_login
+    :return: HostResult 对象 / HostResult object
+    """
+    threading.current_thread().name = host  # 日志中显示主机名 / Show host name in logs
+    result = HostResult(host=host)
+    started = time.monotonic()
+    ssh = None
+    try:
+        with timing.span("connect"):
+            ssh = (connect or remote_login)(host, username, port, private_key)
+        for container_name in container_names:
+            rolled_back = rollback_container(ssh, container_name, selector)
+            result.containers[container_name] = ROLLED_BACK if rolled_back else "failed"
+        result.ok = "failed" not in result.containers.values()
+    except Exception as e:
+        logging.exception(f"主机 {host} 回滚失败")  # Rollback failed on host
+        result.error = str(e)
+    finally:
+        if ssh is not None:
+            ssh.close()
+        result.duration = time.monotonic() - started
+    return result
+
+
+def rollback(hosts, username, private_key, container_names, selector=None, concurrency=None, connect=None):
+    """
+    并发地在所有主机上回滚容器。
+    Roll back the containers on all hosts concurrently.
+
+    :param hosts: (主机, 端口) 列表 / List of (host, port)
+    :param username: 登录用户名 / Login username
+    :param private_key: 私钥 / Private key
+    :param container_names: 容器名称列表 / List of container names
+    :param selector: 快照哈希前缀或序号 / Snapshot hash prefix or index
+    :param concurrency: 同时回滚的主机数上限，默认全部 / Max hosts in flight, defaults to all
+    :param connect: 建立连接的函数，默认 remote_login / Connection factory, defaults to remote_login
+    :return: HostResult 列表 / List of HostResult
+    """
+    return run_on_hosts(
+        rollback_host,
+        hosts,
+        concurrency,
+        "回滚",
+        username,
+        private_key,
+        container_names,
+        selector,
+        connect,
+    )
+
+
+def run_on_hosts(function, hosts, concurrency, action, *args):
+    """
+    并发地对每台主机调用 function(host, port, *args) 并输出结果汇总。
+    Call function(host, port, *args) for every host concurrently and log a summary of the results.
+
+    :param function: 返回 HostResult 的函数 / Function returning a HostResult
+    :param hosts: (主机, 端口) 列表 / List of (host, port)
+    :param concurrency: 同时处理的主机数上限，默认全部 / Max hosts in flight, defaults to all
+    :param action: 汇总中使用的操作名称 / Action name used in the summary
+    :return: HostResult 列表，顺序与 hosts 一致 / HostResult list in the order of hosts
+    """
+    workers = max(1, min(concurrency or len(hosts), len(hosts)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=function.__name__) as pool:
+        futures = [pool.submit(function, host, port, *args) for host, port in hosts]
+        results = [future.result() for future in futures]
+    report_results(results, action)
+    return results
+
+
+def host_task(host, function):
+    """
+    在日志与计时中标记主机，连接失败或执行异常都记录在结果中。
+    Tag logs and timings with the host; connection and execution errors are captured in the result.
+
+    :param host: 服务器地址 / Server address
+    :param function: 接收 HostResult 的函数 / Function receiving the HostResult
+    :return: HostResult 对象 / HostResult object
+    """
+    threading.current_thread().name = host  # 日志中显示主机名 / Show host name in logs
+    result = HostResult(host=host)
+    started = time.monotonic()
+    try:
+        with timing.context(host=host):
+            function(result)
+    except Exception as e:
+        logging.exception(f"主机 {host} 执行失败")  # Failed on host
+        result.error = str(e)
+    result.duration = time.monotonic() - started
+    return result
+
+
+@timing.timed("prune", host="host")
+def prune_host(host, port, username, private_key, image_url=None, connect=None):
+    """
+    在单台主机上按保留策略清理镜像。
+    Clean up the images of a single host by retention policy.
+
+    :param host: 服务器地址 / Server address
+    :param port: SSH 端口 / SSH port
+    :param username: 登录用户名 / Login username
+    :param private_key: 私钥 / Private key
+    :param image_url: 需要保留最近版本的镜像 URL / Image URL whose recent versions are kept
+    :param connect: 建立连接的函数，默认 remote_login / Connection factory, defaults to remote_login
+    :return: HostResult 对象 / HostResult object
+    """
+
+    def prune(result):
+        ssh = (connect or remote_login)(host, username, port, private_key)
+        try:
+            result.ok = cleanup_unused_images(ssh, image_url) is not None
+        finally:
+            ssh.close()
+
+    return host_task(host, prune)
+
+
+def export_timings(directory=None):
+    """
+    将本次运行的计时区间写为 JSON lines 与 Prometheus 文本。
+    Write this run's timing spans as JSON lines and Prometheus text.
+
+    :param directory: 输出目录，默认 DEPLOY_METRICS_DIR / Output directory, defaults to DEPLOY_METRICS_DIR
+    """
+    directory = DEPLOY_METRICS_DIR if directory is None else directory
+    if not directory:
+        return
+    try:
+        jsonl_path, prometheus_path = timing.RECORDER.export(directory)
+        logging.info(
+            f"计时结果已写入：{jsonl_path}，{prometheus_path}"
+        )  # Timings written to
+    except OSError as e:
+        logging.warning(f"无法写入计时结果：{e}")  # Could not write timings
+
+
+def report_results(results, action="部署"):
+    """
+    按主机输出部署结果汇总。
+    Log a per-host summary of the deployment results.
+
+    :param results: HostResult 列表 / List of HostResult
+    :param action: 操作名称，如 "部署"、"回滚" / Action name, e.g. "deploy", "rollback"
+    """
+    for result in results:
+        containers = ", ".join(
+            f"{name}={status}" for name, status in result.containers.items()
+        )
+        if result.ok:
+            logging.info(
+                f"主机 {result.host} {action}成功，用时 {result.duration:.1f}s：{containers}"
+            )  # Host deployed successfully
+        else:
+            logging.error(
+                f"主机 {result.host} {action}失败，用时 {result.duration:.1f}s：{result.error or containers}"
+            )  # Host deployment failed
+
+
+def read_rollout_env():
+    """
+    从环境变量中读取多主机部署所需的参数。
+    Read the multi-host rollout parameters from environment variables.
+
+    :return: (hosts, username, private_key, container_names, concurrency)
+    """
+    port = int(os.getenv("PORT") or 22)  # 默认 SSH 端口为 22 / Default SSH port is 22
+    hosts = parse_hosts(os.getenv("SERVER_ADDRESS"), port)  # 支持多个主机 / Support multiple hosts
+    username = os.getenv("USERNAME")
+    private_key = os.getenv("PRIVATE_KEY")
+    container_names = [
+        name.strip() for name in os.getenv("CONTAINER_NAMES", "").split("&") if name.strip()
+    ]  # 支持多个容器名称 / Support multiple container names
+    concurrency = int(os.getenv("DEPLOY_CONCURRENCY") or 0) or None
+    return hosts, username, private_key, container_names, concurrency
+
@@ -0,0 +1,443 @@
+import os
+import json
+import shlex
+import difflib
+import hashlib
+import logging
+import datetime
+
+from . import backup_store, compose_graph, env_index, image_retention, manager, timing
+
+# 没有历史计时可用时各阶段的预计耗时（秒）/ Expected phase durations (seconds) when no timing history is available
+DEFAULT_DURATIONS = {
+    "connect": 1.0,
+    "inspect": 0.5,
+    "backup": 0.5,
+    "pull": 60.0,
+    "recreate": 15.0,
+    "cleanup": 2.0,
+}
+
+# 一次往返内列出主机上所有镜像的 inspect 信息，每行一个 / List the inspect data of every image on the host, one per line
+IMAGES_COMMAND = (
+    "docker image ls -q --no-trunc | xargs -r docker image inspect --format '{{json .}}'"
+)
+
+
+def redact(snapshot_info):
+    """
+    将环境变量的值替换为短哈希：快照可以缓存在 CI 中，值变化时仍能在差异中看出。
+    Replace environment variable values with a short hash so the snapshot can be cached in CI
+    while a changed value still shows up in the diff.
+
+    :param snapshot_info: backup_store.snapshot() 的结果 / Result of backup_store.snapshot()
+    :return: 新的快照字典 / New snapshot dictionary
+    """
+    config = dict(snapshot_info.get("Config") or {})
+    env = []
+    for entry in config.get("Env") or []:
+        key, sep, value = entry.partition("=")
+        if sep and not value.startswith("<sha256:"):
+            value = f"<sha256:{hashlib.sha256(value.encode()).hexdigest()[:12]}>"
+        env.append(f"{key}{sep}{value}")
+    config["Env"] = env
+    return {**snapshot_info, "Config": config}
+
+
+def capture(ssh, container_names):
+    """
+    获取规划所需的主机状态：容器快照（环境变量已脱敏）与镜像列表。
+    Capture the host state the planner needs: container snapshots (with redacted environment)
+    and the image list.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param container_names: 容器名称列表 / List of container names
+    :return: 主机快照字典 / Host snapshot dictionary
+    """
+    with timing.span("inspect"):
+        container_infos = manager.inspect_containers(ssh, container_names)
+    status, out, err = manager.run_command(ssh, IMAGES_COMMAND)
+    if status != 0:
+        logging.warning(f"无法列出镜像：{err.strip()}")  # Could not list the images
+    images = [json.loads(line) for line in out.splitlines() if line.strip()] if status == 0 else []
+    return {
+        "taken": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "containers": {
+            name: redact(backup_store.snapshot(info)) if info else None
+            for name, info in container_infos.items()
+        },
+        "images": [
+            {key: image.get(key) for key in ("Id", "RepoTags", "RepoDigests", "Created", "Size")}
+            for image in images
+        ],
+    }
+
+
+def snapshot_path(directory, host):
+    return os.path.join(directory, f"{host}.json")
+
+
+def save_host_snapshot(directory, host, host_snapshot):
+    """
+    将主机快照写入目录，先写临时文件再重命名。
+    Write the host snapshot into the directory, through a temporary file and a rename.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(directory, host)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"host": host, **host_snapshot}, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def load_host_snapshot(directory, host):
+    with open(snapshot_path(directory, host), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def snapshot_hosts(directory):
+    """
+    列出目录中有快照的主机。
+    List the hosts that have a snapshot in the directory.
+    """
+    return sorted(name[: -len(".json")] for name in os.listdir(directory) if name.endswith(".json"))
+
+
+def load_durations(path):
+    """
+    从 deploy_spans.jsonl 计算各阶段的平均耗时；跳过的拉取与失败的区间不计入。
+    Average the phase durations in a deploy_spans.jsonl file; skipped pulls and failed spans are
+    left out.
+
+    :param path: JSON lines 文件路径 / Path of the JSON lines file
+    :return: {(阶段, 主机, 容器): 秒}、{(阶段, 主机): 秒} 与 {(阶段, None): 秒} / {(phase, host, container): seconds}, {(phase, host): seconds} and {(phase, None): seconds}
+    """
+    totals = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            if not span.get("ok") or span.get("skipped"):
+                continue
+            keys = [(span["phase"], span.get("host")), (span["phase"], None)]
+            if span.get("container"):
+                keys.append((span["phase"], span.get("host"), span["container"]))
+            for key in keys:
+                total, count = totals.get(key, (0.0, 0))
+                totals[key] = (total + span["duration"], count + 1)
+    return {key: total / count for key, (total, count) in totals.items()}
+
+
+def expected(durations, phase, host=None, container=None):
+    """
+    某个阶段的预计耗时：优先取该主机上这个容器的历史，其次该主机的历史，再次所有主机的历史，最后是默认值。
+    Expected duration of a phase: this container's history on the host first, then the host's,
+    then every host's, then the default.
+    """
+    durations = durations or {}
+    seconds = durations.get((phase, host), durations.get((phase, None), DEFAULT_DURATIONS[phase]))
+    return durations.get((phase, host, container), seconds) if container else seconds
+
+
+def command_lines(command):
+    """
+    将 docker run 命令拆为每行一个选项，便于逐项比较。
+    Split a docker run command into one option per line so it can be diffed option by option.
+    """
+    tokens = shlex.split(command)
+    lines = [" ".join(tokens[:4])]  # docker run -d --name X
+    index = 4
+    while index < len(tokens):
+        token = tokens[index]
+        if token.startswith("-") and index + 1 < len(tokens) - 1:
+            lines.append(f"{token} {tokens[index + 1]}")
+            index += 2
+        else:
+            lines.append(token)
+            index += 1
+    return lines
+
+
+def run_commands(container_info, container_name, image_url, target_info=None):
+    """
+    当前容器与重新创建后容器的 docker run 命令；蓝绿切换时新容器在另一个槽位。
+    The docker run commands of the current container and of the recreated one; with a
+    blue/green swap the new container takes the other slot.
+
+    :param target_info: 新容器使用的设置，默认与当前容器相同 / Settings of the new container, defaults to the current container's
+    :return: (当前命令, 目标命令, 方式) / (current command, target command, mode)
+    """
+    target_info = target_info or container_info
+    current_image = (container_info.get("Config") or {}).get("Image") or container_info.get("Image")
+    labels = (container_info.get("Config") or {}).get("Labels") or {}
+    if not manager.uses_blue_green(container_name):
+        return (
+            manager.build_run_command(container_info, container_name, current_image),
+            manager.build_run_command(target_info, container_name, image_url),
+            "in place",
+        )
+    current_slot = labels.get(manager.SLOT_LABEL)
+    slot = "blue" if manager.container_slot(container_info) == "green" else "green"
+    port_offset = manager.slot_port_offset(slot) - manager.slot_port_offset(manager.container_slot(target_info))
+    return (
+        manager.build_run_command(
+            container_info,
+            container_name,
+            current_image,
+            labels={manager.SLOT_LABEL: current_slot} if current_slot else None,
+        ),
+        manager.build_run_command(
+            target_info, container_name, image_url, port_offset, {manager.SLOT_LABEL: slot}
+        ),
+        f"blue/green -> {slot}",
+    )
+
+
+def plan_snapshot(result, host_snapshot, container_names, image_url, image_digest=None, durations=None):
+    """
+    由主机快照计算部署计划，不连接主机：是否拉取镜像、每个容器是否重新创建、
+    docker run 命令的差异以及预计耗时，写入 result。
+    Work out the deployment plan from a host snapshot without contacting the host: whether the
+    image is pulled, whether each container is recreated, the docker run command diff and the
+    expected duration, all recorded in result.
+
+    :param result: HostResult 对象 / HostResult object
+    :param host_snapshot: capture() 的结果 / Result of capture()
+    :param container_names: 容器名称列表 / List of container names
+    :param image_url: 目标镜像 URL / Target image URL
+    :param image_digest: 目标镜像摘要，已知时按摘要判断是否需要拉取 / Target image digest, decides the pull when known
+    :param durations: load_durations() 的结果 / Result of load_durations()
+    """
+    host = result.host
+    images = host_snapshot.get("images") or []
+    containers = host_snapshot.get("containers") or {}
+    repository = image_retention.repository_of(image_url)
+    local = next((image for image in images if image_retention.image_matches(image, image_url)), None)
+    if image_digest:
+        pinned = next(
+            (image for image in images if f"{repository}@{image_digest}" in (image.get("RepoDigests") or [])),
+            None,
+        )
+        pull = None if pinned else f"by digest {image_digest}"
+        local = pinned
+    else:
+        pull = "by tag"  # 按标签拉取总会执行 / A pull by tag always runs
+    # 镜像尚未拉取时用 URL 代替 ID / Use the URL in place of the ID when the image is not pulled yet
+    target_image_id = local["Id"] if local else f"{image_url} (pull)"
+
+    inspect_seconds = expected(durations, "inspect", host)
+    present = [name for name in container_names if containers.get(name)]
+    backup_seconds = inspect_seconds + len(present) * expected(durations, "backup", host)
+    pull_seconds = expected(durations, "pull", host) if pull else 0.0
+    result.actions = [{"action": "connect", "seconds": expected(durations, "connect", host)}]
+    # 拉取与备份并行 / The pull runs alongside the backups
+    result.actions.append({"action": "pull", "target": image_url, "detail": pull or "present", "seconds": pull_seconds})
+    result.actions += [
+        {"action": "backup", "target": name, "seconds": expected(durations, "backup", host)} for name in present
+    ]
+
+    recreates = {}
+    index = env_index.load_index()
+    for container_name in container_names:
+        container_info = containers.get(container_name)
+        if not container_info:
+            result.containers[container_name] = "missing"
+            continue
+        target_info, env = container_info, None
+        if index is not None:
+            # 快照中的值已脱敏，目标环境同样脱敏后比较 / Snapshot values are redacted, so the target environment is too
+            target_info = redact(manager.with_rendered_env(index, container_name, container_info))
+            env = env_index.env_dict(target_info["Config"].get("Env"))
+        changes = manager.diff_container_spec(
+            manager.container_spec_summary(container_info),
+            manager.target_spec_summary(container_info, target_image_id, env),
+        )
+        result.changes[container_name] = changes
+        if not changes and not manager.FORCE_RECREATE:
+            result.containers[container_name] = "unchanged"
+            continue
+        result.containers[container_name] = "recreate"
+        current, target, mode = run_commands(container_info, container_name, image_url, target_info)
+        recreates[container_name] = {
+            "action": "recreate",
+            "target": container_name,
+            "detail": mode,
+            "seconds": expected(durations, "recreate", host, container_name),
+            "diff": list(
+                difflib.unified_diff(
+                    command_lines(current),
+                    command_lines(target),
+                    f"{host}/{container_name} (current)",
+                    f"{host}/{container_name} (target)",
+                    lineterm="",
+                )
+            ),
+        }
+    # 与部署相同，按 compose 依赖图排列 / Ordered along the compose graph, as the deploy does
+    graph = compose_graph.build_graph(list(recreates)) if compose_graph.COMPOSE_ORDER else None
+    if graph is None:
+        # 依次处理：每个容器排在前一个之后 / One by one: each container follows the previous one
+        graph = {name: set(list(recreates)[index - 1 : index]) for index, name in enumerate(recreates)}
+    result.actions += [
+        {**recreates[name], "after": sorted(graph[name])} for name in compose_graph.order(graph)
+    ]
+    result.actions.append({"action": "cleanup", "seconds": expected(durations, "cleanup", host)})
+    result.estimate = (
+        result.actions[0]["seconds"]
+        + max(pull_seconds, backup_seconds)
+        + recreate_path(result)[0]
+        + result.actions[-1]["seconds"]
+    )
+    result.ok = True
+
+
+def plan_host(
+    host,
+    port,
+    username,
+    private_key,
+    container_names,
+    image_url,
+    image_digest=None,
+    durations=None,
+    save_dir=None,
+    connect=None,
+):
+    """
+    连接主机获取当前状态并计算部署计划，不拉取镜像也不修改容器；可同时保存快照供离线规划使用。
+    Capture the current state of a host and work out the deployment plan, without pulling images
+    or touching containers; the snapshot can be saved for offline planning at the same time.
+
+    :param host: 服务器地址 / Server address
+    :param port: SSH 端口 / SSH port
+    :param username: 登录用户名 / Login username
+    :param private_key: 私钥 / Private key
+    :param container_names: 容器名称列表 / List of container names
+    :param image_url: 目标镜像 URL / Target image URL
+    :param image_digest: 目标镜像摘要 / Target image digest
+    :param durations: load_durations() 的结果 / Result of load_durations()
+    :param save_dir: 保存快照的目录 / Directory the snapshot is saved to
+    :param connect: 建立连接的函数，默认 remote_login / Connection factory, defaults to remote_login
+    :return: HostResult 对象 / HostResult object
+    """
+
+    def plan(result):
+        ssh = (connect or manager.remote_login)(host, username, port, private_key)
+        try:
+            host_snapshot = capture(ssh, container_names)
+        finally:
+            ssh.close()
+        if save_dir:
+            save_host_snapshot(save_dir, host, host_snapshot)
+        plan_snapshot(result, host_snapshot, container_names, image_url, image_digest, durations)
+
+    return manager.host_task(host, plan)
+
+
+def plan_offline(host, port, snapshot_dir, container_names, image_url, image_digest=None, durations=None):
+    """
+    只根据保存的快照计算部署计划，不建立 SSH 连接。
+    Work out the deployment plan from a saved snapshot alone, without an SSH session.
+
+    :param host: 服务器地址 / Server address
+    :param port: SSH 端口（未使用）/ SSH port (unused)
+    :param snapshot_dir: 快照目录 / Snapshot directory
+    :param container_names: 容器名称列表，为空时取快照中的全部容器 / List of container names, every container in the snapshot if empty
+    :param image_url: 目标镜像 URL / Target image URL
+    :param image_digest: 目标镜像摘要 / Target image digest
+    :param durations: load_durations() 的结果 / Result of load_durations()
+    :return: HostResult 对象 / HostResult object
+    """
+
+    def plan(result):
+        host_snapshot = load_host_snapshot(snapshot_dir, host)
+        names = container_names or sorted(host_snapshot.get("containers") or {})
+        plan_snapshot(result, host_snapshot, names, image_url, image_digest, durations)
+
+    return manager.host_task(host, plan)
+
+
+def recreate_path(result):
+    """
+    重新创建容器所需的时间：依赖图的关键路径；依次处理时各容器连成一条链，即为总和。
+    Time spent recreating containers: the critical path of the dependency graph; when they are
+    handled one by one the containers form a single chain and this is their total.
+
+    :param result: plan_snapshot() 填写的 HostResult / HostResult filled in by plan_snapshot()
+    :return: (秒, 关键路径上的容器名列表) / (seconds, names on the critical path)
+    """
+    actions = [action for action in result.actions if action["action"] == "recreate"]
+    return compose_graph.critical_path(
+        {action["target"]: set(action.get("after", ())) for action in actions},
+        {action["target"]: action["seconds"] for action in actions},
+    )
+
+
+def rollout_estimate(results, batch_size=0, concurrency=None):
+    """
+    估算整次部署的耗时：主机并发执行；滚动更新时各批依次执行，每批取最慢的容器。
+    Estimate the whole deploy: hosts run concurrently; with a rolling update the batches run one
+    after another and each takes as long as its slowest container.
+
+    :param results: plan_snapshot() 填写的 HostResult 列表 / HostResult list filled in by plan_snapshot()
+    :param batch_size: 滚动更新每批容器数，0 表示每台主机依次更新 / Containers per rolling batch, 0 updates each host in turn
+    :param concurrency: 同时处理的主机数上限 / Max hosts in flight
+    :return: 秒 / Seconds
+    """
+    results = [result for result in results if result.ok]
+    if not results:
+        return 0.0
+    waves = -(-len(results) // max(1, concurrency or len(results)))
+    if not batch_size:
+        return waves * max(result.estimate for result in results)
+    recreates = {
+        id(result): [action["seconds"] for action in result.actions if action["action"] == "recreate"]
+        for result in results
+    }
+    prepare = max(
+        result.estimate - recreate_path(result)[0] - result.actions[-1]["seconds"] for result in results
+    )
+    units = []
+    for index in range(max(len(seconds) for seconds in recreates.values())):
+        units += [seconds[index] for seconds in recreates.values() if index < len(seconds)]
+    batches = [units[start : start + batch_size] for start in range(0, len(units), batch_size)]
+    cleanup = max(result.actions[-1]["seconds"] for result in results)
+    return waves * prepare + sum(max(batch) + manager.ROLLING_GATE_DELAY for batch in batches) + cleanup
+
+
+def render(results):
+    """
+    将计划输出为文本：每台主机的操作、预计耗时以及 docker run 命令的统一差异格式。
+    Render the plan as text: each host's actions, their expected duration and the docker run
+    commands as a unified diff.
+
+    :param results: HostResult 列表 / List of HostResult
+    :return: 文本行列表 / List of text lines
+    """
+    lines = []
+    for result in results:
+        if not result.ok:
+            lines.append(f"! {result.host}: {result.error}")
+            continue
+        seconds, path = recreate_path(result)
+        critical = ""
+        if compose_graph.COMPOSE_ORDER and len(path) > 1:
+            critical = f", critical path {' -> '.join(path)} ~{seconds:.0f}s"
+        lines.append(f"@ {result.host} (~{result.estimate:.0f}s{critical})")
+        recreated = {action.get("target") for action in result.actions if action["action"] == "recreate"}
+        for action in result.actions:
+            if action["action"] == "cleanup":
+                # 清理之前列出不需要重新创建的容器 / List the containers left alone before the cleanup
+                lines += [
+                    f"= {name}: {status}" for name, status in result.containers.items() if name not in recreated
+                ]
+            if action["action"] != "recreate":
+                target = f" {action['target']}" if action.get("target") else ""
+                detail = f" ({action['detail']})" if action.get("detail") else ""
+                lines.append(f"  {action['action']}{target}{detail} ~{action['seconds']:.1f}s")
+                continue
+            after = f", after {', '.join(action['after'])}" if action.get("after") else ""
+            lines.append(f"~ {action['target']}: recreate ({action['detail']}{after}) ~{action['seconds']:.1f}s")
+            for field_name, change in result.changes.get(action["target"], {}).items():
+                lines.append(f"    {field_name}: {change}")
+            lines += [f"    {line}" for line in action["diff"]]
+    return lines
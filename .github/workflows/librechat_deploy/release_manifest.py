@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+
+# 默认缓存目录与有效期（秒）/ Default cache directory and TTL in seconds
+DEFAULT_CACHE_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "librechat-deploy"
+)
+DEFAULT_CACHE_TTL = 300
+
+
+def _cache_path(cache_dir, api_url):
+    """
+    每个 API 地址对应一个缓存文件。
+    One cache file per API URL.
+    """
+    key = hashlib.sha256(api_url.encode()).hexdigest()[:32]
+    return os.path.join(cache_dir, f"manifest-{key}.json")
+
+
+def _read_cache(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(path, entry):
+    """
+    原子地写入缓存文件（临时文件 + 重命名），避免并发读取到半个文件。
+    Write the cache file atomically (temp file + rename) so readers never see half a file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def fetch_manifest(api_url, user_agent=None, cache_dir=None, ttl=None, timeout=10):
+    """
+    获取发布清单：有效期内直接使用本地缓存，过期后发送带 ETag 的条件请求，
+    服务器返回 304 时继续使用缓存；网络错误时回退到过期缓存。
+    Fetch the release manifest: a fresh local cache is used as is; once stale a conditional
+    request with the ETag is sent and a 304 keeps the cached copy; on network errors a stale
+    cache is used as a fallback.
+
+    :param api_url: 发布 API 地址 / Release API URL
+    :param user_agent: 请求使用的 User-Agent / User-Agent for the request
+    :param cache_dir: 缓存目录 / Cache directory
+    :param ttl: 缓存有效期（秒），0 表示每次都发送条件请求 / Cache TTL in seconds, 0 revalidates every time
+    :param timeout: 请求超时时间（秒）/ Request timeout in seconds
+    :return: 清单 JSON，无法获取时为 None / Manifest JSON, None if it cannot be obtained
+    """
+    import requests
+
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    ttl = DEFAULT_CACHE_TTL if ttl is None else ttl
+    path = _cache_path(cache_dir, api_url)
+    cached = _read_cache(path)
+
+    if cached and time.time() - cached.get("fetched_at", 0) < ttl:
+        logging.info(f"使用缓存的发布清单：{api_url}")  # Using cached release manifest
+        return cached["body"]
+
+    headers = {}
+    if user_agent:
+        headers["User-Agent"] = user_agent
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        response = requests.get(api_url, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        if cached:
+            logging.warning(
+                f"无法获取发布清单，使用过期缓存：{e}"
+            )  # Could not fetch the manifest, using the stale cache
+            return cached["body"]
+        logging.error(f"错误：无法获取发布清单：{e}")  # Error: could not fetch the manifest
+        return None
+
+    if response.status_code == 304 and cached:
+        logging.info(f"发布清单未变化：{api_url}")  # Release manifest unchanged
+        body = cached["body"]
+    elif response.status_code == 200:
+        try:
+            body = response.json()
+        except ValueError as e:
+            logging.error(f"错误：无法解析 JSON 响应: {e}")  # Error: Unable to parse JSON response
+            logging.error(f"响应内容: {response.text}")  # Response content
+            return None
+    else:
+        logging.error(
+            f"错误：无法获取 Docker 镜像 URL，状态码: {response.status_code}"
+        )  # Error: Cannot get Docker image URL
+        logging.error(f"响应内容: {response.text}")  # Response content
+        return cached["body"] if cached else None
+
+    try:
+        _write_cache(
+            path,
+            {
+                "url": api_url,
+                "etag": response.headers.get("ETag") or (cached or {}).get("etag"),
+                "last_modified": response.headers.get("Last-Modified")
+                or (cached or {}).get("last_modified"),
+                "fetched_at": time.time(),
+                "body": body,
+            },
+        )
+    except OSError as e:
+        logging.warning(f"无法写入发布清单缓存：{e}")  # Could not write the manifest cache
+    return body
@@ -0,0 +1,13 @@
+def run_command(ssh, command):
+    """
+    执行远程命令并等待其结束。
+    Execute a remote command and wait for it to finish.
+
+    :param ssh: SSHClient 对象 / SSHClient object
+    :param command: 要执行的命令 / Command to execute
+    :return: (退出码, 标准输出, 标准错误) / (exit status, stdout, stderr)
+    """
+    stdin, stdout, stderr = ssh.exec_command(command)
+    out = stdout.read().decode()
+    err = stderr.read().decode()
+    return stdout.channel.recv_exit_status(), out, err
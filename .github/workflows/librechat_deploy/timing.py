@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import inspect
+import threading
+import functools
+from contextlib import contextmanager
+
+# Prometheus 指标名前缀 / Prometheus metric name prefix
+METRIC_PREFIX = "librechat_deploy"
+
+
+class Span:
+    """
+    一个计时区间：阶段名、标签、开始时间、耗时和是否成功。
+    A timed span: phase name, tags, start time, duration and whether it succeeded.
+    """
+
+    def __init__(self, phase, tags):
+        self.phase = phase
+        self.tags = tags
+        self.start = time.time()
+        self.duration = 0.0
+        self.ok = True
+
+    def to_dict(self):
+        return {
+            "phase": self.phase,
+            **self.tags,
+            "start": round(self.start, 6),
+            "duration": round(self.duration, 6),
+            "ok": self.ok,
+        }
+
+
+class SpanRecorder:
+    """
+    线程安全的计时记录器。标签按线程继承，例如在部署线程中设置 host 后，
+    该线程内的所有区间都会带上 host 标签。
+    Thread-safe span recorder. Tags are inherited per thread, e.g. once a deploy thread
+    sets host, every span recorded on that thread carries it.
+    """
+
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def current_tags(self):
+        return dict(getattr(self._local, "tags", {}))
+
+    @contextmanager
+    def context(self, **tags):
+        """
+        为当前线程后续的区间设置标签。
+        Set tags for the following spans on the current thread.
+        """
+        previous = getattr(self._local, "tags", {})
+        self._local.tags = {**previous, **tags}
+        try:
+            yield
+        finally:
+            self._local.tags = previous
+
+    def bind(self, fn):
+        """
+        让在其他线程中执行的函数继承当前线程的标签。
+        Let a function that runs on another thread inherit the current thread's tags.
+        """
+        tags = self.current_tags()
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.context(**tags):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    @contextmanager
+    def span(self, phase, **tags):
+        """
+        记录一个区间；抛出异常时标记为失败。
+        Record a span; it is marked as failed if an exception escapes.
+        """
+        span = Span(phase, {**self.current_tags(), **tags})
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(span)
+        started = time.monotonic()
+        try:
+            yield span
+        except BaseException:
+            span.ok = False
+            raise
+        finally:
+            span.duration = time.monotonic() - started
+            stack.pop()
+            with self._lock:
+                self._spans.append(span)
+
+    def annotate(self, **tags):
+        """
+        为当前线程最内层的区间追加标签，例如标记拉取被跳过。
+        Add tags to the innermost open span of the current thread, e.g. to mark a skipped pull.
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack:
+            stack[-1].tags.update(tags)
+
+    def timed(self, phase, **tag_args):
+        """
+        装饰器：为整个函数调用记录区间。返回 False（或 ok 属性为假的对象）视为失败。
+        Decorator recording a span for the whole call. Returning False (or an object whose
+        ok attribute is false) counts as a failure.
+
+        :param phase: 阶段名 / Phase name
+        :param tag_args: 标签名 -> 参数名，如 container="container_name" / Tag name -> argument name
+        """
+
+        def decorator(fn):
+            signature = inspect.signature(fn)
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                arguments = signature.bind(*args, **kwargs).arguments
+                tags = {tag: arguments.get(argument) for tag, argument in tag_args.items()}
+                # 函数内部的区间也继承这些标签 / Spans inside the function inherit these tags too
+                with self.context(**tags), self.span(phase) as span:
+                    result = fn(*args, **kwargs)
+                    span.ok = bool(getattr(result, "ok", result is not False))
+                    return result
+
+            return wrapper
+
+        return decorator
+
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+
+    def write_jsonl(self, path):
+        """
+        以 JSON lines 格式追加所有区间，保留之前运行的记录供 planner 估算耗时。
+        Append every span as JSON lines, keeping the earlier runs the planner averages over.
+        """
+        with open(path, "a", encoding="utf-8") as f:
+            for span in self.spans():
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False) + "\n")
+
+    def prometheus_text(self):
+        """
+        生成 Prometheus 文本格式的指标（可用于 node_exporter textfile collector）。
+        Render the spans as Prometheus text format (suitable for the node_exporter textfile collector).
+        """
+        durations, counts, failures = {}, {}, {}
+        for span in self.spans():
+            labels = tuple(sorted({"phase": span.phase, **span.tags}.items()))
+            durations[labels] = durations.get(labels, 0.0) + span.duration
+            counts[labels] = counts.get(labels, 0) + 1
+            failures[labels] = failures.get(labels, 0) + (0 if span.ok else 1)
+
+        def format_labels(labels):
+            escaped = (
+                (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                for key, value in labels
+                if value is not None
+            )
+            return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+        lines = []
+        for name, kind, help_text, values in (
+            ("phase_duration_seconds", "gauge", "Total time spent in a deploy phase.", durations),
+            ("phase_count", "gauge", "Number of times a deploy phase ran.", counts),
+            ("phase_failures", "gauge", "Number of failed runs of a deploy phase.", failures),
+        ):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for labels, value in sorted(values.items()):
+                lines.append(f"{METRIC_PREFIX}_{name}{format_labels(labels)} {value}")
+        lines.append(f"# HELP {METRIC_PREFIX}_last_run_timestamp_seconds End of the last deploy run.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_last_run_timestamp_seconds {time.time():.3f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+
+    def export(self, directory):
+        """
+        将区间追加到目录下的 deploy_spans.jsonl，并写出 deploy_metrics.prom。
+        Append the spans to deploy_spans.jsonl and write deploy_metrics.prom in the directory.
+
+        :param directory: 输出目录 / Output directory
+        :return: (JSON lines 路径, Prometheus 路径) / (JSON lines path, Prometheus path)
+        """
+        os.makedirs(directory, exist_ok=True)
+        jsonl_path = os.path.join(directory, "deploy_spans.jsonl")
+        prometheus_path = os.path.join(directory, "deploy_metrics.prom")
+        self.write_jsonl(jsonl_path)
+        self.write_prometheus(prometheus_path)
+        return jsonl_path, prometheus_path
+
+
+# 默认的全局记录器 / Default process-wide recorder
+RECORDER = SpanRecorder()
+span = RECORDER.span
+context = RECORDER.context
+bind = RECORDER.bind
+annotate = RECORDER.annotate
+timed = RECORDER.timed
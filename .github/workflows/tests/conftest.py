@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+# 测试从 .github/workflows 导入部署包与模拟主机 / The tests import the deploy package and the fake host from .github/workflows
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_host import FakeDockerHost, Latency, fake_connect  # noqa: E402
+
+FAST = Latency(rtt=0.0, pull=0.01, run=0.01, remove=0.01, ready=0.01, health=0.0, load=0.01)
+
+
+@pytest.fixture
+def deploy_env(monkeypatch, tmp_path):
+    """
+    部署命令读取的环境，指标与日志写入临时目录。
+    Environment read by the deploy commands, with metrics and journals going to a temporary directory.
+    """
+    from librechat_deploy import manager
+
+    monkeypatch.chdir(tmp_path)
+    for name, value in {
+        "SERVER_ADDRESS": "h0&h1",
+        "USERNAME": "test",
+        "PRIVATE_KEY": "unused",
+        "CONTAINER_NAMES": "app0&app1",
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(manager, "RESOLVE_IMAGE_DIGEST", False)
+    monkeypatch.setattr(manager, "DEPLOY_METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(manager, "CONTAINER_READY_TIMEOUT", 1.0)
+    return tmp_path
+
+
+@pytest.fixture
+def hosts():
+    return {name: FakeDockerHost(name, ["app0", "app1"], latency=FAST) for name in ("h0", "h1")}
+
+
+@pytest.fixture
+def connect(hosts):
+    return fake_connect(hosts)
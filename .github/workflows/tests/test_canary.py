@@ -0,0 +1,110 @@
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from librechat_deploy import canary, cli, manager
+
+pytestmark = pytest.mark.skipif(shutil.which("curl") is None, reason="the canary probe needs curl")
+
+NEW_IMAGE = "happyclo/librechat:new"
+
+
+class _AppServer(ThreadingHTTPServer):
+    """
+    应用的本地替身：可切换为慢速或返回 503。
+    Local stand-in for the app that can be switched to slow responses or 503s.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _AppHandler)
+        self.delay = 0.0
+        self.status = 200
+
+
+class _AppHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def app():
+    server = _AppServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_measure_counts_errors_and_latency(app):
+    base_url = f"http://127.0.0.1:{app.server_port}"
+    healthy = canary.measure(canary.local_run, base_url, canary.parse_mix("GET /health"), samples=10)
+    assert healthy["count"] == 10 and healthy["errors"] == 0 and healthy["p50"] is not None
+
+    app.status = 503
+    failing = canary.measure(canary.local_run, base_url, canary.parse_mix("GET /health"), samples=10)
+    assert failing["error_rate"] == 1.0
+    assert canary.compare(healthy, failing)
+
+
+def test_measure_reports_an_unreachable_endpoint(app):
+    base_url = f"http://127.0.0.1:{app.server_port}"
+    app.shutdown()
+    app.server_close()
+    summary = canary.measure(canary.local_run, base_url, canary.parse_mix("/"), samples=3, timeout=1)
+    assert summary["error_rate"] == 1.0
+
+
+def _point_at(hosts, app, degrade):
+    """
+    容器端口指向替身服务器，新容器创建后按 degrade 改变其行为。
+    Point the container ports at the stand-in server and apply degrade once a new container is created.
+    """
+    for host in hosts.values():
+        host.run_local = canary.local_run
+        for info in host.containers.values():
+            info["HostConfig"]["PortBindings"] = {
+                "3080/tcp": [{"HostIp": "127.0.0.1", "HostPort": str(app.server_port)}]
+            }
+            info["NetworkSettings"]["Ports"] = info["HostConfig"]["PortBindings"]
+        run = host._docker_run
+
+        def degraded_run(args, run=run):
+            degrade()
+            return run(args)
+
+        host._docker_run = degraded_run
+
+
+def test_canary_passes_an_equivalent_release(deploy_env, monkeypatch, hosts, connect, app):
+    monkeypatch.setattr(canary, "CANARY_SAMPLES", 10)
+    _point_at(hosts, app, lambda: None)
+
+    results = cli.run(["deploy", "--image", NEW_IMAGE, "--canary"], connect=connect)
+
+    assert all(result.ok for result in results)
+    assert all(info["Config"]["Image"] == NEW_IMAGE for host in hosts.values() for info in host.containers.values())
+
+
+def test_canary_rolls_back_a_failing_release(deploy_env, monkeypatch, hosts, connect, app):
+    monkeypatch.setattr(canary, "CANARY_SAMPLES", 10)
+    _point_at(hosts, app, lambda: setattr(app, "status", 503))
+
+    results = cli.run(["deploy", "--image", NEW_IMAGE, "--canary"], connect=connect)
+
+    assert not any(result.ok for result in results)
+    statuses = [status for result in results for status in result.containers.values()]
+    assert manager.ROLLED_BACK in statuses and "recreated" not in statuses
+    # 回滚按镜像 ID 重新创建 / The rollback recreates from the image ID
+    for host in hosts.values():
+        old_image = host.images["happyclo/librechat:old"]["Id"]
+        assert {info["Image"] for info in host.containers.values()} == {old_image}
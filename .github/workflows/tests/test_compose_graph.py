@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from librechat_deploy import cli, compose_graph
+
+from conftest import FAST, FakeDockerHost, fake_connect
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+pytest.importorskip("yaml")
+
+
+@pytest.fixture
+def repo_root(monkeypatch):
+    # 部署工作流在仓库根目录运行，读取其中的 compose 文件 / The deploy workflows run from the repo root and read its compose files
+    monkeypatch.chdir(REPO_ROOT)
+    return REPO_ROOT
+
+
+def test_compose_services_follow_depends_on(repo_root):
+    graph = compose_graph.build_graph(["LibreChat-NGINX", "LibreChat-API", "chat-mongodb"])
+
+    assert graph["LibreChat-NGINX"] >= {"LibreChat-API"}
+    assert graph["LibreChat-API"] == {"chat-mongodb"}
+    assert compose_graph.order(graph)[0] == "chat-mongodb"
+
+
+def test_containers_outside_compose_are_chained(repo_root):
+    graph = compose_graph.build_graph(["api-1", "LibreChat-API", "api-2", "api-3"])
+
+    assert graph["api-1"] == set()
+    assert graph["api-2"] == {"api-1"}
+    assert graph["api-3"] == {"api-2"}
+    assert compose_graph.levels({name: graph[name] for name in ("api-1", "api-2", "api-3")}) == [
+        ["api-1"],
+        ["api-2"],
+        ["api-3"],
+    ]
+
+
+def test_replicas_are_never_down_together(deploy_env, repo_root, monkeypatch):
+    replicas = ["api-1", "api-2", "api-3"]
+    monkeypatch.setenv("SERVER_ADDRESS", "h0")
+    monkeypatch.setenv("CONTAINER_NAMES", "&".join(replicas))
+    host = FakeDockerHost("h0", replicas, latency=FAST)
+    run = host._docker_run
+    down_together = []
+
+    def counting_run(args):
+        down_together.append(len([name for name in host._down_since if name in replicas]))
+        return run(args)
+
+    host._docker_run = counting_run
+    results = cli.run(["deploy", "--image", "happyclo/librechat:new"], connect=fake_connect({"h0": host}))
+
+    assert results[0].ok
+    assert max(down_together) == 1
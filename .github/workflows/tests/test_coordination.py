@@ -0,0 +1,178 @@
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+import pytest
+
+from librechat_deploy import backup_store, canary, coordination
+
+redis = pytest.importorskip("redis")
+
+NEW_IMAGE = "happyclo/librechat:new"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def redis_uri():
+    """
+    DEPLOY_TEST_REDIS_URI 指定的 Redis，否则在本地启动一个 redis-server；都没有时跳过。
+    The Redis named by DEPLOY_TEST_REDIS_URI, else a local redis-server started for the tests; skipped without either.
+    """
+    uri = os.getenv("DEPLOY_TEST_REDIS_URI")
+    if uri:
+        yield uri
+        return
+    binary = shutil.which("redis-server")
+    if binary is None:
+        pytest.skip("needs redis-server or DEPLOY_TEST_REDIS_URI")
+    port = _free_port()
+    process = subprocess.Popen(
+        [binary, "--port", str(port), "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    uri = f"redis://127.0.0.1:{port}/0"
+    try:
+        for _ in range(50):
+            try:
+                redis.Redis.from_url(uri).ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.1)
+        yield uri
+    finally:
+        process.terminate()
+        process.wait()
+
+
+@pytest.fixture
+def coordinated(monkeypatch, redis_uri, request):
+    """
+    启用协调，每个测试使用自己的键前缀。
+    Enable coordination with a key prefix of the test's own.
+    """
+    monkeypatch.setattr(coordination, "DEPLOY_REDIS_URI", redis_uri)
+    monkeypatch.setattr(coordination, "DEPLOY_REDIS_PREFIX", f"test-{request.node.name}")
+    monkeypatch.setattr(coordination, "DEPLOY_LOCK_TTL", 1.0)
+    monkeypatch.setattr(coordination, "_client", None)
+    yield coordination.client()
+    monkeypatch.setattr(coordination, "_client", None)
+
+
+def test_lease_tokens_increase(coordinated):
+    with coordination.lease("h0", "app0") as first:
+        assert coordination.current_token("h0", "app0") == first
+    with coordination.lease("h0", "app1") as second:
+        assert second > first
+    assert coordination.current_token("h0", "app0") is None
+    assert coordination.client().get(coordination.lock_key("h0", "app0")) is None
+
+
+def test_nested_leases_share_one_token(coordinated):
+    with coordination.lease("h0", "app0") as outer:
+        with coordination.lease("h0", "app0") as inner:
+            assert inner == outer
+        assert coordination.current_token("h0", "app0") == outer
+
+
+def test_lease_held_by_another_run_times_out(coordinated):
+    key = coordination.lock_key("h0", "app0")
+    coordinated.set(key, "other-run:1", px=5000)
+    with pytest.raises(coordination.LeaseError):
+        with coordination.lease("h0", "app0", wait=0.3):
+            pass
+
+
+def test_lease_is_taken_once_the_other_run_releases_it(coordinated):
+    key = coordination.lock_key("h0", "app0")
+    coordinated.set(key, "other-run:1", px=5000)
+    threading.Timer(0.3, coordinated.delete, [key]).start()
+    with coordination.lease("h0", "app0", wait=5) as token:
+        assert coordinated.get(key).decode() == f"{coordination.OWNER}:{token}"
+
+
+def test_lease_is_renewed_while_held(coordinated):
+    key = coordination.lock_key("h0", "app0")
+    with coordination.lease("h0", "app0") as token:
+        time.sleep(coordination.DEPLOY_LOCK_TTL * 2)
+        assert coordinated.get(key).decode() == f"{coordination.OWNER}:{token}"
+
+
+def test_host_scope_shares_one_lock(coordinated, monkeypatch):
+    monkeypatch.setattr(coordination, "DEPLOY_LOCK_SCOPE", "host")
+    with coordination.lease("h0", "app0") as first:
+        assert coordination.current_token("h0", "app1") == first
+
+
+def test_cache_round_trip(coordinated):
+    coordination.cache_set("h0", "inspect", {"app0": {"Id": "abc"}})
+    assert coordination.cache_get("h0", "inspect", ["app0", "app1"]) == {"app0": {"Id": "abc"}}
+    coordination.cache_delete("h0", "inspect", ["app0"])
+    assert coordination.cache_get("h0", "inspect", ["app0"]) == {}
+
+
+def test_fence_script_refuses_a_stale_token(tmp_path):
+    # 在本机执行真实的防护脚本 / Run the real fence script locally
+    def fence(token):
+        return canary.local_run(coordination.fence_command(str(tmp_path), "app0", token))[0]
+
+    assert fence(5) == 0
+    assert fence(5) == 0
+    assert fence(4) == 75
+    assert fence(6) == 0
+    assert (tmp_path / "fence" / "app0").read_text() == "6\n"
+
+
+def test_deploy_holds_leases_and_fences_the_hosts(coordinated, deploy_env, hosts, connect):
+    from librechat_deploy import cli
+
+    results = cli.run(["deploy", "--image", NEW_IMAGE], connect=connect)
+
+    assert all(result.ok for result in results)
+    for host in hosts.values():
+        assert {f"{backup_store.BACKUP_DIR}/fence/app0", f"{backup_store.BACKUP_DIR}/fence/app1"} <= set(host.files)
+    assert not coordinated.keys(f"{coordination.DEPLOY_REDIS_PREFIX}:*:lock:*")
+
+
+def test_deploy_with_a_stale_token_is_refused(coordinated, deploy_env, hosts, connect):
+    from librechat_deploy import cli
+
+    # 另一次运行已用更大的令牌接手了 h0 上的 app0 / Another run already took over app0 on h0 with a higher token
+    hosts["h0"].files[f"{backup_store.BACKUP_DIR}/fence/app0"] = b"999\n"
+
+    results = {result.host: result for result in cli.run(["deploy", "--image", NEW_IMAGE], connect=connect)}
+
+    assert results["h0"].containers["app0"] == "failed"
+    assert hosts["h0"].containers["app0"]["Config"]["Image"] == "happyclo/librechat:old"
+    assert results["h1"].ok
+
+
+def test_container_recreated_by_another_run_is_skipped(coordinated, deploy_env, monkeypatch, hosts, connect):
+    from librechat_deploy import cli, manager
+
+    prepare_host = manager.prepare_host
+    recreated_by_other_run = []
+
+    def raced(*args, **kwargs):
+        # 计划完成后、取得租约前，另一次运行重新创建了 h0 上的 app0
+        # Another run recreates app0 on h0 after the plan was made and before the lease is taken
+        plan = prepare_host(*args, **kwargs)
+        if plan.host == "h0":
+            assert manager._recreate_container(plan.ssh, "app0", NEW_IMAGE, False, None)
+            recreated_by_other_run.append(hosts["h0"].containers["app0"]["Id"])
+        return plan
+
+    monkeypatch.setattr(manager, "prepare_host", raced)
+    results = {result.host: result for result in cli.run(["deploy", "--image", NEW_IMAGE], connect=connect)}
+
+    assert results["h0"].ok and results["h0"].containers == {"app0": manager.SKIPPED, "app1": "recreated"}
+    assert results["h1"].containers == {"app0": "recreated", "app1": "recreated"}
+    assert [hosts["h0"].containers["app0"]["Id"]] == recreated_by_other_run
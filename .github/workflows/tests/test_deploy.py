@@ -0,0 +1,138 @@
+from librechat_deploy import backup_store, canary, cli, manager
+
+from conftest import FAST, FakeDockerHost
+
+NEW_IMAGE = "happyclo/librechat:new"
+
+
+def images(host):
+    return {name: info["Config"]["Image"] for name, info in host.containers.items()}
+
+
+def publish(host, port="3080"):
+    for info in host.containers.values():
+        info["HostConfig"]["PortBindings"] = {"3080/tcp": [{"HostIp": "127.0.0.1", "HostPort": port}]}
+        info["NetworkSettings"]["Ports"] = info["HostConfig"]["PortBindings"]
+
+
+def test_deploy_recreates_every_container(deploy_env, hosts, connect):
+    results = cli.run(["deploy", "--image", NEW_IMAGE], connect=connect)
+
+    assert [result.ok for result in results] == [True, True]
+    for host in hosts.values():
+        assert images(host) == {"app0": NEW_IMAGE, "app1": NEW_IMAGE}
+
+
+def test_second_deploy_skips_up_to_date_containers(deploy_env, hosts, connect):
+    cli.run(["deploy", "--image", NEW_IMAGE], connect=connect)
+    results = cli.run(["deploy", "--image", NEW_IMAGE], connect=connect)
+
+    assert all(result.ok for result in results)
+    assert {status for result in results for status in result.containers.values()} == {"skipped"}
+
+
+def test_failed_probe_keeps_the_old_container(deploy_env, monkeypatch, hosts, connect):
+    monkeypatch.setattr(manager, "BLUE_GREEN_CONTAINERS", ["*"])
+    for host in hosts.values():
+        publish(host)
+        host.healthy = False
+
+    results = cli.run(["deploy", "--image", NEW_IMAGE], connect=connect)
+
+    assert not any(result.ok for result in results)
+    for host in hosts.values():
+        assert images(host) == {"app0": "happyclo/librechat:old", "app1": "happyclo/librechat:old"}
+
+
+def test_interrupted_swap_is_completed(deploy_env, monkeypatch, hosts, connect):
+    monkeypatch.setattr(manager, "BLUE_GREEN_CONTAINERS", ["*"])
+    monkeypatch.setenv("SERVER_ADDRESS", "h0")
+    host = hosts["h0"]
+    publish(host)
+    rename = host._docker_rename
+    calls = []
+
+    def dropped(args):
+        # 第一次改名后连接中断 / The connection drops after the first rename
+        calls.append(args)
+        if len(calls) == 2:
+            raise ConnectionResetError("connection dropped")
+        return rename(args)
+
+    host._docker_rename = dropped
+    results = cli.run(["deploy", "--image", NEW_IMAGE], connect=connect)
+    assert not results[0].ok
+    assert "app0" not in host.containers
+
+    host._docker_rename = rename
+    results = cli.run(["deploy", "--image", NEW_IMAGE], connect=connect)
+
+    assert results[0].ok
+    assert images(host) == {"app0": NEW_IMAGE, "app1": NEW_IMAGE}
+    assert host.containers["app0"]["Config"]["Labels"][manager.SLOT_LABEL] == "green"
+
+
+def test_failed_switch_restores_the_old_container(deploy_env, monkeypatch, hosts, connect):
+    monkeypatch.setattr(manager, "BLUE_GREEN_CONTAINERS", ["app0"])
+    monkeypatch.setenv("SERVER_ADDRESS", "h0")
+    host = hosts["h0"]
+    publish(host)
+    host.containers["app0"]["NetworkSettings"]["Networks"] = {"librechat": {"Aliases": ["api"]}}
+    rename = host._docker_rename
+
+    def refused(args):
+        # 新容器改名时失败，此时旧容器已断网并改名 / Renaming the new container fails after the old one was detached and renamed
+        if args[0].endswith("_green"):
+            return 1, "", "Error: boom\n"
+        return rename(args)
+
+    host._docker_rename = refused
+    results = cli.run(["deploy", "--image", NEW_IMAGE], connect=connect)
+
+    assert not results[0].ok
+    assert set(host.containers) == {"app0", "app1"}
+    assert host.containers["app0"]["Config"]["Image"] == "happyclo/librechat:old"
+    assert host.containers["app0"]["NetworkSettings"]["Networks"] == {"librechat": {"Aliases": ["api"]}}
+
+
+def test_run_command_survives_the_shell(deploy_env, hosts, connect):
+    secret = "SECRET=a\"b$HOME`id`'c"
+    for host in hosts.values():
+        host.containers["app0"]["Config"]["Env"].append(secret)
+    info = hosts["h0"].containers["app0"]
+
+    # 真实的 shell 收到的参数与原值一致 / A real shell receives the values unchanged
+    command = manager.build_run_command(info, "app0", NEW_IMAGE, labels={"note": "x y"})
+    arguments = command.partition("docker run ")[2]
+    status, out, _ = canary.local_run(f"printf '%s\\n' {arguments}")
+    assert status == 0
+    assert secret in out.splitlines() and "note=x y" in out.splitlines()
+
+    results = cli.run(["deploy", "--image", NEW_IMAGE], connect=connect)
+    assert all(result.ok for result in results)
+    for host in hosts.values():
+        assert secret in host.containers["app0"]["Config"]["Env"]
+
+
+def test_cleanup_without_images(deploy_env):
+    host = FakeDockerHost("h0", latency=FAST)
+    host.images.clear()
+
+    report = manager.cleanup_unused_images(host, NEW_IMAGE)
+
+    assert report is not None
+    assert report["removed"] == [] and report["kept"] == {}
+
+
+def test_fanned_out_image_keeps_its_digest(deploy_env, monkeypatch, hosts, connect):
+    digest = "sha256:" + "ab" * 32
+    monkeypatch.setattr(manager, "resolve_image_digest", lambda image_url: digest)
+
+    assert all(result.ok for result in cli.run(["deploy", "--image", NEW_IMAGE, "--fanout"], connect=connect))
+    assert hosts["h1"].pulls == 0
+    # 下一次部署认出载入镜像的摘要，不再拉取 / The next deploy recognizes the digest of the loaded image and does not pull
+    assert all(result.ok for result in cli.run(["deploy", "--image", NEW_IMAGE], connect=connect))
+
+    assert hosts["h1"].pulls == 0
+    index = hosts["h1"].files[f"{backup_store.BACKUP_DIR}/app0.index"].decode().splitlines()
+    assert index[-1].split("\t")[3] == f"happyclo/librechat@{digest}"
@@ -0,0 +1,88 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from librechat_deploy.release_manifest import fetch_manifest
+
+MANIFEST = {"image_name": "happyclo/librechat:v1"}
+ETAG = '"v1"'
+
+
+class _ManifestServer(ThreadingHTTPServer):
+    """
+    发布清单 API 的本地替身，记录收到的请求头。
+    Local stand-in for the release manifest API that records the request headers.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _ManifestHandler)
+        self.requests = []
+        self.status = 200
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/lc"
+
+
+class _ManifestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.server.status != 200:
+            self.send_response(self.server.status)
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(MANIFEST).encode()
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = _ManifestServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fresh_cache_skips_the_request(server, tmp_path):
+    assert fetch_manifest(server.url, cache_dir=str(tmp_path), ttl=60) == MANIFEST
+    assert fetch_manifest(server.url, cache_dir=str(tmp_path), ttl=60) == MANIFEST
+    assert len(server.requests) == 1
+
+
+def test_stale_cache_is_revalidated_with_the_etag(server, tmp_path):
+    fetch_manifest(server.url, user_agent="deploy-test", cache_dir=str(tmp_path), ttl=0)
+    assert fetch_manifest(server.url, cache_dir=str(tmp_path), ttl=0) == MANIFEST
+    assert server.requests[0]["User-Agent"] == "deploy-test"
+    assert server.requests[1]["If-None-Match"] == ETAG
+
+
+def test_stale_cache_is_used_when_the_api_fails(server, tmp_path):
+    fetch_manifest(server.url, cache_dir=str(tmp_path), ttl=0)
+    server.status = 503
+    assert fetch_manifest(server.url, cache_dir=str(tmp_path), ttl=0) == MANIFEST
+
+
+def test_stale_cache_is_used_when_the_api_is_unreachable(server, tmp_path):
+    fetch_manifest(server.url, cache_dir=str(tmp_path), ttl=0)
+    server.shutdown()
+    server.server_close()
+    assert fetch_manifest(server.url, cache_dir=str(tmp_path), ttl=0, timeout=1) == MANIFEST
+
+
+def test_failure_without_cache_returns_none(server, tmp_path):
+    server.status = 500
+    assert fetch_manifest(server.url, cache_dir=str(tmp_path)) is None
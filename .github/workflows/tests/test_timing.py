@@ -0,0 +1,33 @@
+from librechat_deploy import planner
+from librechat_deploy.timing import SpanRecorder
+
+
+def record_run(directory, seconds):
+    recorder = SpanRecorder()
+    with recorder.span("pull", host="h0") as span:
+        pass
+    span.duration = seconds
+    return recorder.export(str(directory))[0]
+
+
+def test_export_keeps_earlier_runs(tmp_path):
+    record_run(tmp_path, 1.0)
+    path = record_run(tmp_path, 3.0)
+
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+    assert planner.load_durations(path)[("pull", "h0")] == 2.0
+
+
+def test_recreate_timings_are_kept_per_container(tmp_path):
+    recorder = SpanRecorder()
+    for container, seconds in (("api", 4.0), ("mongodb", 1.0)):
+        with recorder.span("recreate", host="h0", container=container) as span:
+            pass
+        span.duration = seconds
+    durations = planner.load_durations(recorder.export(str(tmp_path))[0])
+
+    assert planner.expected(durations, "recreate", "h0", "api") == 4.0
+    assert planner.expected(durations, "recreate", "h0", "mongodb") == 1.0
+    # 没有历史的容器取主机的平均值 / A container without history takes the host's mean
+    assert planner.expected(durations, "recreate", "h0", "rag_api") == 2.5
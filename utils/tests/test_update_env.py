@@ -0,0 +1,59 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from update_env import CompiledTemplate, MissingVariablesError
+
+
+def render(lines, **environ):
+    return CompiledTemplate(lines).render(dict(environ))
+
+
+def test_references_are_expanded():
+    lines, resolved = render(['HOST=${NAME}.example.com\n'], NAME='chat')
+    assert lines == ['HOST=chat.example.com\n']
+    assert resolved == ['HOST']
+
+
+def test_default_and_earlier_assignment():
+    lines, _ = render(['BASE=/srv\n', 'DATA=${BASE}/data\n', 'PORT=${PORT:-3080}\n'])
+    assert lines == ['BASE=/srv\n', 'DATA=/srv/data\n', 'PORT=3080\n']
+
+
+def test_missing_reference_is_reported():
+    with pytest.raises(MissingVariablesError) as raised:
+        render(['TOKEN=${TOKEN}\n'])
+    assert raised.value.missing == ['TOKEN']
+
+
+def test_single_quoted_value_is_literal():
+    lines, resolved = render(["LITERAL='${NOPE}'\n", 'COPY=${LITERAL}\n'])
+    assert lines == ["LITERAL='${NOPE}'\n", 'COPY=${NOPE}\n']
+    assert resolved == ['COPY']
+
+
+def test_double_quoted_value_is_expanded():
+    lines, _ = render(['GREETING="hello ${NAME}"\n'], NAME='world')
+    assert lines == ['GREETING="hello world"\n']
+
+
+def test_batch_to_stdout_keeps_status_on_stderr(tmp_path):
+    template = tmp_path / '.env.example'
+    template.write_text('HOST=${NAME}.example.com\n')
+    batch = tmp_path / 'batch.json'
+    batch.write_text(json.dumps([
+        {'template': str(template), 'output': '-'},
+        {'template': str(template), 'output': str(tmp_path / '.env')},
+    ]))
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'update_env.py')
+
+    result = subprocess.run(
+        [sys.executable, script, '--batch', str(batch)],
+        capture_output=True, text=True, env=dict(os.environ, NAME='chat'), check=True,
+    )
+
+    assert result.stdout == 'HOST=chat.example.com\n'
+    assert 'Rendered 2 targets, 2 written.' in result.stderr
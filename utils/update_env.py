@@ -1,12 +1,29 @@
 import os
 import re
-import argparse
 import sys
+import copy
+import json
+import hashlib
+import tempfile
+import argparse
+import threading
+
+try:
+    # Optional: wakes watch mode as soon as an input changes instead of at the next poll
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
 
 """
 This script updates environment variables in a .env file with values from the local environment.
 Specifically, it looks for variables set to "GET_FROM_LOCAL_ENV" in the input .env file and replaces them
-with the corresponding values from the local environment variables.
+with the corresponding values from the local environment variables. Values may also reference other
+variables as ${VAR} or ${VAR:-default}.
+
+References are resolved from layered sources, first match wins:
+the local environment, then each --env-file in order, then --secrets-dir (one file per variable,
+named after it, as Docker mounts secrets), then variables defined earlier in the same template.
 
 Usage:
 1. Prepare an input .env file with some variables set to "GET_FROM_LOCAL_ENV".
@@ -17,6 +34,7 @@ Usage:
    DB_PASSWORD=GET_FROM_LOCAL_ENV
    HOST=localhost
    PORT=3080
+   DOMAIN_CLIENT=http://${HOST}:${PORT}
 
 2. Set the corresponding environment variables in your local environment.
    Example in bash:
@@ -26,69 +44,444 @@ Usage:
 3. Run the script, specifying the input and output file paths.
    Example:
    python update_env.py input.env output.env
+   python update_env.py input.env output.env --env-file shared.env --secrets-dir /run/secrets
+   An output path of "-" writes the result to stdout, e.g. to pipe it into the deploy push-env command.
+
+4. To render many targets in one run, list them in a JSON file and pass it with --batch.
+   Each template and env file is read and compiled once, however many targets use it.
+   A target's "env" and "env_files" are consulted before the shared sources.
+   Example targets.json:
+   [
+     {"template": ".env.example", "output": "out/node1/api.env", "env": {"HOST": "node1"}},
+     {"template": ".env.example", "output": "out/node2/api.env", "env": {"HOST": "node2"},
+      "env_files": ["node2.env"]}
+   ]
+   python update_env.py --batch targets.json --secrets-dir /run/secrets
+
+5. Outputs are only rewritten when the rendered content changes, atomically (temp file + rename),
+   so watchers and restarts do not fire on no-op runs and a crash never leaves a truncated file.
+   --summary writes the added, removed and changed keys per output as JSON, for deciding whether
+   a restart is needed. --watch keeps running and re-renders the targets whose template, env files
+   or referenced secrets change (using watchdog when installed, polling otherwise).
+   python update_env.py --batch targets.json --watch --summary changes.json
 """
 
+# KEY=value assignments, optionally prefixed with "export"; keys may contain digits
+assignment_pattern = re.compile(r'^(\s*(?:export\s+)?)([A-Za-z_][A-Za-z0-9_]*)(\s*=\s*)(.*?)(\s*)$')
+# ${VAR} and ${VAR:-default} references inside a value
+reference_pattern = re.compile(r'\$\{([A-Za-z_][A-Za-z0-9_]*)(?::-([^}]*))?\}')
+LOCAL_ENV_MARKER = 'GET_FROM_LOCAL_ENV'
+
+
+class MissingVariablesError(Exception):
+    """Raised when a template references variables that no source provides."""
+
+    def __init__(self, missing):
+        self.missing = missing
+        super().__init__(f"Missing variables: {', '.join(missing)}")
+
+
 def read_env_file(file_path):
     """Reads the .env file and returns the lines as a list."""
     with open(file_path, 'r') as file:
         lines = file.readlines()
     return lines
 
-def write_env_file(file_path, lines):
-    """Writes the updated lines to the specified .env file."""
-    with open(file_path, 'w') as file:
-        file.writelines(lines)
+def content_hash(data):
+    """Returns the SHA-256 hex digest of the content."""
+    return hashlib.sha256(data.encode() if isinstance(data, str) else data).hexdigest()
 
-def update_env_file_with_local_env(input_file_path, output_file_path):
+def write_env_file(file_path, lines):
     """
-    Reads the input .env file, updates the variables set to GET_FROM_LOCAL_ENV
-    with values from the local environment, and writes the result to the output .env file.
+    Writes the updated lines to the specified .env file, atomically, and only if its content differs.
+    Returns True if the file was written.
     """
-    lines = read_env_file(input_file_path)
-    updated_lines = []
-    # Regex pattern to match lines ending with "GET_FROM_LOCAL_ENV"
-    env_var_pattern = re.compile(r'^\s*([A-Z_]+)=GET_FROM_LOCAL_ENV\s*$')
-    missing_vars = []
-    updated_vars = []
+    data = ''.join(lines)
+    try:
+        with open(file_path, 'r') as file:
+            if content_hash(file.read()) == content_hash(data):
+                return False
+        mode = os.stat(file_path).st_mode & 0o7777
+    except FileNotFoundError:
+        # New files get the permissions open() would have given them
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    directory = os.path.dirname(os.path.abspath(file_path))
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(file_path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return True
 
+def changed_keys(old_lines, new_lines):
+    """Compares two versions of an env file and returns the added, removed and changed keys."""
+    old, new = parse_env_values(old_lines), parse_env_values(new_lines)
+    return {
+        'added': [key for key in new if key not in old],
+        'removed': [key for key in old if key not in new],
+        'changed': [key for key in new if key in old and new[key] != old[key]],
+    }
+
+def unquote(value):
+    """Drops matching surrounding quotes from a value."""
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+        return value[1:-1]
+    return value
+
+def parse_env_values(lines):
+    """Parses KEY=value lines into a dict, skipping comments. Later keys win."""
+    values = {}
     for line in lines:
-        match = env_var_pattern.match(line)
+        if line.lstrip().startswith('#'):
+            continue
+        match = assignment_pattern.match(line.rstrip('\n'))
         if match:
-            key = match.group(1)
-            # Check if the environment variable is set in the local environment
-            if key in os.environ:
-                new_value = os.environ[key]
-                updated_line = f'{key}={new_value}\n'
-                updated_lines.append(updated_line)
-                updated_vars.append(key)
-            else:
-                missing_vars.append(key)
+            values[match.group(2)] = unquote(match.group(4))
+    return values
+
+
+class CompiledTemplate:
+    """
+    A .env template parsed once, so it can be rendered for any number of targets without re-reading
+    or re-matching its lines. Comments, blank lines and plain assignments are copied verbatim, which
+    keeps the output order and comments identical to the template.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        # One entry per line: None for lines copied as they are, (key, value) for plain assignments,
+        # else (key, prefix, separator, parts, suffix) where parts mix literal text and (name, default) references
+        self.compiled = [self._compile_line(line) for line in lines]
+
+    @classmethod
+    def from_file(cls, file_path):
+        return cls(read_env_file(file_path))
+
+    @staticmethod
+    def _compile_line(line):
+        if line.lstrip().startswith('#'):
+            return None
+        match = assignment_pattern.match(line.rstrip('\n'))
+        if not match:
+            return None
+        prefix, key, separator, value, suffix = match.groups()
+        if value == LOCAL_ENV_MARKER:
+            # The whole value comes from the variable of the same name, as the original script did
+            return key, prefix.lstrip(), '=', [(key, None)], ''
+        if '${' not in value or (value.startswith("'") and unquote(value) != value):
+            # Single-quoted values are literals, as dotenv and compose treat them
+            return key, unquote(value)
+        parts, position = [], 0
+        for reference in reference_pattern.finditer(value):
+            parts.append(value[position:reference.start()])
+            parts.append((reference.group(1), reference.group(2)))
+            position = reference.end()
+        parts.append(value[position:])
+        return key, prefix, separator, parts, suffix
+
+    def references(self):
+        """Returns the names of every variable the template references."""
+        return {
+            part[0]
+            for compiled in self.compiled
+            if compiled is not None and len(compiled) == 5
+            for part in compiled[3]
+            if not isinstance(part, str)
+        }
+
+    def render(self, sources):
+        """
+        Renders the template against the sources. References a source does not provide fall back to
+        variables assigned earlier in the template, then to their ${VAR:-default}.
+        Returns (lines, resolved_keys) and raises MissingVariablesError listing every unresolved reference.
+        """
+        rendered, resolved, missing, earlier = [], [], [], {}
+        for line, compiled in zip(self.lines, self.compiled):
+            if compiled is None or len(compiled) == 2:
+                if compiled:
+                    earlier[compiled[0]] = compiled[1]
+                rendered.append(line)
+                continue
+            key, prefix, separator, parts, suffix = compiled
+            value = []
+            for part in parts:
+                if isinstance(part, str):
+                    value.append(part)
+                    continue
+                name, default = part
+                found = sources.get(name)
+                if found is None and name != key:
+                    found = earlier.get(name)
+                if found is None:
+                    found = default
+                if found is None:
+                    missing.append(name)
+                    found = ''
+                value.append(found)
+            earlier[key] = value = ''.join(value)
+            rendered.append(f'{prefix}{key}{separator}{value}{suffix}\n')
+            resolved.append(key)
+        if missing:
+            raise MissingVariablesError(list(dict.fromkeys(missing)))
+        return rendered, resolved
+
+
+class EnvSources:
+    """
+    Layered lookup of variable values: the local environment, then env files in order, then a
+    secrets directory holding one file per variable. The first layer that has a variable wins.
+    Env files and secrets are read once and shared by every target rendered from these sources.
+    """
+
+    def __init__(self, environ=None, env_files=(), secrets_dir=None):
+        self._files = {}
+        self._secrets = {}
+        self.secrets_dir = secrets_dir
+        self.layers = [os.environ if environ is None else environ]
+        self.layers += [self.env_file(file_path) for file_path in env_files]
+
+    def env_file(self, file_path):
+        """Returns the values of an env file, parsing it on first use."""
+        if file_path not in self._files:
+            self._files[file_path] = parse_env_values(read_env_file(file_path))
+        return self._files[file_path]
+
+    def layered(self, overrides=None, env_files=()):
+        """Returns sources for one target: its overrides, then its env files, come before these layers."""
+        sources = copy.copy(self)
+        sources.layers = [overrides or {}] + [self.env_file(file_path) for file_path in env_files] + self.layers
+        return sources
+
+    def _secret(self, name):
+        if name not in self._secrets:
+            try:
+                with open(os.path.join(self.secrets_dir, name), 'r') as file:
+                    self._secrets[name] = file.read().rstrip('\n')
+            except (FileNotFoundError, IsADirectoryError):
+                self._secrets[name] = None
+        return self._secrets[name]
+
+    def get(self, name):
+        for layer in self.layers:
+            if name in layer:
+                return layer[name]
+        if self.secrets_dir:
+            return self._secret(name)
+        return None
+
+
+def render_targets(targets, sources, templates=None):
+    """
+    Renders many targets in one call. Each target is a dict with "template" and "output" paths and
+    optional "env" overrides and "env_files". Each template is compiled once however many targets use it;
+    pass the same templates dict to reuse them across calls.
+    Returns one dict per target with its output, resolved keys, whether it was written, and the
+    added / removed / changed keys; raises MissingVariablesError naming the target.
+    """
+    templates = {} if templates is None else templates
+    results = []
+    for target in targets:
+        template_path = target['template']
+        if template_path not in templates:
+            templates[template_path] = CompiledTemplate.from_file(template_path)
+        target_sources = sources.layered(target.get('env'), target.get('env_files') or ())
+        try:
+            lines, resolved = templates[template_path].render(target_sources)
+        except MissingVariablesError as e:
+            raise MissingVariablesError([f"{target['output']}: {name}" for name in e.missing]) from None
+        if target['output'] == '-':
+            # Rendered in memory and written to stdout, e.g. to pipe into the deploy push-env command
+            sys.stdout.writelines(lines)
+            results.append({'output': '-', 'resolved': resolved, 'written': True, **changed_keys([], lines)})
+            continue
+        output_dir = os.path.dirname(target['output'])
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        try:
+            previous = read_env_file(target['output'])
+        except FileNotFoundError:
+            previous = []
+        changes = changed_keys(previous, lines)
+        written = write_env_file(target['output'], lines)
+        results.append({'output': target['output'], 'resolved': resolved, 'written': written, **changes})
+    return results
+
+def status_stream(targets):
+    """Returns where status messages go: stderr when any target renders to stdout ("-"), else stdout."""
+    return sys.stderr if any(target['output'] == '-' for target in targets) else sys.stdout
+
+def print_changes(results, summary_path=None, file=None):
+    """Prints which outputs changed to file (stdout by default) and optionally writes the changed-keys summary as JSON."""
+    file = file or sys.stdout
+    for result in results:
+        keys = result['added'] + result['removed'] + result['changed']
+        if not result['written']:
+            print(f"{result['output']}: unchanged", file=file)
+        elif keys:
+            print(f"{result['output']}: {len(keys)} keys changed ({', '.join(keys)})", file=file)
         else:
-            updated_lines.append(line)
+            print(f"{result['output']}: rewritten, no key changed", file=file)
+    if summary_path:
+        summary = {
+            result['output']: {name: result[name] for name in ('written', 'added', 'removed', 'changed')}
+            for result in results
+        }
+        write_env_file(summary_path, [json.dumps(summary, indent=2) + '\n'])
 
-    # Print warnings and exit if any required environment variables are missing
-    if missing_vars:
-        for var in missing_vars:
-            print(f"Warning: {var} set to GET_FROM_LOCAL_ENV, could not find {var}, please set {var} in your local environment and run again.")
-        sys.exit(1)
+def input_state(paths, secrets_dir=None):
+    """Returns (mtime, size) of every input file, and of every file in the secrets directory."""
+    paths = set(paths)
+    if secrets_dir and os.path.isdir(secrets_dir):
+        paths.update(os.path.join(secrets_dir, name) for name in os.listdir(secrets_dir))
+    state = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            state[path] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            state[path] = None
+    return state
+
+def target_inputs(target, templates, env_files=(), secrets_dir=None):
+    """Returns the files a target's output depends on."""
+    inputs = {target['template'], *env_files, *(target.get('env_files') or ())}
+    if secrets_dir and target['template'] in templates:
+        inputs.update(os.path.join(secrets_dir, name) for name in templates[target['template']].references())
+    return inputs
+
+def watch_targets(targets, env_files=(), secrets_dir=None, interval=1.0, summary_path=None):
+    """
+    Renders the targets, then keeps re-rendering the ones whose inputs change until interrupted.
+    With watchdog installed, changes are picked up as they happen; otherwise inputs are polled every interval.
+    """
+    templates = {}
+    messages = status_stream(targets)
+    wake = threading.Event()
+    watched = {target['template'] for target in targets} | set(env_files)
+    watched |= {path for target in targets for path in target.get('env_files') or ()}
+    state = input_state(watched, secrets_dir)
+    pending = list(targets)
 
-    # Write the updated lines to the output .env file
-    write_env_file(output_file_path, updated_lines)
+    observer = None
+    if Observer is not None:
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                wake.set()
+        observer = Observer()
+        directories = {os.path.dirname(os.path.abspath(path)) for path in watched}
+        if secrets_dir:
+            directories.add(os.path.abspath(secrets_dir))
+        for directory in directories:
+            observer.schedule(Handler(), directory)
+        observer.start()
+    try:
+        while True:
+            if pending:
+                sources = EnvSources(env_files=env_files, secrets_dir=secrets_dir)
+                results = []
+                for target in pending:
+                    # One failing target must not hold back the others
+                    try:
+                        results += render_targets([target], sources, templates)
+                    except (MissingVariablesError, OSError) as e:
+                        print(f"Warning: {target['output']}: {e}", file=messages)
+                print_changes(results, summary_path, messages)
+            # With watchdog the wait only bounds how long a missed event can go unnoticed
+            wake.wait(interval if observer is None else max(interval, 30.0))
+            wake.clear()
+            current = input_state(watched, secrets_dir)
+            changed = {path for path in state.keys() | current.keys() if state.get(path) != current.get(path)}
+            state = current
+            for path in changed:
+                templates.pop(path, None)
+            pending = [
+                target for target in targets
+                if target_inputs(target, templates, env_files, secrets_dir) & changed
+                or target['template'] not in templates
+            ]
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+def update_env_file_with_local_env(input_file_path, output_file_path, sources=None):
+    """
+    Reads the input .env file, updates the variables set to GET_FROM_LOCAL_ENV or referencing ${VAR}
+    with values from the sources (the local environment by default), and writes the result to the output .env file.
+    Returns the render_targets() result for the output.
+    """
+    # With "-" the rendered file goes to stdout, so messages go to stderr
+    messages = sys.stderr if output_file_path == '-' else sys.stdout
+    try:
+        result, = render_targets(
+            [{'template': input_file_path, 'output': output_file_path}], sources or EnvSources()
+        )
+    except MissingVariablesError as e:
+        # Print warnings and exit if any required environment variables are missing
+        for var in e.missing:
+            var = var.rpartition(': ')[2]
+            print(f"Warning: {var} is referenced but could not be found, please set {var} in your local environment and run again.", file=messages)
+        sys.exit(1)
 
     # Print the list of updated variables
-    if updated_vars:
-        print("Updated the following variables:")
-        for var in updated_vars:
-            print(var)
-    
-    print(f"Processed {input_file_path} and wrote updates to {output_file_path}.")
+    if result['resolved']:
+        print("Updated the following variables:", file=messages)
+        for var in result['resolved']:
+            print(var, file=messages)
+
+    if result['written']:
+        print(f"Processed {input_file_path} and wrote updates to {output_file_path}.", file=messages)
+    else:
+        print(f"Processed {input_file_path}, {output_file_path} is already up to date.", file=messages)
+    return result
 
 if __name__ == "__main__":
     # Parse command-line arguments for input and output file paths
     parser = argparse.ArgumentParser(description='Update .env file with local environment variables.')
-    parser.add_argument('input_file_path', type=str, help='Path to the input .env file')
-    parser.add_argument('output_file_path', type=str, help='Path to the output .env file')
+    parser.add_argument('input_file_path', type=str, nargs='?', help='Path to the input .env file')
+    parser.add_argument('output_file_path', type=str, nargs='?', help='Path to the output .env file')
+    parser.add_argument('--env-file', action='append', default=[], help='Additional env file to resolve variables from (repeatable)')
+    parser.add_argument('--secrets-dir', type=str, help='Directory with one file per secret variable')
+    parser.add_argument('--batch', type=str, help='JSON file listing the targets to render in one run')
+    parser.add_argument('--summary', type=str, help='Write the added, removed and changed keys per output to this JSON file')
+    parser.add_argument('--watch', action='store_true', help='Keep running and re-render targets whose inputs change')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls in watch mode')
     args = parser.parse_args()
 
-    # Update the .env file with local environment variables
-    update_env_file_with_local_env(args.input_file_path, args.output_file_path)
+    if args.batch:
+        with open(args.batch, 'r') as file:
+            targets = json.load(file)
+    elif args.input_file_path and args.output_file_path:
+        targets = [{'template': args.input_file_path, 'output': args.output_file_path}]
+    else:
+        parser.error('input_file_path and output_file_path are required without --batch')
+
+    if args.watch:
+        watch_targets(targets, args.env_file, args.secrets_dir, args.interval, args.summary)
+    elif args.batch:
+        # With "-" among the outputs a rendered file goes to stdout, so messages go to stderr
+        messages = status_stream(targets)
+        try:
+            results = render_targets(targets, EnvSources(env_files=args.env_file, secrets_dir=args.secrets_dir))
+        except MissingVariablesError as e:
+            for var in e.missing:
+                print(f"Warning: could not find {var}.", file=messages)
+            sys.exit(1)
+        print_changes(results, args.summary, messages)
+        print(f"Rendered {len(results)} targets, {sum(result['written'] for result in results)} written.", file=messages)
+    else:
+        # Update the .env file with local environment variables
+        sources = EnvSources(env_files=args.env_file, secrets_dir=args.secrets_dir)
+        result = update_env_file_with_local_env(args.input_file_path, args.output_file_path, sources)
+        if args.summary:
+            print_changes([result], args.summary, status_stream(targets))